@@ -1,42 +1,81 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file
-import subprocess, csv, datetime, os, re, socket
+from flask import (
+    Flask, render_template, request, redirect, url_for, send_file, jsonify,
+    Response, stream_with_context, abort,
+)
+import subprocess, csv, datetime, io, json, os, re, sys, time
 import asyncio
+import contextlib
 import ipaddress
+import sqlite3
 
-from bac0_scan import bacnet_scan, bacnet_quick_scan, export_to_csv
+from bac0_scan import (
+    ACTIVE_EXPORTS, EXPORT_WRITERS, export_base, export_formats, new_export_path, new_export_paths,
+    parquet_available, read_csv_rows,
+)
+from bacnet_service import BacnetServices, BACNET_STARTUP_DELAY, new_stack
+from bacnet_bulk import BULK_MAX_ITEMS, bulk_read, bulk_write, items_from_csv, parse_items
+from bacnet_trend import TrendStore, TrendPoller
+from scan_jobs import JobManager
+from scan_planner import parse_targets, plan_targets, scan_plan_devices
+from scan_metrics import ScanMetrics, registry as metrics_registry
+from scan_diff import diff_snapshots, list_snapshots
+from results_dir import OUTPUT_DIR
+from results_store import ResultsIndex, LIVE_FORMATS, MIMETYPES
+from scan_scheduler import ScanScheduler
+import net_state
+from arp_scan import scan_subnet, ARP_MAX_ROUNDS, ARP_SCAN_BACKEND
+from host_lookup import resolve_hostnames, lookup_vendors, preload_oui_table
+from scan_checkpoint import ScanCheckpoint, list_checkpoints
 
 app = Flask(__name__)
 
-# Use project-relative results dir (or override via TTT_RESULTS_DIR)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-OUTPUT_DIR = os.environ.get("TTT_RESULTS_DIR", os.path.join(BASE_DIR, "results"))
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+@app.template_filter("timestamp")
+def format_timestamp(ts):
+    # Epoch seconds as local "YYYY-MM-DD HH:MM"
+    return datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
 
-# Absolute path (systemd often lacks /usr/sbin in PATH)
-ARP_SCAN_BIN = os.environ.get("ARP_SCAN_BIN", "/usr/sbin/arp-scan")
 BACNET_UDP_PORT = int(os.environ.get("BACNET_UDP_PORT", "47808"))
+BACNET_MAX_CONCURRENT_READS = int(os.environ.get("BACNET_MAX_CONCURRENT_READS", "16"))
+
+# Scans share one long-lived BAC0 stack per (interface, UDP port); set
+# BACNET_SHARED_STACK=0 to start a fresh stack for every scan instead
+BACNET_SHARED_STACK = os.environ.get("BACNET_SHARED_STACK", "1") != "0"
+bacnet_services = BacnetServices()
+
+# Index of result files; downloads and retention go through it
+results_index = ResultsIndex()
+
+# Add a finished result file to the index (a failure only loses its metadata)
+def index_result(path, job=None, **meta):
+    if not path or not os.path.exists(path):
+        return
+    if job is not None:
+        meta.update(job_id=job.id, schedule_id=job.params.get("schedule_id"))
+    try:
+        results_index.add(path, **meta)
+    except (OSError, sqlite3.Error) as e:
+        print("Could not index result", path, e)
 
 # File to store the selected scan range for ARP scan
 SCAN_RANGE_FILE = "/tmp/scan_range.txt"
 
 # Get the current IP address of eth0
 def get_eth0_ip():
-    ip = subprocess.getoutput("ip -4 addr show eth0 | grep -oP '(?<=inet\\s)\\d+(\\.\\d+){3}'")
-    return ip.splitlines()[0] if ip else ""
+    return net_state.iface_ip("eth0")
 
 def get_up_interface(preferred="eth0"):
     """Prefer eth0; fall back to wlan0 if it's the only active link."""
     for iface in (preferred, "wlan0"):
-        state = subprocess.getoutput(f"cat /sys/class/net/{iface}/operstate 2>/dev/null").strip()
-        if state == "up":
+        if net_state.is_up(iface):
             return iface
     return preferred
 
 def get_iface_cidr(iface):
     """Return first IPv4 CIDR on iface, e.g. 192.168.50.1/24, or ''."""
-    return subprocess.getoutput(
-        f"ip -4 -o addr show {iface} | awk '{{print $4}}' | head -n1"
-    ).strip()
+    return net_state.iface_cidr(iface)
+
+def get_default_gateway():
+    return net_state.default_gateway()
 
 def pick_interface_for_subnet(subnet_cidr):
     """
@@ -52,82 +91,69 @@ def pick_interface_for_subnet(subnet_cidr):
         if not cidr:
             continue
         try:
-            if ipaddress.ip_interface(cidr).ip in target_net:
-                state = subprocess.getoutput(f"cat /sys/class/net/{iface}/operstate 2>/dev/null").strip()
-                if state == "up":
-                    return iface
+            if ipaddress.ip_interface(cidr).ip in target_net and net_state.is_up(iface):
+                return iface
         except Exception:
             pass
     return get_up_interface("eth0")
 
-# Run ARP scan on the specified subnet, repeat for reliability
-def run_arp_scan_with_range(subnet, repeats=10):
-    """Run arp-scan on the chosen subnet and return (devices, csv_path, error)."""
-    devices_dict = {}
+# Run ARP scan on the specified subnet, retrying silent hosts for reliability
+def run_arp_scan_with_range(subnet, repeats=ARP_MAX_ROUNDS, job=None):
+    """
+    Run an ARP sweep of the chosen subnet and return (devices, csv_path, error).
+    repeats caps the retry rounds; see arp_scan.scan_subnet. When run as a
+    background ScanJob, reports progress per round and stops early if the
+    job is cancelled.
+    """
     error = None
-    try:
-        from mac_vendor_lookup import MacLookup
-        mac_lookup = MacLookup()
-    except Exception as e:
-        print("MacLookup import failed:", e)
-        mac_lookup = None
 
     # Choose interface that actually belongs to the subnet
     iface = pick_interface_for_subnet(subnet)
 
-    if not os.path.exists(ARP_SCAN_BIN):
-        error = f"arp-scan not found at {ARP_SCAN_BIN}"
-        print(error)
-        return [], None, error
-
     # Ensure iface is up
-    if subprocess.getoutput(f"cat /sys/class/net/{iface}/operstate 2>/dev/null").strip() != "up":
+    if not net_state.is_up(iface):
         error = f"Interface {iface} is down. Bring link up and try again."
         print(error)
         return [], None, error
 
-    # No sudo; rely on setcap on /usr/sbin/arp-scan
-    base_cmd = [ARP_SCAN_BIN, "--interface", iface, subnet]
-    print("ARP-SCAN CMD:", " ".join(base_cmd), "euid=", os.geteuid())
+    if job is not None:
+        job.update(steps_total=repeats, steps_done=0, hosts_found=0)
 
-    for _ in range(repeats):
-        try:
-            result = subprocess.run(base_cmd, capture_output=True, text=True, check=True)
-            for line in result.stdout.splitlines():
-                parts = line.split()
-                if len(parts) >= 2 and ":" in parts[1] and parts[0][0].isdigit():
-                    ip, mac = parts[0], parts[1]
-                    try:
-                        hostname = socket.gethostbyaddr(ip)[0]
-                    except Exception:
-                        hostname = ""
-                    try:
-                        vendor = mac_lookup.lookup(mac) if mac_lookup else ""
-                    except Exception:
-                        vendor = ""
-                    devices_dict.setdefault(mac, [ip, mac, hostname, vendor])
-        except subprocess.CalledProcessError as e:
-            msg = e.stderr or e.stdout or str(e)
-            print("ARP scan failed:", msg)
-            if "must be root" in msg.lower() or "operation not permitted" in msg.lower():
-                error = "arp-scan needs privileges. Run: sudo setcap cap_net_raw,cap_net_admin+eip /usr/sbin/arp-scan"
-            else:
-                error = msg
-            break
-        except Exception as e:
-            error = str(e)
-            print("ARP scan failed:", error)
-            break
+    def on_round(round_number, max_rounds, responders):
+        if job is not None:
+            job.update(steps_done=round_number, hosts_found=len(responders))
+
+    started = time.time()
+    # No sudo; rely on setcap on /usr/sbin/arp-scan
+    print("ARP-SCAN:", subnet, "iface=", iface, "backend=", ARP_SCAN_BACKEND, "euid=", os.geteuid())
+    try:
+        responders = scan_subnet(
+            subnet, iface, max_rounds=repeats, on_round=on_round,
+            cancel_event=job.cancel_event if job is not None else None,
+        )
+    except Exception as e:
+        error = str(e)
+        print("ARP scan failed:", error)
+        # Keep the hosts found before a later round failed
+        responders = getattr(e, "responders", {})
+        if responders:
+            error = f"{error} (showing {len(responders)} hosts found before the error)"
 
-    devices = list(devices_dict.values())
+    # Responders are already unique by MAC; resolve names and vendors once each
+    hostnames = resolve_hostnames(responders.values())
+    vendors = lookup_vendors(responders.keys())
+    devices = [
+        [ip, mac, hostnames.get(ip, ""), vendors.get(mac, "")]
+        for mac, ip in responders.items()
+    ]
     csv_path = None
     if devices:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        csv_path = os.path.join(OUTPUT_DIR, f"arp_scan_{timestamp}.csv")
+        csv_path = new_export_path("csv", prefix="arp_scan")
         with open(csv_path, "w", newline="") as f:
             writer = csv.writer(f)
             writer.writerow(["IP Address", "MAC Address", "Hostname", "Vendor"])
             writer.writerows(devices)
+        index_result(csv_path, job, subnet=subnet, duration=time.time() - started, rows=len(devices))
 
     return devices, csv_path, error
 
@@ -149,7 +175,7 @@ def set_scan_range(subnet):
 @app.route("/")
 def home():
     current_ip = get_eth0_ip()
-    current_gw = subprocess.getoutput("ip route | grep '^default' | awk '{print $3}'")
+    current_gw = get_default_gateway()
     eth0_active = is_eth0_active()
     return render_template("index.html", current_ip=current_ip, current_gw=current_gw, eth0_active=eth0_active)
 
@@ -158,6 +184,16 @@ def scan():
     subnet = get_scan_range()
     devices, csv_path, error = [], None, None
 
+    # Results of a background scan job (see /api/scans)
+    job = job_manager.get(request.args.get("job", ""))
+    if request.method == "GET" and job is not None and job.kind == "arp":
+        if job.result:
+            devices = job.result["devices"]
+            csv_path = job.result["csv"]
+            error = job.result["error"]
+        else:
+            error = job.error
+
     if request.method == "POST":
         if "octet" in request.form:
             base_ip = request.form.getlist("octet")
@@ -165,8 +201,11 @@ def scan():
             subnet = ".".join(base_ip) + f"/{cidr}"
             set_scan_range(subnet)
         else:
-            # Run scan
-            devices, csv_path, error = run_arp_scan_with_range(subnet)
+            # Plain form post (no JavaScript): run it as a job like /api/scans does
+            job, job_error = submit_scan("arp", {"subnet": subnet})
+            if job is not None:
+                return redirect(url_for("scan", job=job.id))
+            error = job_error[0]
 
     base_ip, cidr = subnet.split("/")
     return render_template(
@@ -177,12 +216,64 @@ def scan():
         cidr=cidr,
         error=error,
         eth0_active=is_eth0_active(),
+        running_job=job.id if job is not None and job.kind == "arp" and job.active else None,
     )
 
+# Seconds between checks for new data while following a file being written
+FOLLOW_POLL_INTERVAL = 0.5
+
+def follow_file(path, chunk_size=64 * 1024):
+    """Yield a file's contents, waiting for more until its writer closes it."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                yield chunk
+            elif os.path.abspath(path) in ACTIVE_EXPORTS:
+                time.sleep(FOLLOW_POLL_INTERVAL)
+            else:
+                # Writer finished; pick up anything written since the last read
+                rest = f.read()
+                if rest:
+                    yield rest
+                return
+
+def read_chunks(f, chunk_size=64 * 1024):
+    """Yield a file object's contents in chunks, closing it at the end."""
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
 @app.route("/download/<filename>")
 def download(filename):
-    # Download CSV file by filename
-    return send_file(os.path.join(OUTPUT_DIR, filename), as_attachment=True)
+    # Download a result file through the index (files written before the
+    # index existed are picked up on first request). Files from a scan still
+    # in progress are streamed as they grow (SQLite and Parquet exports only
+    # once finished); compressed ones are unpacked on the fly under their
+    # original name. Gzipped CSV exports download as they are.
+    entry = results_index.get(filename)
+    if entry is None:
+        results_index.sync()
+        entry = results_index.get(filename)
+    path = results_index.file_path(filename)
+    if entry is None or not os.path.exists(path):
+        abort(404)
+    mimetype = MIMETYPES.get(entry["format"], "application/octet-stream")
+    # Written gzipped (csv.gz export): served as stored, so as gzip
+    if entry["stored"] == entry["name"] and entry["stored"].endswith(".gz"):
+        mimetype = "application/gzip"
+    headers = {"Content-Disposition": f"attachment; filename={entry['name']}"}
+    if os.path.abspath(path) in ACTIVE_EXPORTS:
+        if entry["format"] not in LIVE_FORMATS:
+            return f"{entry['name']} is still being written; try again when the scan finishes.", 409
+        return Response(stream_with_context(follow_file(path)), mimetype=mimetype, headers=headers)
+    if entry["stored"] != entry["name"]:
+        _, f = results_index.open(filename)
+        return Response(stream_with_context(read_chunks(f)), mimetype=mimetype, headers=headers)
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=entry["name"])
 
 # --- Network Config Page ---
 @app.route("/network", methods=["GET", "POST"])
@@ -199,6 +290,7 @@ def network():
                 if not line.startswith(("interface eth0", "static ip_address=", "static routers=", "static domain_name_servers=")):
                     f.write(line)
         subprocess.run(["sudo", "systemctl", "restart", "dhcpcd"])
+        net_state.invalidate()
 
     # Set eth0 to static mode with given IP/mask/gateway
     def set_static(ip, mask, gateway):
@@ -213,6 +305,7 @@ def network():
             f.write(f"static routers={gateway}\n")
             f.write(f"static domain_name_servers={gateway}\n")
         subprocess.run(["sudo", "systemctl", "restart", "dhcpcd"])
+        net_state.invalidate()
 
     if request.method == "POST":
         mode = request.form.get("mode")
@@ -236,7 +329,7 @@ def network():
 
     # Get current live IP and Gateway every time the page loads
     current_ip = get_eth0_ip()
-    current_gw = subprocess.getoutput("ip route | grep '^default' | awk '{print $3}'")
+    current_gw = get_default_gateway()
 
     # Split into octets (default to 0 if missing)
     def split_octets(addr):
@@ -255,90 +348,809 @@ def network():
                            gw_octets=gw_octets)
 
 # --- BACnet Scan Page ---
+
+# Source IP/mask for BACnet on eth0 (its real prefix), or "" when eth0 has no IP
+def get_bacnet_ip_with_mask():
+    return get_iface_cidr("eth0")
+
+def parse_bacnet_options(form):
+    """Read BACnet scan options from a form/JSON dict. Returns (options, error)."""
+    error = None
+    # read UDP port from form, fallback to env default
+    try:
+        udp_port = int(form.get("udp_port", BACNET_UDP_PORT))
+        if udp_port < 1024 or udp_port > 65535:
+            udp_port = BACNET_UDP_PORT
+    except Exception:
+        udp_port = BACNET_UDP_PORT
+
+    # read global in-flight read cap from form (1 = fully serial scan)
+    try:
+        max_concurrent = int(form.get("max_concurrent", BACNET_MAX_CONCURRENT_READS))
+        if max_concurrent < 1 or max_concurrent > 128:
+            max_concurrent = BACNET_MAX_CONCURRENT_READS
+    except Exception:
+        max_concurrent = BACNET_MAX_CONCURRENT_READS
+
+    # optional device instance range for a ranged Who-Is
+    discover_opts = {}
+    try:
+        low = str(form.get("low_limit", "")).strip()
+        high = str(form.get("high_limit", "")).strip()
+        if low:
+            discover_opts["low_limit"] = int(low)
+        if high:
+            discover_opts["high_limit"] = int(high)
+    except ValueError:
+        error = "Device instance range must be whole numbers."
+
+    # export formats: checkboxes (a list) or a comma-separated string
+    exports = form.getlist("exports") if hasattr(form, "getlist") else form.get("exports")
+    try:
+        exports = export_formats(exports or None)
+    except ValueError as e:
+        error = error or str(e)
+        exports = export_formats("csv")
+
+    options = {
+        "scan_type": "quick" if form.get("scan_type") == "quick" else "full",
+        "udp_port": udp_port,
+        "max_concurrent": max_concurrent,
+        # "Full rescan" re-reads everything and refreshes the device cache
+        "incremental": str(form.get("full_rescan", "")) not in ("1", "true", "on"),
+        "discover_opts": discover_opts,
+        # Interfaces, local CIDRs and bbmd:<ip> targets; empty means eth0
+        "targets": parse_targets(form.get("targets", "")),
+        "exports": exports,
+    }
+    return options, error
+
+def check_bacnet_targets(options):
+    """
+    (interfaces, error) for a BACnet scan's targets: the interfaces its
+    stacks run on, or an error message if none of the targets can be scanned.
+    """
+    entries, errors = plan_targets(options.get("targets"), options["udp_port"])
+    if entries:
+        return sorted({entry["iface"] for entry in entries}), None
+    if options.get("targets"):
+        return [], "No usable scan targets: " + "; ".join(errors)
+    return [], "No IP on eth0. Connect and try again."
+
+def devices_from_csv(csv_path):
+    """One summary entry per device_instance found in an existing scan CSV."""
+    unique_devices = {}
+    for row in read_csv_rows(csv_path):
+        inst = row.get("device_instance")
+        if inst and int(inst) not in unique_devices:
+            unique_devices[int(inst)] = {
+                "device_instance": int(inst),
+                "address": row.get("device_ip"),
+                "vendorName": row.get("vendorName") or "-",
+                "modelName": row.get("modelName") or "-",
+            }
+    return unique_devices
+
+async def run_bacnet_scan(options, on_progress=None, resume=None, job=None):
+    """
+    Run a quick or full BACnet scan, streaming rows to the CSV and the other
+    export formats chosen in options["exports"] (NDJSON, SQLite, Parquet) as
+    they arrive. Returns the summary shown on the BACnet page; only one row
+    per device is kept in memory.
+
+    Every scan target (see scan_planner) is discovered and read in parallel,
+    on the shared BAC0 stacks unless BACNET_SHARED_STACK=0, and the results
+    are merged into the one set of files.
+
+    Full scans save a ScanCheckpoint after each device. Passing a checkpoint
+    name as resume re-runs that scan with its saved options, skipping the
+    devices already done and appending to the same result files.
+
+    The result files are added to the results index when the scan ends.
+    """
+    networks_found = []
+
+    def track(event, data):
+        if event == "discovered":
+            networks_found.extend(n for n in data["networks"] if n not in networks_found)
+        if on_progress is not None:
+            on_progress(event, data)
+
+    checkpoint = None
+    unique_devices = {}
+    prior_rows = 0
+    if resume:
+        checkpoint = ScanCheckpoint.load(resume)
+        checkpoint.rewind_files()
+        options = checkpoint.options
+        paths = dict(checkpoint.files, **checkpoint.exports)
+        if os.path.exists(checkpoint.csv_path):
+            unique_devices = devices_from_csv(checkpoint.csv_path)
+        prior_rows = checkpoint.row_count
+    else:
+        paths = new_export_paths(options.get("exports") or export_formats())
+        if options["scan_type"] != "quick":
+            files = {fmt: path for fmt, path in paths.items() if EXPORT_WRITERS[fmt].resume_mode == "truncate"}
+            checkpoint = ScanCheckpoint.create(
+                files, options, {fmt: path for fmt, path in paths.items() if fmt not in files}
+            )
+    csv_format = "csv.gz" if "csv.gz" in paths else "csv"
+    csv_path = paths[csv_format]
+
+    entries, plan_errors = plan_targets(options.get("targets"), options["udp_port"])
+    if not entries:
+        raise RuntimeError("No usable scan targets: " + "; ".join(plan_errors))
+    metrics = ScanMetrics()
+    scan_options = dict(
+        options["discover_opts"], max_concurrent=options["max_concurrent"], metrics=metrics
+    )
+    if options["scan_type"] != "quick":
+        scan_options.update(incremental=options["incremental"], skip_devices=checkpoint.done_devices)
+    devices = scan_plan_devices(
+        entries, quick=options["scan_type"] == "quick",
+        services=bacnet_services if BACNET_SHARED_STACK else None,
+        on_progress=track, **scan_options
+    )
+
+    with contextlib.ExitStack() as stack:
+        writers = {
+            fmt: stack.enter_context(EXPORT_WRITERS[fmt](path, append=bool(resume)))
+            for fmt, path in paths.items()
+        }
+        csv_out = writers[csv_format]
+        # Headers are on disk; a scan cut off before its first device rewinds to here
+        if checkpoint is not None and not resume:
+            checkpoint.record_sizes()
+        # Exports that can't be appended to start over from the rows saved so far
+        if prior_rows:
+            for writer in writers.values():
+                if writer.resume_mode == "rewrite":
+                    writer.write_rows(read_csv_rows(csv_path))
+        # Let callers offer the files for download while they're being written
+        track("files", dict(
+            {fmt: os.path.basename(path) for fmt, path in paths.items()}, csv=os.path.basename(csv_path)
+        ))
+        async for _, inst, rows in devices:
+            for writer in writers.values():
+                writer.write_rows(rows)
+            track("rows", {"device_instance": inst, "rows": rows})
+            if checkpoint is not None:
+                checkpoint.mark_done(inst, len(rows))
+            # Only keep one entry per unique device_instance
+            if rows and inst not in unique_devices:
+                row = rows[0]
+                unique_devices[inst] = {
+                    "device_instance": inst,
+                    "address": row.get("device_ip"),
+                    "vendorName": row.get("vendorName", "-"),
+                    "modelName": row.get("modelName", "-"),
+                }
+        row_count = prior_rows + csv_out.rows
+
+    # Scan finished; nothing left to resume
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    # Request/latency summary, saved next to the CSV
+    metrics_summary = metrics.finish()
+    metrics_path = metrics.write_json(export_base(csv_path) + ".metrics.json")
+
+    # Nothing found: don't leave empty result files behind
+    if not row_count:
+        for path in paths.values():
+            os.remove(path)
+        paths, csv_path = {}, None
+
+    subnet = ", ".join(entry["ip_with_mask"] if entry["bbmd"] is None else entry["name"] for entry in entries)
+    for path in list(paths.values()) + [metrics_path]:
+        index_result(path, job, subnet=subnet, duration=metrics_summary["elapsed"], rows=row_count)
+
+    return {
+        "devices": list(unique_devices.values()),
+        "csv": csv_path,
+        "ndjson": paths.get("ndjson"),
+        "exports": paths,
+        "networks_found": networks_found,
+        "device_count": len(unique_devices),
+        "row_count": row_count,
+        "networks_scanned": [
+            {k: entry[k] for k in ("name", "targets", "ip_with_mask", "udp_port", "devices", "rows", "error")}
+            for entry in entries
+        ],
+        "plan_errors": plan_errors,
+        # Per-device figures stay in the JSON file
+        "metrics": {k: v for k, v in metrics_summary.items() if k != "devices"},
+        "metrics_json": metrics_path,
+    }
+
 @app.route("/bacnet_scan", methods=["GET", "POST"])
 def bacnet_scan_route():
     error = None
     results = {}
-    udp_port = BACNET_UDP_PORT
+    options, _ = parse_bacnet_options({})
 
-    # determine source IP/mask as you already do (example using eth0 IP)
-    eth0_ip = get_eth0_ip()
-    if (eth0_ip):
-        ip_with_mask = f"{eth0_ip}/24"
-    else:
-        ip_with_mask = ""
+    # Results of a background scan job (see /api/scans)
+    job = job_manager.get(request.args.get("job", ""))
+    if request.method == "GET" and job is not None and job.kind.startswith("bacnet"):
+        options.update(job.params)
+        if job.status == "done":
+            results = job.result or {}
+        elif job.error:
+            error = f"BACnet scan failed: {job.error}"
 
+    # Plain form post (no JavaScript): run it as a job like /api/scans does
     if request.method == "POST":
-        # read UDP port from form, fallback to env default
-        try:
-            udp_port = int(request.form.get("udp_port", udp_port))
-            if udp_port < 1024 or udp_port > 65535:
-                udp_port = BACNET_UDP_PORT
-        except Exception:
-            udp_port = BACNET_UDP_PORT
-
-        if not ip_with_mask:
-            error = "No IP on eth0. Connect and try again."
-        else:
-            scan_type = request.form.get("scan_type", "full")
-            try:
-                if scan_type == "quick":
-                    scan_results, networks_found = asyncio.run(
-                        bacnet_quick_scan(ip_with_mask, return_networks=True, udp_port=udp_port)
-                    )
-                else:
-                    scan_results, networks_found = asyncio.run(
-                        bacnet_scan(ip_with_mask, return_networks=True, udp_port=udp_port)
-                    )
-
-                # Only keep one entry per unique device_instance
-                unique_devices = {}
-                for d in scan_results:
-                    inst = d.get("device_instance")
-                    if inst is not None and inst not in unique_devices:
-                        unique_devices[inst] = d
-
-                results = {
-                    "devices": [
-                        {
-                            "device_instance": d.get("device_instance"),
-                            "address": d.get("device_ip"),
-                            "vendorName": d.get("vendorName", "-"),
-                            "modelName": d.get("modelName", "-"),
-                        }
-                        for d in unique_devices.values()
-                    ],
-                    "csv": export_to_csv(scan_results) if scan_results else None,
-                    "networks_found": networks_found,
-                    "device_count": len(unique_devices),
-                }
-            except Exception as e:
-                import traceback
-                print("BACnet scan failed:", e)
-                print(traceback.format_exc())
-                error = f"BACnet scan failed: {e}"
+        options, error = parse_bacnet_options(request.form)
+        kind = "bacnet_quick" if options["scan_type"] == "quick" else "bacnet"
+        job, job_error = submit_scan(kind, request.form)
+        if job is not None:
+            return redirect(url_for("bacnet_scan_route", job=job.id))
+        error = job_error[0]
 
     return render_template(
         "bacnet.html",
         error=error,
         eth0_active=is_eth0_active(),
-        udp_port=udp_port,
+        udp_port=options["udp_port"],
+        max_concurrent=options["max_concurrent"],
+        targets=", ".join(options.get("targets") or []),
+        exports=options["exports"],
+        parquet_available=parquet_available(),
         results=results,
+        checkpoints=list_checkpoints(),
+        running_job=job.id if job is not None and job.kind.startswith("bacnet") and job.active else None,
+        running_quick=job is not None and job.kind == "bacnet_quick",
+    )
+
+# --- Background scan jobs ---
+job_manager = JobManager()
+
+# Point columns sent to live listeners (device columns go once per device)
+LIVE_DEVICE_FIELDS = ["device_instance", "device_ip", "network_number", "vendorName", "modelName", "location"]
+LIVE_POINT_FIELDS = ["object_type", "object_instance", "objectName", "presentValue", "units", "outOfService"]
+
+# A device's rows as one live "rows" event: its device columns plus its points
+def live_rows_event(inst, rows):
+    first = rows[0] if rows else {}
+    data = {key: first.get(key) for key in LIVE_DEVICE_FIELDS}
+    data["device_instance"] = inst
+    data["points"] = [
+        [None if row.get(key) is None else str(row[key]) for key in LIVE_POINT_FIELDS]
+        for row in rows if row.get("object_type") is not None
+    ]
+    return data
+
+def bacnet_scan_job(options, resume=None):
+    """
+    Job function for a BACnet scan; progress goes to the job's counters, and
+    discovery, device and row events to the job's event log (see
+    /api/scans/<id>/events).
+    """
+    def run(job):
+        def on_progress(event, data):
+            if event == "discovered":
+                # One event per scan target; totals add up across networks
+                job.add(devices_total=data["devices"])
+                networks = job.progress.get("networks", [])
+                job.update(networks=networks + [n for n in data["networks"] if n not in networks])
+                job.emit("discovered", {"devices": data["devices"], "networks": data["networks"]})
+            elif event == "objects":
+                job.add(objects_done=data["count"])
+            elif event == "device":
+                job.add(devices_done=1)
+                job.emit("device", {k: data.get(k) for k in ("device_instance", "device_ip", "objects", "skipped")})
+            elif event == "files":
+                job.update(**data)
+                job.emit("files", data)
+            elif event == "rows":
+                job.emit("rows", live_rows_event(data["device_instance"], data["rows"]))
+
+        job.update(devices_total=0, devices_done=0, objects_done=0, networks=[])
+        return run_bacnet_scan(options, on_progress, resume=resume, job=job)
+    return run
+
+def arp_scan_job(subnet):
+    """Job function for an ARP scan of subnet."""
+    def run(job):
+        devices, csv_path, error = run_arp_scan_with_range(subnet, job=job)
+        job.check_cancelled()
+        if error and not devices:
+            raise RuntimeError(error)
+        return {"subnet": subnet, "devices": devices, "csv": csv_path, "error": error}
+    return run
+
+def submit_scan(kind, form, schedule_id=None):
+    """
+    Submit a background scan job from form fields (as posted to /api/scans).
+    Returns (job, None) or (None, (message, status)).
+    """
+    if kind == "arp":
+        subnet = form.get("subnet") or get_scan_range()
+        try:
+            ipaddress.ip_network(subnet, strict=False)
+        except ValueError:
+            return None, (f"Invalid subnet {subnet}", 400)
+        iface = pick_interface_for_subnet(subnet)
+        params = {"subnet": subnet, "schedule_id": schedule_id}
+        return job_manager.submit("arp", iface, arp_scan_job(subnet), params), None
+    if kind in ("bacnet", "bacnet_quick"):
+        options, error = parse_bacnet_options(form)
+        if kind == "bacnet_quick":
+            options["scan_type"] = "quick"
+        # Resume an interrupted full scan with the options it was started with
+        resume = form.get("resume") or None
+        if resume:
+            try:
+                options = ScanCheckpoint.load(resume).options
+            except (OSError, ValueError):
+                return None, (f"No resumable scan {resume}", 404)
+        interfaces, target_error = check_bacnet_targets(options)
+        error = error or target_error
+        if error:
+            return None, (error, 400)
+        params = {
+            k: options.get(k)
+            for k in ("scan_type", "udp_port", "max_concurrent", "incremental", "targets", "exports")
+        }
+        params.update(resume=resume, schedule_id=schedule_id)
+        return job_manager.submit(kind, interfaces, bacnet_scan_job(options, resume), params), None
+    return None, (f"Unknown scan type {kind}", 400)
+
+@app.route("/api/scans", methods=["GET", "POST"])
+def api_scans():
+    if request.method == "GET":
+        return jsonify([job.to_dict() for job in job_manager.list_jobs()])
+
+    form = request.get_json(silent=True) or request.form
+    job, error = submit_scan(form.get("type", "bacnet"), form)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    return jsonify(job.to_dict()), 202
+
+@app.route("/api/bacnet/health")
+def api_bacnet_health():
+    # Shared BAC0 stacks: uptime, request/error counts, devices seen
+    return jsonify({"shared_stack": BACNET_SHARED_STACK, "services": bacnet_services.health()})
+
+@app.route("/metrics")
+def prometheus_metrics():
+    # Prometheus scrape endpoint: BACnet request counters, latency histogram,
+    # last scan figures and scan job counts
+    lines = [
+        "# HELP ttt_scan_jobs Scan jobs currently known, by kind and status.",
+        "# TYPE ttt_scan_jobs gauge",
+    ]
+    counts = {}
+    for job in job_manager.list_jobs():
+        counts[(job.kind, job.status)] = counts.get((job.kind, job.status), 0) + 1
+    lines += [f'ttt_scan_jobs{{kind="{k}",status="{st}"}} {n}' for (k, st), n in sorted(counts.items())]
+    body = metrics_registry.render() + "\n".join(lines) + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/scan_checkpoints")
+def api_scan_checkpoints():
+    # Interrupted deep scans that can be resumed
+    return jsonify(list_checkpoints())
+
+@app.route("/api/scans/<job_id>")
+def api_scan_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+# Seconds between keep-alive comments on an idle event stream, and the
+# shortest gap between pushes (progress changes with every read, so events
+# arriving close together are sent as one batch)
+SSE_KEEPALIVE = 15
+SSE_MIN_INTERVAL = 0.25
+
+def sse_message(event, data, event_id=None):
+    """One Server-Sent Events message."""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", "data: " + json.dumps(data, default=str)]
+    return "\n".join(lines) + "\n\n"
+
+def job_event_stream(job, last_id):
+    """
+    Yield a job's events as SSE messages, plus a "progress" message whenever
+    its counters change, until it ends with an "end" message carrying the
+    job's final state.
+    """
+    version = None
+    progress = None
+    while True:
+        events, version, truncated = job.events_after(last_id, version, timeout=SSE_KEEPALIVE)
+        if truncated:
+            # The live table would be partial; point the page at the CSV instead
+            yield sse_message("truncated", {"after": last_id, "csv": job.progress.get("csv")})
+        for event in events:
+            last_id = event["id"]
+            yield sse_message(event["event"], event["data"], last_id)
+        state = job.to_dict()
+        if not job.active:
+            # Events emitted between events_after() and the job ending
+            for event in job.events_after(last_id)[0]:
+                last_id = event["id"]
+                yield sse_message(event["event"], event["data"], last_id)
+            yield sse_message("end", state, last_id)
+            return
+        if state["progress"] != progress:
+            progress = state["progress"]
+            yield sse_message("progress", {k: state[k] for k in ("status", "interface", "progress", "eta", "elapsed")})
+        elif not events:
+            yield ": keep-alive\n\n"
+            continue
+        time.sleep(SSE_MIN_INTERVAL)
+
+@app.route("/api/scans/<job_id>/events")
+def api_scan_events(job_id):
+    # Server-Sent Events: discovery, per-device progress and rows as they're
+    # read. Reconnecting clients (Last-Event-ID) pick up where they left off.
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_id") or 0)
+    except ValueError:
+        last_id = 0
+    return Response(
+        stream_with_context(job_event_stream(job, last_id)), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/api/scans/<job_id>/result")
+def api_scan_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.active:
+        return jsonify(job.to_dict()), 409
+    return jsonify(job.to_dict(include_result=True))
+
+@app.route("/api/scans/<job_id>/cancel", methods=["POST"])
+def api_scan_cancel(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+# --- Bulk point read/write ---
+
+# Columns of a bulk results CSV
+BULK_RESULT_FIELDS = [
+    "device_ip", "device_instance", "object_type", "object_instance", "property",
+    "value", "priority", "ok", "error",
+]
+
+def run_on_bacnet(func):
+    """Run func(bacnet) on the shared eth0 stack (or a temporary one) and return its result."""
+    ip_with_mask = get_bacnet_ip_with_mask()
+    if not ip_with_mask:
+        raise RuntimeError("No IP on eth0. Connect and try again.")
+    if BACNET_SHARED_STACK:
+        return bacnet_services.get("eth0", ip_with_mask, BACNET_UDP_PORT).run(func)
+
+    async def with_stack():
+        bacnet = new_stack(ip_with_mask, BACNET_UDP_PORT)
+        await asyncio.sleep(BACNET_STARTUP_DELAY)  # Allow BAC0 to initialize
+        try:
+            return await func(bacnet)
+        finally:
+            bacnet.disconnect()
+    return asyncio.run(with_stack())
+
+def bulk_items_from_request(write):
+    """
+    Items from a JSON body ({"items": [...]}), an uploaded CSV ("file") or
+    pasted CSV text ("items_csv"). Returns (items, errors).
+    """
+    data = request.get_json(silent=True)
+    options = {"need_value": write}
+    if data is not None:
+        options["default_priority"] = data.get("priority") if isinstance(data, dict) else None
+        rows = data.get("items") if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            return [], ["Expected a JSON list of items or {\"items\": [...]}"]
+        return parse_items(rows, **options)
+    options["default_priority"] = request.form.get("priority") or None
+    upload = request.files.get("file")
+    if upload and upload.filename:
+        text = upload.read().decode("utf-8-sig", errors="replace")
+    else:
+        text = request.form.get("items_csv", "")
+    if not text.strip():
+        return [], ["No items given"]
+    return items_from_csv(text, **options)
+
+def run_bulk(write):
+    """Parse the request's items and read or write them. Returns (result, errors)."""
+    items, errors = bulk_items_from_request(write)
+    # Never write part of a list that didn't parse cleanly
+    if not items or (write and errors):
+        return None, errors or ["No items given"]
+    func = bulk_write if write else bulk_read
+    result = run_on_bacnet(lambda bacnet: func(bacnet, items, max_concurrent=BACNET_MAX_CONCURRENT_READS))
+    return result, errors
+
+def bulk_results_csv(results):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=BULK_RESULT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(results)
+    return out.getvalue()
+
+@app.route("/bulk", methods=["GET", "POST"])
+def bulk_page():
+    result, errors, action = None, [], request.form.get("action", "read")
+    if request.method == "POST":
+        try:
+            result, errors = run_bulk(action == "write")
+        except Exception as e:
+            errors = [f"Bulk {action} failed: {e}"]
+    return render_template(
+        "bulk.html", result=result, errors=errors, action=action,
+        results_csv=bulk_results_csv(result["results"]) if result else "",
+        items_csv=request.form.get("items_csv", ""), priority=request.form.get("priority", ""),
+        max_items=BULK_MAX_ITEMS, eth0_active=is_eth0_active(),
     )
 
+@app.route("/api/bulk/<action>", methods=["POST"])
+def api_bulk(action):
+    if action not in ("read", "write"):
+        return jsonify({"error": f"Unknown action {action}"}), 404
+    try:
+        result, errors = run_bulk(action == "write")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 503
+    if result is None:
+        return jsonify({"error": "No items to " + action, "errors": errors}), 400
+    if request.args.get("format") == "csv":
+        return Response(
+            bulk_results_csv(result["results"]), mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename=bulk_{action}.csv"},
+        )
+    return jsonify(dict(result, errors=errors))
+
+# --- Scheduled scans and results retention ---
+
+# Form fields a schedule keeps for its scans (see submit_scan)
+SCHEDULE_PARAM_FIELDS = [
+    "subnet", "targets", "udp_port", "max_concurrent", "low_limit", "high_limit", "full_rescan", "exports",
+]
+
+def scheduled_scan(kind, params, schedule):
+    """Submit function for the scheduler; returns the job id."""
+    job, error = submit_scan(kind, params, schedule_id=schedule["id"])
+    if error:
+        raise ValueError(error[0])
+    return job.id
+
+def results_maintenance():
+    """Compress and delete old results per the retention settings."""
+    summary = results_index.apply_retention(active=ACTIVE_EXPORTS)
+    if summary["compressed"] or summary["deleted"]:
+        print("Results retention:", summary)
+    return summary
+
+scan_scheduler = ScanScheduler(scheduled_scan, maintenance=results_maintenance)
+
+def add_schedule(form):
+    """Add a schedule from form/JSON fields (type, cron, name, scan fields). Raises ValueError."""
+    params = form.get("params")
+    if not isinstance(params, dict):
+        params = {k: form.get(k) for k in SCHEDULE_PARAM_FIELDS if form.get(k) not in (None, "")}
+    return scan_scheduler.add(
+        form.get("type", "bacnet"), form.get("cron", ""), params, name=form.get("name") or None,
+    )
+
+@app.route("/results", methods=["GET", "POST"])
+def results_page():
+    error, message = None, None
+    if request.method == "POST":
+        action = request.form.get("action")
+        try:
+            if action == "add_schedule":
+                schedule = add_schedule(request.form)
+                message = f"Added schedule {schedule['name']}."
+            elif action == "delete_schedule":
+                scan_scheduler.remove(request.form.get("id", 0))
+            elif action == "run_schedule":
+                schedule = scan_scheduler.get(request.form.get("id", 0))
+                if schedule is not None and scan_scheduler.run_schedule(schedule):
+                    message = f"Started {schedule['name']}."
+            elif action == "retention":
+                summary = results_maintenance()
+                message = (f"Compressed {summary['compressed']}, deleted {summary['deleted']}, "
+                           f"freed {summary['bytes_freed'] // 1024} KB.")
+        except ValueError as e:
+            error = str(e)
+    results_index.sync()
+    return render_template(
+        "results.html", error=error, message=message,
+        schedules=scan_scheduler.schedules(), results=results_index.list(),
+        stats=results_index.stats(), scheduler_running=scan_scheduler.running,
+    )
+
+@app.route("/api/results")
+def api_results():
+    results_index.sync()
+    return jsonify({
+        "stats": results_index.stats(),
+        "results": results_index.list(request.args.get("kind"), request.args.get("limit", 200, type=int)),
+    })
+
+@app.route("/api/results/retention", methods=["POST"])
+def api_results_retention():
+    return jsonify(results_maintenance())
+
+@app.route("/api/schedules", methods=["GET", "POST"])
+def api_schedules():
+    if request.method == "GET":
+        return jsonify(scan_scheduler.status())
+    try:
+        schedule = add_schedule(request.get_json(silent=True) or request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(schedule), 201
+
+@app.route("/api/schedules/<int:schedule_id>", methods=["DELETE"])
+def api_schedule_remove(schedule_id):
+    if not scan_scheduler.remove(schedule_id):
+        return jsonify({"error": "Unknown schedule"}), 404
+    return jsonify({"removed": schedule_id})
+
+@app.route("/api/schedules/<int:schedule_id>/<action>", methods=["POST"])
+def api_schedule_action(schedule_id, action):
+    schedule = scan_scheduler.get(schedule_id)
+    if schedule is None:
+        return jsonify({"error": "Unknown schedule"}), 404
+    if action == "run":
+        job_id = scan_scheduler.run_schedule(schedule)
+        schedule = scan_scheduler.get(schedule_id)
+        return jsonify(schedule), 202 if job_id else 400
+    if action in ("enable", "disable"):
+        return jsonify(scan_scheduler.set_enabled(schedule_id, action == "enable"))
+    return jsonify({"error": f"Unknown action {action}"}), 400
+
+# --- Point trending ---
+trend_store = TrendStore()
+trend_poller = TrendPoller(trend_store, max_concurrent=BACNET_MAX_CONCURRENT_READS)
+bacnet_services.on_replace(trend_poller.service_replaced)
+
+def start_trending():
+    """Start polling trend points on the shared BAC0 stack for eth0."""
+    ip_with_mask = get_bacnet_ip_with_mask()
+    if not ip_with_mask:
+        raise RuntimeError("No IP on eth0. Connect and try again.")
+    trend_poller.start(bacnet_services.get("eth0", ip_with_mask, BACNET_UDP_PORT))
+
+@app.route("/api/trend")
+def api_trend():
+    return jsonify({
+        "poller": trend_poller.status(),
+        "store": trend_store.stats(),
+        "points": trend_store.points(),
+    })
+
+@app.route("/api/trend/points", methods=["POST"])
+def api_trend_add_points():
+    # JSON {"points": [{...}, ...]} or a single point as form/JSON fields
+    data = request.get_json(silent=True) or request.form
+    items = data.get("points") if isinstance(data.get("points"), list) else [data]
+    added = []
+    try:
+        for item in items:
+            added.append(trend_store.add_point(
+                item["device_ip"], item["object_type"], int(item["object_instance"]),
+                prop=item.get("property") or "presentValue",
+                interval=item.get("interval") or None,
+                device_instance=item.get("device_instance"),
+                name=item.get("name") or None,
+            ))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid trend point: {e}"}), 400
+    return jsonify({"added": added}), 201
+
+@app.route("/api/trend/points/<int:point_id>", methods=["DELETE"])
+def api_trend_remove_point(point_id):
+    if not trend_store.remove_point(point_id):
+        return jsonify({"error": "Unknown point"}), 404
+    return jsonify({"removed": point_id})
+
+@app.route("/api/trend/points/<int:point_id>/samples")
+def api_trend_samples(point_id):
+    point = trend_store.get_point(point_id)
+    if point is None:
+        return jsonify({"error": "Unknown point"}), 404
+    # Epoch seconds; defaults to the last hour
+    try:
+        end = float(request.args.get("end") or time.time())
+        start = float(request.args.get("start") or end - 3600)
+        step = int(request.args["step"]) if request.args.get("step") else None
+    except ValueError:
+        return jsonify({"error": "start, end and step must be numbers"}), 400
+    return jsonify({
+        "point": point,
+        "start": start,
+        "end": end,
+        "samples": trend_store.query(point_id, start, end, step),
+    })
+
+@app.route("/api/trend/start", methods=["POST"])
+def api_trend_start():
+    try:
+        start_trending()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(trend_poller.status())
+
+@app.route("/api/trend/stop", methods=["POST"])
+def api_trend_stop():
+    trend_poller.stop()
+    return jsonify(trend_poller.status())
+
+# --- Snapshot comparison ---
+def parse_diff_args(args):
+    """(old, new, tolerance) from query args; raises ValueError."""
+    try:
+        tolerance = float(args.get("tolerance") or 0)
+    except ValueError:
+        raise ValueError("Tolerance must be a number.")
+    return args.get("old", ""), args.get("new", ""), tolerance
+
+@app.route("/diff")
+def diff_page():
+    snapshots = list_snapshots()
+    old, new, result, error = request.args.get("old"), request.args.get("new"), None, None
+    if old and new:
+        try:
+            result = diff_snapshots(*parse_diff_args(request.args))
+        except ValueError as e:
+            error = str(e)
+    return render_template(
+        "diff.html", snapshots=snapshots, old=old, new=new,
+        tolerance=request.args.get("tolerance", ""), result=result, error=error,
+    )
+
+@app.route("/api/snapshots")
+def api_snapshots():
+    return jsonify(list_snapshots(request.args.get("kind")))
+
+@app.route("/api/diff")
+def api_diff():
+    try:
+        return jsonify(diff_snapshots(*parse_diff_args(request.args)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
 @app.route("/download_csv")
 def download_csv():
-    # Download CSV by path (legacy, not used in main flow)
-    path = request.args.get("path")
-    return send_file(path, as_attachment=True)
+    # Legacy download by path; only indexed result files are served
+    return redirect(url_for("download", filename=os.path.basename(request.args.get("path", ""))))
 
 # --- Add your other routes (network, index, etc.) below ---
 
 def is_eth0_active():
     """True if eth0 link is up."""
-    return subprocess.getoutput("cat /sys/class/net/eth0/operstate 2>/dev/null").strip() == "up"
+    return net_state.is_up("eth0")
 
 if __name__ == "__main__":
+    preload_oui_table()
+    # Sidecar worker: scheduled scans and retention only, no web server
+    # (run the web app with TTT_SCHEDULER=0 alongside it)
+    if "--worker" in sys.argv[1:]:
+        print("Scan scheduler worker started")
+        scan_scheduler.run_forever()
+        sys.exit(0)
+    if os.environ.get("TTT_SCHEDULER", "1") != "0":
+        scan_scheduler.start()
+    # Keep trending across restarts
+    if trend_store.points() and os.environ.get("BACNET_TREND_AUTOSTART", "1") != "0":
+        try:
+            start_trending()
+        except Exception as e:
+            print("Trending not started:", e)
     port = int(os.environ.get("PORT", "8080"))  # was 80; default to 8080
     print(f"Flask app started on port {port}!")
     app.run(host="0.0.0.0", port=port)
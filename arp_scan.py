@@ -0,0 +1,175 @@
+import ipaddress
+import os
+import select
+import socket
+import struct
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Absolute path (systemd often lacks /usr/sbin in PATH)
+ARP_SCAN_BIN = os.environ.get("ARP_SCAN_BIN", "/usr/sbin/arp-scan")
+
+# "arp-scan" (default) or "raw" for the in-process AF_PACKET sender, which
+# needs CAP_NET_RAW on the Python interpreter
+ARP_SCAN_BACKEND = os.environ.get("ARP_SCAN_BACKEND", "arp-scan")
+
+# Large subnets are split into chunks of this prefix length, scanned in parallel
+ARP_CHUNK_PREFIX = int(os.environ.get("ARP_CHUNK_PREFIX", "24"))
+ARP_WORKERS = int(os.environ.get("ARP_WORKERS", "4"))
+
+# Retry rounds: stop after max_rounds, or once stable_rounds rounds in a row
+# found nobody new
+ARP_MAX_ROUNDS = 10
+ARP_STABLE_ROUNDS = 2
+
+# Per-round reply timeout for the raw backend (seconds)
+RAW_REPLY_TIMEOUT = 1.0
+
+PRIVILEGE_ERROR = "arp-scan needs privileges. Run: sudo setcap cap_net_raw,cap_net_admin+eip /usr/sbin/arp-scan"
+
+class ArpScanError(Exception):
+    """
+    arp-scan (or the raw backend) could not run; message is user-facing.
+    responders holds the {mac: ip} found by earlier rounds, if any.
+    """
+
+    def __init__(self, message, responders=None):
+        super().__init__(message)
+        self.responders = responders or {}
+
+# Parse arp-scan output into [(ip, mac), ...]
+def parse_arp_output(output):
+    replies = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and ":" in parts[1] and parts[0][0].isdigit():
+            replies.append((parts[0], parts[1].lower()))
+    return replies
+
+def arp_scan_hosts(iface, hosts):
+    """Run one arp-scan pass over an explicit host list (via stdin)."""
+    cmd = [ARP_SCAN_BIN, "--interface", iface, "--plain", "--file=-"]
+    try:
+        result = subprocess.run(
+            cmd, input="\n".join(hosts) + "\n", capture_output=True, text=True, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        msg = e.stderr or e.stdout or str(e)
+        if "must be root" in msg.lower() or "operation not permitted" in msg.lower():
+            raise ArpScanError(PRIVILEGE_ERROR)
+        raise ArpScanError(msg.strip())
+    return parse_arp_output(result.stdout)
+
+# Get the MAC and IPv4 address of an interface
+def _iface_addresses(iface):
+    with open(f"/sys/class/net/{iface}/address") as f:
+        mac = bytes.fromhex(f.read().strip().replace(":", ""))
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        import fcntl
+        ip = fcntl.ioctl(
+            s.fileno(),
+            0x8915,  # SIOCGIFADDR
+            struct.pack('256s', iface[:15].encode('utf-8'))
+        )[20:24]
+    finally:
+        s.close()
+    return mac, ip
+
+def raw_arp_hosts(iface, hosts, timeout=RAW_REPLY_TIMEOUT):
+    """One pass of ARP requests sent from this process over an AF_PACKET socket."""
+    try:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0806))
+    except PermissionError:
+        raise ArpScanError("Raw ARP backend needs CAP_NET_RAW on the Python interpreter.")
+    try:
+        sock.bind((iface, 0))
+        src_mac, src_ip = _iface_addresses(iface)
+        wanted = {socket.inet_aton(h) for h in hosts}
+        for target in wanted:
+            frame = (
+                b"\xff" * 6 + src_mac + b"\x08\x06"            # Ethernet header
+                + struct.pack("!HHBBH", 1, 0x0800, 6, 4, 1)    # ARP request
+                + src_mac + src_ip + b"\x00" * 6 + target
+            )
+            sock.send(frame)
+
+        replies = {}
+        deadline = time.monotonic() + timeout
+        while len(replies) < len(wanted):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                break
+            frame = sock.recv(65535)
+            if len(frame) < 42 or frame[12:14] != b"\x08\x06":
+                continue
+            if struct.unpack("!H", frame[20:22])[0] != 2:  # ARP reply
+                continue
+            sender_ip = frame[28:32]
+            if sender_ip in wanted:
+                replies[sender_ip] = frame[22:28]
+        return [
+            (socket.inet_ntoa(ip), ":".join(f"{b:02x}" for b in mac))
+            for ip, mac in replies.items()
+        ]
+    finally:
+        sock.close()
+
+BACKENDS = {"arp-scan": arp_scan_hosts, "raw": raw_arp_hosts}
+
+def split_subnet(subnet, chunk_prefix=None):
+    """Split a CIDR into host lists of at most one /chunk_prefix each."""
+    net = ipaddress.ip_network(subnet, strict=False)
+    chunk_prefix = max(net.prefixlen, chunk_prefix or ARP_CHUNK_PREFIX)
+    chunks = net.subnets(new_prefix=chunk_prefix) if chunk_prefix > net.prefixlen else [net]
+    return [[str(h) for h in chunk.hosts()] or [str(chunk.network_address)] for chunk in chunks]
+
+def scan_subnet(subnet, iface, backend=None, max_rounds=ARP_MAX_ROUNDS,
+                stable_rounds=ARP_STABLE_ROUNDS, chunk_prefix=None, workers=None,
+                on_round=None, cancel_event=None):
+    """
+    ARP sweep of subnet on iface. Returns {mac: ip} in first-seen order.
+
+    The first round covers every host, with large subnets split into chunks
+    scanned in parallel. Later rounds only retry hosts that haven't answered,
+    and scanning stops once stable_rounds rounds in a row add nobody new.
+    on_round(round_number, max_rounds, responders) is called after each round.
+    Raises ArpScanError if the backend can't run; if that happens after
+    the first round, the error carries the responders found so far.
+    """
+    backend = backend or ARP_SCAN_BACKEND
+    if backend not in BACKENDS:
+        raise ArpScanError(f"Unknown ARP backend {backend}")
+    if backend == "arp-scan" and not os.path.exists(ARP_SCAN_BIN):
+        raise ArpScanError(f"arp-scan not found at {ARP_SCAN_BIN}")
+    scan_hosts = BACKENDS[backend]
+
+    pending = split_subnet(subnet, chunk_prefix)
+    responders = {}
+    answered = set()
+    quiet_rounds = 0
+    with ThreadPoolExecutor(max_workers=workers or ARP_WORKERS) as pool:
+        for round_number in range(1, max_rounds + 1):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            new = 0
+            try:
+                for replies in pool.map(lambda hosts: scan_hosts(iface, hosts), pending):
+                    for ip, mac in replies:
+                        answered.add(ip)
+                        if mac not in responders:
+                            responders[mac] = ip
+                            new += 1
+            except ArpScanError as e:
+                raise ArpScanError(str(e), responders) from e
+            if on_round is not None:
+                on_round(round_number, max_rounds, responders)
+
+            # Retry only silent hosts; done once the responder set is stable
+            pending = [[h for h in hosts if h not in answered] for hosts in pending]
+            pending = [hosts for hosts in pending if hosts]
+            quiet_rounds = 0 if new else quiet_rounds + 1
+            if not pending or (round_number > 1 and quiet_rounds >= stable_rounds):
+                break
+    return responders
@@ -1,201 +1,1047 @@
 import BAC0
+from BAC0.core.io.IOExceptions import SegmentationNotSupported, UnrecognizedService
 import asyncio
+import contextlib
 import csv
 import datetime
+import gzip
+import importlib.util
+import io
+import json
 import os
-import socket
-import fcntl
-import struct
-
-# Directory to store scan results as CSV files (project-relative or env override)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-OUTPUT_DIR = os.environ.get("TTT_RESULTS_DIR", os.path.join(BASE_DIR, "results"))
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# Get the IP address of a given network interface (e.g., 'eth0')
-def get_ip_address(ifname):
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    return socket.inet_ntoa(fcntl.ioctl(
-        s.fileno(),
-        0x8915,  # SIOCGIFADDR
-        struct.pack('256s', ifname[:15].encode('utf-8'))
-    )[20:24])
-
-# Example usage to get eth0 IP and subnet mask
-eth0_ip = get_ip_address('eth0')
-ip_with_mask = f"{eth0_ip}/24"
-
-# Main BACnet scan: discovers devices and collects all points/properties
-async def bacnet_scan(ip_with_mask, return_networks=False, udp_port=47808):
-    # Start BAC0 with the given IP/mask and UDP port
-    bacnet = BAC0.lite(ip=ip_with_mask, port=udp_port)
-    await asyncio.sleep(1)  # Allow BAC0 to initialize
-    bacnet.discover()       # Send Who-Is to discover devices
-    await asyncio.sleep(10) # Wait for responses
-
-    discovered = getattr(bacnet, "discoveredDevices", {})
-    results = []
-
-    # Properties and object types to scan for each device
-    props = ["objectName", "description", "units", "presentValue", "outOfService"]
-    object_types = [
-        "analogInput", "analogOutput", "analogValue",
-        "binaryInput", "binaryOutput", "binaryValue",
-        "multiStateInput", "multiStateOutput", "multiStateValue"
-    ]
+import sqlite3
+import time
+import weakref
+
+from bacnet_cache import DeviceCache, STATIC_OBJECT_PROPS
+from results_dir import OUTPUT_DIR
+
+# Concurrency limits for deep scans. Keep these low on sites with MS/TP trunks
+# behind routers; a router can only forward one request per token pass.
+MAX_CONCURRENT_READS = int(os.environ.get("BACNET_MAX_CONCURRENT_READS", "16"))
+MAX_READS_PER_DEVICE = int(os.environ.get("BACNET_MAX_READS_PER_DEVICE", "2"))
+
+# Properties and object types to scan for each device
+OBJECT_PROPS = ["objectName", "description", "units", "presentValue", "outOfService"]
+LIVE_OBJECT_PROPS = ["presentValue", "outOfService"]
+DEVICE_PROPS = ["vendorName", "modelName", "location"]
+FALLBACK_OBJECT_TYPES = [
+    "analogInput", "analogOutput", "analogValue",
+    "binaryInput", "binaryOutput", "binaryValue",
+    "multiStateInput", "multiStateOutput", "multiStateValue"
+]
+
+# Devices that reject a whole objectList read get it index by index, this
+# many indices at a time (failed indices are retried once, a few at a time).
+# If that fails too, each FALLBACK_OBJECT_TYPES type is
+# probed from instance 0 with objectName only, PROBE_BATCH instances at a time,
+# until PROBE_MISS_LIMIT instances in a row are missing (or PROBE_MAX_INSTANCE).
+OBJECT_LIST_CHUNK = 32
+OBJECT_LIST_RETRY_CHUNK = 4
+PROBE_BATCH = 8
+PROBE_MISS_LIMIT = 8
+PROBE_MAX_INSTANCE = int(os.environ.get("BACNET_PROBE_MAX_INSTANCE", "1024"))
+
+# Per-read timeouts follow each device's observed latency: READ_TIMEOUT_FACTOR
+# times its average response time, clamped to [READ_TIMEOUT_MIN,
+# READ_TIMEOUT_MAX]. Devices not heard from yet get READ_TIMEOUT_MAX.
+READ_TIMEOUT_MAX = float(os.environ.get("BACNET_READ_TIMEOUT", "10"))
+READ_TIMEOUT_MIN = 1.0
+READ_TIMEOUT_FACTOR = 4
+LATENCY_SMOOTHING = 0.3
+
+# Who-Is discovery timing. Discovery ends once no new I-Am has arrived for
+# DISCOVER_QUIET_PERIOD seconds, and never runs longer than DISCOVER_MAX_WAIT.
+DISCOVER_QUIET_PERIOD = float(os.environ.get("BACNET_DISCOVER_QUIET", "2"))
+DISCOVER_MAX_WAIT = float(os.environ.get("BACNET_DISCOVER_MAX_WAIT", "10"))
+DISCOVER_POLL_INTERVAL = 0.2
+MAX_DEVICE_INSTANCE = 4194303
+
+# ReadPropertyMultiple sizing. Requests are chunked so the answer for one chunk
+# fits in the device's max APDU; the per-object figure is a worst-case guess for
+# the five OBJECT_PROPS (name and description strings dominate).
+RPM_DEFAULT_MAX_APDU = 480   # safe for MS/TP devices that don't report it
+RPM_APDU_OVERHEAD = 16
+RPM_BYTES_PER_OBJECT = 110
+
+# Device addresses that rejected ReadPropertyMultiple; they get single reads
+# for the rest of the process lifetime.
+_RPM_UNSUPPORTED = set()
+
+# Properties every device and object has; a result missing any of them had a
+# failed read and isn't cached (description and units are legitimately absent)
+REQUIRED_DEVICE_PROPS = ["vendorName", "modelName"]
+REQUIRED_OBJECT_PROPS = ["objectName"]
+
+# Request slots shared by every ReadLimiter on one long-lived BAC0 stack (see
+# bacnet_service), so concurrent scans, bulk jobs and trend polling stay under
+# one cap for the socket as well as their own
+_stack_slots = weakref.WeakKeyDictionary()
+
+def set_stack_limit(bacnet, max_concurrent):
+    """Cap in-flight requests on bacnet across all its users; call on the stack's loop."""
+    _stack_slots[bacnet] = asyncio.Semaphore(max(1, max_concurrent))
+
+# Marker for a read that raised, so callers can tell it apart from a None value
+_MISSING = object()
+
+class ReadLimiter:
+    """
+    Caps in-flight BACnet requests globally and per device address, and sets
+    each request's timeout from the device's observed response time. Every
+    request is recorded in metrics (a ScanMetrics) when one is given. On a
+    stack with a set_stack_limit cap, requests also take one of its slots.
+    """
+
+    def __init__(self, max_concurrent=None, per_device=None, metrics=None):
+        self.max_concurrent = max(1, max_concurrent or MAX_CONCURRENT_READS)
+        self.per_device = max(1, per_device or MAX_READS_PER_DEVICE)
+        self.metrics = metrics
+        self._global = asyncio.Semaphore(self.max_concurrent)
+        self._devices = {}
+        self._latency = {}
+
+    def _device_slot(self, device_ip):
+        sem = self._devices.get(device_ip)
+        if sem is None:
+            sem = self._devices[device_ip] = asyncio.Semaphore(self.per_device)
+        return sem
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, bacnet, device_ip):
+        # Take the device slot first so a slow device can't hold global slots,
+        # and the stack's slot last so waiting on our own caps holds none of it
+        async with self._device_slot(device_ip):
+            async with self._global:
+                stack_slots = _stack_slots.get(bacnet)
+                if stack_slots is None:
+                    yield
+                else:
+                    async with stack_slots:
+                        yield
+
+    def timeout_for(self, device_ip):
+        latency = self._latency.get(device_ip)
+        if latency is None:
+            return READ_TIMEOUT_MAX
+        return min(READ_TIMEOUT_MAX, max(READ_TIMEOUT_MIN, latency * READ_TIMEOUT_FACTOR))
 
-    # Loop through discovered devices
-    for key, info in discovered.items():
-        instance = info['object_instance'][1]
-        device_ip = str(info['address'])
-        network_number = info.get("network") or info.get("network_number") or ""
+    def _observe(self, device_ip, seconds):
+        latency = self._latency.get(device_ip)
+        self._latency[device_ip] = seconds if latency is None else (
+            latency + LATENCY_SMOOTHING * (seconds - latency)
+        )
 
-        # Read device-level info (vendor, model, location)
-        device_info = {}
-        for prop in ["vendorName", "modelName", "location"]:
+    async def _timed(self, device_ip, kind, call, request, **kwargs):
+        started = time.monotonic()
+        try:
+            value = await call(request, timeout=self.timeout_for(device_ip), **kwargs)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.record(device_ip, kind, time.monotonic() - started, e)
+            raise
+        elapsed = time.monotonic() - started
+        self._observe(device_ip, elapsed)
+        if self.metrics is not None:
+            self.metrics.record(device_ip, kind, elapsed)
+        return value
+
+    async def read(self, bacnet, device_ip, request, default=None, **kwargs):
+        """Read one property (kwargs such as arr_index go to BAC0); returns default instead of raising."""
+        async with self._slot(bacnet, device_ip):
             try:
-                value = await bacnet.read(f"{device_ip} device {instance} {prop}")
-                device_info[prop] = value
+                return await self._timed(device_ip, "read", bacnet.read, request, **kwargs)
             except Exception:
-                device_info[prop] = None
+                return default
+
+    async def read_multiple(self, bacnet, device_ip, request):
+        """ReadPropertyMultiple under the same caps; errors are raised."""
+        async with self._slot(bacnet, device_ip):
+            return await self._timed(device_ip, "rpm", bacnet.readMultiple, request)
+
+    async def write(self, bacnet, device_ip, request):
+        """WriteProperty under the same caps; errors are raised."""
+        async with self._slot(bacnet, device_ip):
+            return await self._timed(device_ip, "write", bacnet.write, request)
+
+    async def write_multiple(self, bacnet, device_ip, args):
+        """WritePropertyMultiple of BAC0 write args to one device; errors are raised."""
+        async with self._slot(bacnet, device_ip):
+            return await self._timed(device_ip, "wpm", bacnet.writeMultiple, device_ip, args=args)
+
+# Report scan progress to an optional on_progress(event, data) callback.
+# Events: "discovered" (devices, networks), "objects" (count), "device"
+# (device_instance, device_ip, objects). A failing callback never stops a scan.
+def _emit(on_progress, event, **data):
+    if on_progress is None:
+        return
+    try:
+        on_progress(event, data)
+    except Exception as e:
+        print(f"Scan progress callback failed on {event}:", e)
+
+# Number of objects per RPM request for a device with the given max APDU
+def _rpm_chunk_size(max_apdu, props_per_object):
+    try:
+        max_apdu = int(max_apdu)
+    except (TypeError, ValueError):
+        max_apdu = RPM_DEFAULT_MAX_APDU
+    per_object = RPM_BYTES_PER_OBJECT * props_per_object // len(OBJECT_PROPS)
+    return max(1, (max_apdu - RPM_APDU_OVERHEAD) // max(1, per_object))
 
-        # Try to get the objectList for the device (preferred)
-        objects = []
+# RPM answers carry per-property errors inline (e.g. units on a binary object)
+def _rpm_value(value):
+    if value is None or type(value).__name__ in ("ErrorType", "Error"):
+        return None
+    return value
+
+# Read props for a chunk of objects with one RPM, falling back to single reads.
+# A device that doesn't recognise RPM is remembered in _RPM_UNSUPPORTED; a
+# segmentation error just splits the chunk in half and tries again.
+async def _read_objects_chunk(bacnet, limiter, device_ip, chunk, props):
+    if device_ip not in _RPM_UNSUPPORTED:
+        request = device_ip + " " + " ".join(
+            f"{obj_type} {obj_instance} {' '.join(props)}" for obj_type, obj_instance in chunk
+        )
         try:
-            object_list = await bacnet.read(f"{device_ip} device {instance} objectList")
-            for obj_type, obj_instance in object_list:
-                obj_row = {
-                    "device_instance": instance,
-                    "device_ip": device_ip,
-                    "network_number": network_number,
-                    "object_type": obj_type,
-                    "object_instance": obj_instance,
-                    "vendorName": device_info["vendorName"],
-                    "modelName": device_info["modelName"],
-                    "location": device_info["location"]
-                }
-                # Read properties for each object
-                for prop in props:
-                    try:
-                        value = await bacnet.read(f"{device_ip} {obj_type} {obj_instance} {prop}")
-                        obj_row[prop] = value
-                    except Exception:
-                        obj_row[prop] = None
-                objects.append(obj_row)
+            values = await limiter.read_multiple(bacnet, device_ip, request)
+            if values is not None and len(values) == len(chunk) * len(props):
+                n = len(props)
+                return [
+                    {prop: _rpm_value(v) for prop, v in zip(props, values[i * n:(i + 1) * n])}
+                    for i in range(len(chunk))
+                ]
+        except UnrecognizedService:
+            if device_ip not in _RPM_UNSUPPORTED:
+                print(f"RPM not supported by {device_ip}; using single reads")
+                _RPM_UNSUPPORTED.add(device_ip)
+        except SegmentationNotSupported:
+            if len(chunk) > 1:
+                half = len(chunk) // 2
+                first, second = await asyncio.gather(
+                    _read_objects_chunk(bacnet, limiter, device_ip, chunk[:half], props),
+                    _read_objects_chunk(bacnet, limiter, device_ip, chunk[half:], props),
+                )
+                return first + second
         except Exception:
-            # If objectList fails, try common object types/instances manually
-            for obj_type in object_types:
-                if obj_type.startswith("analog"):
-                    scan_props = ["objectName", "description", "presentValue", "outOfService"]
+            pass
+
+    # Single ReadProperty per (object, property)
+    return list(await asyncio.gather(*[
+        _read_object_props(bacnet, limiter, device_ip, obj_type, obj_instance, props)
+        for obj_type, obj_instance in chunk
+    ]))
+
+# Read props for every object on a device, batched into APDU-sized RPM chunks.
+# The first chunk goes alone so a device without RPM rejects it once, not
+# once per chunk, before the rest fan out.
+async def _read_objects(bacnet, limiter, device_ip, objects, props, max_apdu=None,
+                        on_progress=None):
+    objects = list(objects)
+    size = _rpm_chunk_size(max_apdu, len(props))
+    chunks = [objects[i:i + size] for i in range(0, len(objects), size)]
+
+    async def read_chunk(chunk):
+        values = await _read_objects_chunk(bacnet, limiter, device_ip, chunk, props)
+        _emit(on_progress, "objects", count=len(chunk))
+        return values
+
+    per_chunk = []
+    if len(chunks) > 1 and device_ip not in _RPM_UNSUPPORTED:
+        per_chunk.append(await read_chunk(chunks[0]))
+        chunks = chunks[1:]
+    per_chunk += await asyncio.gather(*[read_chunk(chunk) for chunk in chunks])
+    return [values for chunk_values in per_chunk for values in chunk_values]
+
+# Read vendor/model/location for one device
+async def _read_device_info(bacnet, limiter, device_ip, instance):
+    values = await asyncio.gather(*[
+        limiter.read(bacnet, device_ip, f"{device_ip} device {instance} {prop}")
+        for prop in DEVICE_PROPS
+    ])
+    return dict(zip(DEVICE_PROPS, values))
+
+# Read a list of properties for one object, concurrently within the device cap
+async def _read_object_props(bacnet, limiter, device_ip, obj_type, obj_instance, props, default=None):
+    values = await asyncio.gather(*[
+        limiter.read(bacnet, device_ip, f"{device_ip} {obj_type} {obj_instance} {prop}", default)
+        for prop in props
+    ])
+    return dict(zip(props, values))
+
+# objectList as ([(type, instance), ...], complete), or (None, False) if it
+# can't be read. Devices that can't return the whole list in one APDU get it
+# by array index: length at index 0, then the entries in OBJECT_LIST_CHUNK-sized
+# batches. Indices that fail are retried once, OBJECT_LIST_RETRY_CHUNK at a
+# time; if some are still missing the list is returned with complete=False.
+async def _read_object_list(bacnet, limiter, device_ip, instance):
+    request = f"{device_ip} device {instance} objectList"
+    try:
+        return [(obj_type, obj_instance) for obj_type, obj_instance in
+                await limiter.read(bacnet, device_ip, request)], True
+    except Exception:
+        pass
+
+    try:
+        length = int(await limiter.read(bacnet, device_ip, request, arr_index=0))
+    except (TypeError, ValueError):
+        return None, False
+
+    entries = {}
+
+    async def read_indices(indices, chunk):
+        for start in range(0, len(indices), chunk):
+            batch = indices[start:start + chunk]
+            values = await asyncio.gather(*[
+                limiter.read(bacnet, device_ip, request, arr_index=idx) for idx in batch
+            ])
+            for idx, entry in zip(batch, values):
+                try:
+                    obj_type, obj_instance = entry
+                    entries[idx] = (obj_type, obj_instance)
+                except (TypeError, ValueError):
+                    pass
+
+    await read_indices(list(range(1, length + 1)), OBJECT_LIST_CHUNK)
+    failed = [idx for idx in range(1, length + 1) if idx not in entries]
+    if failed:
+        await read_indices(failed, OBJECT_LIST_RETRY_CHUNK)
+    missing = length - len(entries)
+    if missing:
+        print(f"objectList of {device_ip} (device {instance}): {missing} of {length} entries unreadable")
+    object_list = [entries[idx] for idx in sorted(entries)]
+    return object_list or None, not missing
+
+# Last resort when there's no objectList: probe each common object type from
+# instance 0 with objectName only, stopping a type after PROBE_MISS_LIMIT
+# missing instances in a row. Returns [(type, instance, objectName), ...].
+async def _probe_objects(bacnet, limiter, device_ip):
+    async def probe_type(obj_type):
+        found = []
+        misses = 0
+        idx = 0
+        while idx < PROBE_MAX_INSTANCE and misses < PROBE_MISS_LIMIT:
+            batch = range(idx, min(idx + PROBE_BATCH, PROBE_MAX_INSTANCE))
+            names = await asyncio.gather(*[
+                limiter.read(bacnet, device_ip, f"{device_ip} {obj_type} {i} objectName", _MISSING)
+                for i in batch
+            ])
+            for i, name in zip(batch, names):
+                if name is _MISSING:
+                    misses += 1
                 else:
-                    scan_props = ["objectName", "description", "units", "presentValue", "outOfService"]
-                for idx in range(1, 10):
-                    obj_found = False
-                    obj_row = {
-                        "device_instance": instance,
-                        "device_ip": device_ip,
-                        "network_number": network_number,
-                        "object_type": obj_type,
-                        "object_instance": idx,
-                        "vendorName": device_info["vendorName"],
-                        "modelName": device_info["modelName"],
-                        "location": device_info["location"]
-                    }
-                    for prop in scan_props:
-                        try:
-                            value = await bacnet.read(f"{device_ip} {obj_type} {idx} {prop}")
-                            obj_row[prop] = value
-                            obj_found = True
-                        except Exception:
-                            obj_row[prop] = None
-                    if obj_found:
-                        objects.append(obj_row)
-
-        results.extend(objects)
+                    misses = 0
+                    found.append((obj_type, i, name))
+            idx += PROBE_BATCH
+        return found
+
+    per_type = await asyncio.gather(*[probe_type(t) for t in FALLBACK_OBJECT_TYPES])
+    return [obj for found in per_type for obj in found]
+
+# Pull instance, address and network number out of a discoveredDevices entry
+def _device_identity(info):
+    instance = info['object_instance'][1]
+    device_ip = str(info['address'])
+    network_number = info.get("network") or info.get("network_number") or ""
+    return instance, device_ip, network_number
+
+# Collect the sorted list of network numbers seen during discovery
+def _networks_found(discovered):
+    networks_found = set()
+    for info in discovered.values():
+        net = info.get("network") or info.get("network_number")
+        if net:
+            networks_found.add(str(net))
+    return sorted(networks_found)
+
+# Common leading columns for an object row
+def _object_row(instance, device_ip, network_number, device_info, obj_type, obj_instance):
+    return {
+        "device_instance": instance,
+        "device_ip": device_ip,
+        "network_number": network_number,
+        "object_type": obj_type,
+        "object_instance": obj_instance,
+        "vendorName": device_info["vendorName"],
+        "modelName": device_info["modelName"],
+        "location": device_info["location"]
+    }
+
+# Rescan a device whose databaseRevision matches the cache: static properties
+# come from the cache and only the live values are read from the device
+async def _rescan_cached_device(bacnet, limiter, instance, device_ip, network_number, cached,
+                                on_progress=None):
+    device_info, max_apdu, objects = cached
+    object_list = [(obj["object_type"], obj["object_instance"]) for obj in objects]
+    values = await _read_objects(
+        bacnet, limiter, device_ip, object_list, LIVE_OBJECT_PROPS, max_apdu, on_progress
+    )
+    rows = []
+    for obj, live in zip(objects, values):
+        row = _object_row(
+            instance, device_ip, network_number, device_info,
+            obj["object_type"], obj["object_instance"],
+        )
+        row.update({prop: obj[prop] for prop in STATIC_OBJECT_PROPS})
+        row.update(live)
+        rows.append(row)
+    return rows
+
+# A result with a None required property had a failed read; caching it would
+# pin the gap until the device's databaseRevision changes
+def _cacheable(device_info, rows):
+    return (
+        all(device_info.get(prop) is not None for prop in REQUIRED_DEVICE_PROPS)
+        and all(row.get(prop) is not None for row in rows for prop in REQUIRED_OBJECT_PROPS)
+    )
+
+# Deep scan one device: device info, then every object's properties.
+# With a DeviceCache, devices whose databaseRevision is unchanged since the
+# last scan only have presentValue/outOfService re-read; refresh=True skips
+# that lookup but still stores the fresh result.
+async def _scan_device(bacnet, limiter, info, cache=None, on_progress=None, refresh=False):
+    instance, device_ip, network_number = _device_identity(info)
+    if limiter.metrics is not None:
+        limiter.metrics.describe(device_ip, instance, network_number)
+
+    revision = None
+    if cache is not None:
+        revision = await limiter.read(
+            bacnet, device_ip, f"{device_ip} device {instance} databaseRevision"
+        )
+        cached = None if refresh else cache.lookup(instance, device_ip, revision)
+        if cached is not None:
+            rows = await _rescan_cached_device(
+                bacnet, limiter, instance, device_ip, network_number, cached, on_progress
+            )
+            _emit(on_progress, "device", device_instance=instance, device_ip=device_ip, objects=len(rows))
+            return rows
+
+    device_info = await _read_device_info(bacnet, limiter, device_ip, instance)
+
+    def base_row(obj_type, obj_instance):
+        return _object_row(instance, device_ip, network_number, device_info, obj_type, obj_instance)
+
+    # Try to get the objectList for the device (preferred)
+    (object_list, complete), max_apdu = await asyncio.gather(
+        _read_object_list(bacnet, limiter, device_ip, instance),
+        limiter.read(bacnet, device_ip, f"{device_ip} device {instance} maxApduLengthAccepted"),
+    )
+
+    if object_list is not None:
+        values = await _read_objects(
+            bacnet, limiter, device_ip, object_list, OBJECT_PROPS, max_apdu, on_progress
+        )
+        rows = []
+        for (obj_type, obj_instance), props in zip(object_list, values):
+            row = base_row(obj_type, obj_instance)
+            row.update(props)
+            rows.append(row)
+    else:
+        # No objectList: find objects by name, then read the rest for those only
+        probed = await _probe_objects(bacnet, limiter, device_ip)
+        props = [prop for prop in OBJECT_PROPS if prop != "objectName"]
+        values = await _read_objects(
+            bacnet, limiter, device_ip, [(t, i) for t, i, _ in probed], props, max_apdu, on_progress
+        )
+        rows = []
+        for (obj_type, obj_instance, name), props in zip(probed, values):
+            row = base_row(obj_type, obj_instance)
+            row["objectName"] = name
+            row.update(props)
+            rows.append(row)
+
+    # Probed objects and partly read objectLists may be missing objects, so
+    # they're never cached
+    if cache is not None and complete and _cacheable(device_info, rows):
+        cache.store(instance, device_ip, revision, device_info, max_apdu, rows)
+    _emit(on_progress, "device", device_instance=instance, device_ip=device_ip, objects=len(rows))
+    return rows
+
+# Split a (low, high) device instance range into n contiguous Who-Is slices
+def split_instance_range(low=0, high=MAX_DEVICE_INSTANCE, slices=1):
+    low = max(0, int(low))
+    high = min(MAX_DEVICE_INSTANCE, int(high))
+    if high < low:
+        raise ValueError(f"Invalid device instance range {low}-{high}")
+    slices = max(1, min(int(slices), high - low + 1))
+    step = (high - low + 1) // slices
+    ranges = []
+    for i in range(slices):
+        start = low + i * step
+        end = high if i == slices - 1 else start + step - 1
+        ranges.append((start, end))
+    return ranges
+
+# One discovery at a time per BAC0 stack, since discoveredDevices is shared
+_discovery_locks = weakref.WeakKeyDictionary()
+
+def _discovery_lock(bacnet):
+    lock = _discovery_locks.get(bacnet)
+    if lock is None:
+        lock = _discovery_locks[bacnet] = asyncio.Lock()
+    return lock
+
+# Send Who-Is (optionally ranged and sliced) and wait for the I-Am responses.
+# Returns a copy of bacnet.discoveredDevices (limited to the requested range)
+# once responses have gone quiet. Safe to call on a shared, long-lived stack.
+# global_broadcast sends the Who-Is to every network, which is how a stack
+# registered as a foreign device reaches the networks behind its BBMD.
+async def discover_devices(bacnet, low_limit=None, high_limit=None, slices=1,
+                           quiet_period=None, max_wait=None, global_broadcast=False):
+    low_limit = 0 if low_limit is None else low_limit
+    high_limit = MAX_DEVICE_INSTANCE if high_limit is None else high_limit
+    async with _discovery_lock(bacnet):
+        discovered = await _discover(
+            bacnet, split_instance_range(low_limit, high_limit, slices),
+            DISCOVER_QUIET_PERIOD if quiet_period is None else quiet_period,
+            DISCOVER_MAX_WAIT if max_wait is None else max_wait,
+            global_broadcast,
+        )
+    return {
+        key: info for key, info in discovered.items()
+        if low_limit <= _device_identity(info)[0] <= high_limit
+    }
+
+async def _discover(bacnet, ranges, quiet_period, max_wait, global_broadcast=False):
+    # Forget devices from earlier scans on a shared stack
+    bacnet.discoveredDevices = {}
+
+    # BAC0 runs each discover() as a background task; note which tasks are
+    # ours so we can stop as soon as they've all finished (or gone quiet).
+    before = asyncio.all_tasks()
+    extra = {"global_broadcast": True} if global_broadcast else {}
+    for low, high in ranges:
+        if len(ranges) == 1 and (low, high) == (0, MAX_DEVICE_INSTANCE):
+            bacnet.discover(**extra)
+        else:
+            bacnet.discover(limits=(low, high), **extra)
+    tasks = asyncio.all_tasks() - before
+
+    loop = asyncio.get_running_loop()
+    start = last_change = loop.time()
+    seen = 0
+    while True:
+        await asyncio.sleep(DISCOVER_POLL_INTERVAL)
+        now = loop.time()
+        count = len(getattr(bacnet, "discoveredDevices", None) or {})
+        if count != seen:
+            seen, last_change = count, now
+        if now - start >= max_wait:
+            break
+        if tasks and all(t.done() for t in tasks):
+            break
+        # Stop once I-Ams have dried up, even if BAC0's tasks (or, on older
+        # BAC0, no task handle at all) would have us wait out its own timeout
+        if seen and now - last_change >= quiet_period:
+            break
+
+    return dict(getattr(bacnet, "discoveredDevices", None) or {})
+
+# Main BACnet scan as an async generator: discovers devices and yields
+# (device_instance, rows) as soon as each device has been read (completion
+# order), so rows can be written out without holding the whole site in memory.
+# Devices are scanned concurrently; max_concurrent caps reads in flight across
+# the whole scan and per_device caps them for any single device. Extra keyword
+# arguments (low_limit, high_limit, slices, quiet_period, max_wait) go to
+# discover_devices. With incremental=True, devices are checked against the
+# on-disk DeviceCache and unchanged ones only get their live values re-read;
+# with incremental=False every device is read in full and the cache refreshed.
+# Device instances in skip_devices (e.g. from a resumed scan) are not read,
+# nor are those for which claim(instance) returns False (scan_planner uses
+# this so a device reachable through several networks is only read once).
+# on_progress(event, data) is called as discovery, objects and devices finish.
+# Pass a running BAC0 instance as bacnet to scan over a shared stack (see
+# bacnet_service); otherwise a stack is started for this scan and torn down.
+# Request counts and timings go to metrics (a scan_metrics.ScanMetrics) if given.
+async def bacnet_scan_devices(ip_with_mask, udp_port=47808, max_concurrent=None,
+                              per_device=None, incremental=True, on_progress=None,
+                              skip_devices=None, claim=None, bacnet=None, metrics=None,
+                              **discover_opts):
+    skip_devices = set(skip_devices or ())
+    owns_stack = bacnet is None
+    if owns_stack:
+        # Start BAC0 with the given IP/mask and UDP port
+        bacnet = BAC0.lite(ip=ip_with_mask, port=udp_port)
+        await asyncio.sleep(1)  # Allow BAC0 to initialize
+    cache = DeviceCache()
+    tasks = []
+    try:
+        discovered = await discover_devices(bacnet, **discover_opts)
+        if metrics is not None:
+            metrics.broadcast(discover_opts.get("slices") or 1)
+        _emit(
+            on_progress, "discovered", devices=len(discovered),
+            networks=_networks_found(discovered),
+            instances=[_device_identity(info)[0] for info in discovered.values()],
+        )
+        limiter = ReadLimiter(max_concurrent, per_device, metrics)
+
+        async def scan_one(info):
+            instance = _device_identity(info)[0]
+            return instance, await _scan_device(
+                bacnet, limiter, info, cache, on_progress, refresh=not incremental
+            )
 
-    # Optionally return the list of networks found
-    if return_networks:
-        networks_found = set()
         for info in discovered.values():
-            net = info.get("network") or info.get("network_number")
-            if net:
-                networks_found.add(str(net))
-        bacnet.disconnect()  # Properly disconnect BAC0 instance
-        return results, sorted(networks_found)
+            instance, device_ip, _ = _device_identity(info)
+            if instance in skip_devices or (claim is not None and not claim(instance)):
+                _emit(on_progress, "device", device_instance=instance, device_ip=device_ip,
+                      objects=0, skipped=True)
+            else:
+                tasks.append(asyncio.ensure_future(scan_one(info)))
+        for next_device in asyncio.as_completed(tasks):
+            yield await next_device
+    finally:
+        # Stop outstanding reads if the consumer gave up early
+        for task in tasks:
+            task.cancel()
+        # Let them unwind before the stack and cache go away under them
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if owns_stack:
+            bacnet.disconnect()  # Properly disconnect BAC0 instance
+        cache.close()
 
-    bacnet.disconnect()  # Properly disconnect BAC0 instance
-    return results
+# Same as bacnet_scan_devices, flattened to one row per object
+async def bacnet_scan_rows(ip_with_mask, **options):
+    async for _, rows in bacnet_scan_devices(ip_with_mask, **options):
+        for row in rows:
+            yield row
 
-# Quick BACnet scan: only queries device-level info (no points/objects)
-async def bacnet_quick_scan(ip_with_mask, return_networks=False, udp_port=47808):
-    bacnet = BAC0.lite(ip=ip_with_mask, port=udp_port)
-    await asyncio.sleep(1)
-    bacnet.discover()
-    await asyncio.sleep(10)
+# Main BACnet scan: collects all points/properties into a list, in discovery
+# order. Takes the same options as bacnet_scan_devices.
+async def bacnet_scan(ip_with_mask, return_networks=False, udp_port=47808,
+                      max_concurrent=None, per_device=None, incremental=True,
+                      on_progress=None, bacnet=None, metrics=None, **discover_opts):
+    networks_found = []
+    order = {}
 
-    discovered = getattr(bacnet, "discoveredDevices", {})
-    results = []
+    def track(event, data):
+        if event == "discovered":
+            networks_found.extend(data["networks"])
+            order.update((inst, i) for i, inst in enumerate(data["instances"]))
+        _emit(on_progress, event, **data)
 
-    # Only collect device-level info for each discovered device
-    for key, info in discovered.items():
-        instance = info['object_instance'][1]
-        device_ip = str(info['address'])
-        network_number = info.get("network") or info.get("network_number") or ""
+    results = [
+        row async for row in bacnet_scan_rows(
+            ip_with_mask, udp_port=udp_port, max_concurrent=max_concurrent,
+            per_device=per_device, incremental=incremental, on_progress=track,
+            bacnet=bacnet, metrics=metrics, **discover_opts
+        )
+    ]
+    # Stable sort keeps each device's objects in objectList order
+    results.sort(key=lambda row: order.get(row["device_instance"], len(order)))
 
-        device_info = {}
-        for prop in ["vendorName", "modelName", "location"]:
-            try:
-                value = await bacnet.read(f"{device_ip} device {instance} {prop}")
-                device_info[prop] = value
-            except Exception:
-                device_info[prop] = None
+    # Optionally return the list of networks found
+    if return_networks:
+        return results, networks_found
+    return results
+
+# Quick BACnet scan: only queries device-level info (no points/objects).
+# Takes the same concurrency and discovery options as bacnet_scan.
+async def bacnet_quick_scan(ip_with_mask, return_networks=False, udp_port=47808,
+                            max_concurrent=None, per_device=None, on_progress=None,
+                            claim=None, bacnet=None, metrics=None, **discover_opts):
+    owns_stack = bacnet is None
+    if owns_stack:
+        bacnet = BAC0.lite(ip=ip_with_mask, port=udp_port)
+        await asyncio.sleep(1)  # Allow BAC0 to initialize
 
-        results.append({
+    # Only collect device-level info for each discovered device
+    async def quick_device(info):
+        instance, device_ip, network_number = _device_identity(info)
+        if metrics is not None:
+            metrics.describe(device_ip, instance, network_number)
+        device_info = await _read_device_info(bacnet, limiter, device_ip, instance)
+        _emit(on_progress, "device", device_instance=instance, device_ip=device_ip, objects=0)
+        return {
             "device_instance": instance,
             "device_ip": device_ip,
             "network_number": network_number,
             "vendorName": device_info["vendorName"],
             "modelName": device_info["modelName"],
             "location": device_info["location"]
-        })
+        }
 
-    # Optionally return the list of networks found
-    if return_networks:
-        networks_found = set()
+    try:
+        discovered = await discover_devices(bacnet, **discover_opts)
+        if metrics is not None:
+            metrics.broadcast(discover_opts.get("slices") or 1)
+        _emit(
+            on_progress, "discovered", devices=len(discovered),
+            networks=_networks_found(discovered),
+            instances=[_device_identity(info)[0] for info in discovered.values()],
+        )
+        limiter = ReadLimiter(max_concurrent, per_device, metrics)
+        claimed = []
         for info in discovered.values():
-            net = info.get("network") or info.get("network_number")
-            if net:
-                networks_found.add(str(net))
-        bacnet.disconnect()
-        return results, sorted(networks_found)
+            instance, device_ip, _ = _device_identity(info)
+            if claim is None or claim(instance):
+                claimed.append(info)
+            else:
+                _emit(on_progress, "device", device_instance=instance, device_ip=device_ip,
+                      objects=0, skipped=True)
+        results = list(await asyncio.gather(*[quick_device(info) for info in claimed]))
+    finally:
+        if owns_stack:
+            bacnet.disconnect()
 
-    bacnet.disconnect()
+    # Optionally return the list of networks found
+    if return_networks:
+        return results, _networks_found(discovered)
     return results
 
-# Export scan results to a CSV file and return the file path
-def export_to_csv(results):
+# Quick scan as an async generator of (device_instance, [row]), so it can be
+# streamed the same way as bacnet_scan_devices
+async def bacnet_quick_scan_devices(ip_with_mask, **options):
+    for row in await bacnet_quick_scan(ip_with_mask, **options):
+        yield row["device_instance"], [row]
+
+# Column order for BACnet scan CSVs
+CSV_FIELDNAMES = [
+    "device_ip",
+    "device_instance",
+    "vendorName",
+    "network_number",
+    "location",
+    "modelName",
+    "object_instance",
+    "objectName",
+    "description",
+    "presentValue",
+    "units",
+    "object_type",
+    "outOfService"
+]
+
+# Result files currently being written; downloads of these follow the file
+# until the writer closes it
+ACTIVE_EXPORTS = set()
+
+# Export formats and their file extensions. Every scan writes a CSV (csv.gz
+# replaces the plain one); the others are optional extras.
+EXPORT_EXTENSIONS = {
+    "csv": "csv",
+    "csv.gz": "csv.gz",
+    "ndjson": "ndjson",
+    "sqlite": "sqlite3",
+    "parquet": "parquet",
+}
+DEFAULT_EXPORT_FORMATS = os.environ.get("BACNET_EXPORT_FORMATS", "csv,ndjson")
+
+# Rows buffered per Parquet row group, and uncompressed bytes per gzip member
+PARQUET_ROW_GROUP = 10000
+GZIP_MEMBER_BYTES = 256 * 1024
+
+def parquet_available():
+    """True if pyarrow is installed (needed for Parquet export)."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+def export_formats(names=None):
+    """
+    Validated list of export formats from names (a list or comma-separated
+    string; default BACNET_EXPORT_FORMATS). Always includes exactly one CSV:
+    csv.gz if asked for, else csv. Raises ValueError.
+    """
+    if names is None or isinstance(names, str):
+        names = (names or DEFAULT_EXPORT_FORMATS).split(",")
+    formats = []
+    for name in (str(n).strip().lower() for n in names):
+        if not name or name in formats:
+            continue
+        if name not in EXPORT_EXTENSIONS:
+            raise ValueError(f"Unknown export format {name}; expected one of {', '.join(EXPORT_EXTENSIONS)}")
+        if name == "parquet" and not parquet_available():
+            raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+        formats.append(name)
+    csv_format = "csv.gz" if "csv.gz" in formats else "csv"
+    return [csv_format] + [f for f in formats if f not in ("csv", "csv.gz")]
+
+# Create empty files <base>.<ext> for a new timestamped base in OUTPUT_DIR
+# and return the base. Scans started in the same second get _2, _3, ...
+# suffixes instead of sharing files.
+def _reserve_export_base(exts, prefix):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_path = os.path.join(OUTPUT_DIR, f"bac0_scan_{timestamp}.csv")
-    with open(csv_path, "w", newline="") as f:
-        fieldnames = [
-            "device_ip",
-            "device_instance",
-            "vendorName",
-            "network_number",
-            "location",
-            "modelName",
-            "object_instance",
-            "objectName",
-            "description",
-            "presentValue",
-            "units",
-            "object_type",
-            "outOfService"
-        ]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for device in results:
-            row = {key: device.get(key, "") for key in fieldnames}
-            writer.writerow(row)
-    return csv_path
+    n = 1
+    while True:
+        base = os.path.join(OUTPUT_DIR, f"{prefix}_{timestamp}" + (f"_{n}" if n > 1 else ""))
+        created = []
+        try:
+            for ext in exts:
+                os.close(os.open(f"{base}.{ext}", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                created.append(f"{base}.{ext}")
+            return base
+        except FileExistsError:
+            for path in created:
+                os.remove(path)
+            n += 1
+
+# New timestamped path in OUTPUT_DIR, e.g. bac0_scan_20240101_120000.csv
+# (created empty, so no other scan gets it)
+def new_export_path(ext, prefix="bac0_scan"):
+    return f"{_reserve_export_base([ext], prefix)}.{ext}"
+
+def new_export_paths(formats, prefix="bac0_scan"):
+    """{format: path} for one scan's new result files, all with the same timestamp."""
+    base = _reserve_export_base([EXPORT_EXTENSIONS[fmt] for fmt in formats], prefix)
+    return {fmt: f"{base}.{EXPORT_EXTENSIONS[fmt]}" for fmt in formats}
+
+def export_base(path):
+    """Result path without its export extension (bac0_scan_X.csv.gz -> bac0_scan_X)."""
+    for ext in sorted(EXPORT_EXTENSIONS.values(), key=len, reverse=True):
+        if path.endswith("." + ext):
+            return path[:-len(ext) - 1]
+    return os.path.splitext(path)[0]
+
+def read_csv_rows(path):
+    """Stream the rows of a scan CSV (plain or gzipped) as dicts."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="") as f:
+        yield from csv.DictReader(f)
+
+class _StreamWriter:
+    """
+    Writes rows to a result file and flushes after every write. A new file
+    is started unless append is set (resuming a scan into its old files).
+    """
+
+    # How a resumed scan carries on with the file: "truncate" cuts it back to
+    # the last checkpoint and appends, "upsert" writes re-read rows over the
+    # old ones, "rewrite" starts it over from the scan CSV
+    resume_mode = "truncate"
+
+    def __init__(self, path, append=False):
+        self.path = os.path.abspath(path)
+        self.append = append
+        self.rows = 0
+        self._open()
+        ACTIVE_EXPORTS.add(self.path)
+
+    def _open(self):
+        self._f = open(self.path, "a" if self.append else "w", newline="")
+        self._new_file = self._f.tell() == 0
+
+    def _flush(self):
+        self._f.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._write(row)
+            self.rows += 1
+        self._flush()
+
+    def write_row(self, row):
+        self.write_rows([row])
+
+    def close(self):
+        ACTIVE_EXPORTS.discard(self.path)
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
+class CsvStreamWriter(_StreamWriter):
+    """CSV writer for scan rows; the header is only written to a new file."""
+
+    def __init__(self, path, fieldnames=None, append=False):
+        super().__init__(path, append)
+        self.fieldnames = fieldnames or CSV_FIELDNAMES
+        self._writer = csv.DictWriter(self._f, fieldnames=self.fieldnames)
+        if self._new_file:
+            self._writer.writeheader()
+            self._flush()
+
+    def _write(self, row):
+        self._writer.writerow({key: row.get(key, "") for key in self.fieldnames})
+
+class GzipCsvStreamWriter(CsvStreamWriter):
+    """
+    Gzipped CSV writer. Each batch of rows (split at GZIP_MEMBER_BYTES) is
+    compressed as its own gzip member; a multi-member file is still one
+    valid .csv.gz, so it can be downloaded while it grows and cut back to
+    any batch on resume.
+    """
+
+    def _open(self):
+        self._raw = open(self.path, "ab" if self.append else "wb")
+        self._new_file = self._raw.tell() == 0
+        self._f = io.StringIO()
+
+    def _write(self, row):
+        super()._write(row)
+        if self._f.tell() >= GZIP_MEMBER_BYTES:
+            self._flush()
+
+    def _flush(self):
+        data = self._f.getvalue()
+        if data:
+            self._raw.write(gzip.compress(data.encode("utf-8"), compresslevel=6))
+            self._raw.flush()
+            self._f.seek(0)
+            self._f.truncate()
+
+    def close(self):
+        self._flush()
+        self._raw.close()
+        super().close()
+
+class NdjsonStreamWriter(_StreamWriter):
+    """Newline-delimited JSON writer for scan rows (one object per line)."""
+
+    def _write(self, row):
+        self._f.write(json.dumps(row, default=str) + "\n")
+
+SQLITE_EXPORT_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS devices (
+    device_instance INTEGER PRIMARY KEY,
+    device_ip TEXT,
+    network_number TEXT,
+    vendorName TEXT,
+    modelName TEXT,
+    location TEXT
+);
+CREATE TABLE IF NOT EXISTS objects (
+    device_instance INTEGER NOT NULL REFERENCES devices,
+    object_type TEXT NOT NULL,
+    object_instance INTEGER NOT NULL,
+    objectName TEXT,
+    description TEXT,
+    presentValue,
+    units TEXT,
+    outOfService INTEGER,
+    PRIMARY KEY (device_instance, object_type, object_instance)
+) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS points AS
+    SELECT {", ".join(CSV_FIELDNAMES)} FROM objects JOIN devices USING (device_instance);
+"""
+SQLITE_DEVICE_COLUMNS = ["device_instance", "device_ip", "network_number"] + DEVICE_PROPS
+SQLITE_OBJECT_COLUMNS = ["device_instance", "object_type", "object_instance"] + OBJECT_PROPS
+
+# Values SQLite can store as they are; anything else is stored as text
+def _sqlite_value(value):
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+class SqliteStreamWriter(_StreamWriter):
+    """
+    Normalized SQLite export: one devices row per device and one objects row
+    per point, instead of repeating the device columns on every point. The
+    points view joins them back into the CSV's shape. Rows are upserted, so
+    a resumed scan re-reading a device replaces its rows. Each batch is one
+    transaction.
+    """
+
+    resume_mode = "upsert"
+
+    def _open(self):
+        if not self.append:
+            open(self.path, "wb").close()
+        self._f = sqlite3.connect(self.path)
+        self._f.executescript(SQLITE_EXPORT_SCHEMA)
+        self._devices = set()
+
+    def _flush(self):
+        self._f.commit()
+
+    def _write(self, row):
+        instance = row.get("device_instance")
+        if instance is None:
+            return
+        if instance not in self._devices:
+            self._devices.add(instance)
+            self._f.execute(
+                f"INSERT OR REPLACE INTO devices ({', '.join(SQLITE_DEVICE_COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(SQLITE_DEVICE_COLUMNS))})",
+                [_sqlite_value(row.get(c)) for c in SQLITE_DEVICE_COLUMNS],
+            )
+        if row.get("object_type") is not None:
+            self._f.execute(
+                f"INSERT OR REPLACE INTO objects ({', '.join(SQLITE_OBJECT_COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(SQLITE_OBJECT_COLUMNS))})",
+                [_sqlite_value(row.get(c)) for c in SQLITE_OBJECT_COLUMNS],
+            )
+
+# Parquet columns stored as integers; the rest are strings (presentValue
+# mixes numbers and states)
+PARQUET_INT_FIELDS = {"device_instance", "object_instance"}
+
+def _parquet_value(name, value):
+    if value is None or value == "":
+        return None
+    if name in PARQUET_INT_FIELDS:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return str(value)
+
+class ParquetStreamWriter(_StreamWriter):
+    """
+    Parquet export of the CSV columns (needs pyarrow). Rows are buffered
+    column by column and written as row groups of PARQUET_ROW_GROUP rows;
+    the file is only readable once closed, and can't be appended to, so a
+    resumed scan rewrites it from the CSV.
+    """
+
+    resume_mode = "rewrite"
+
+    def __init__(self, path, fieldnames=None, append=False):
+        self.fieldnames = fieldnames or CSV_FIELDNAMES
+        super().__init__(path, append)
+
+    def _open(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        self._pa = pyarrow
+        self._schema = pyarrow.schema([
+            (name, pyarrow.int64() if name in PARQUET_INT_FIELDS else pyarrow.string())
+            for name in self.fieldnames
+        ])
+        self._f = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        self._columns = {name: [] for name in self.fieldnames}
+        self._buffered = 0
+
+    def _write(self, row):
+        for name, column in self._columns.items():
+            column.append(_parquet_value(name, row.get(name)))
+        self._buffered += 1
+        if self._buffered >= PARQUET_ROW_GROUP:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if self._buffered:
+            self._f.write_table(self._pa.Table.from_pydict(self._columns, schema=self._schema))
+            self._columns = {name: [] for name in self.fieldnames}
+            self._buffered = 0
+
+    def _flush(self):
+        pass  # row groups are written when full
+
+    def close(self):
+        self._write_row_group()
+        super().close()
+
+EXPORT_WRITERS = {
+    "csv": CsvStreamWriter,
+    "csv.gz": GzipCsvStreamWriter,
+    "ndjson": NdjsonStreamWriter,
+    "sqlite": SqliteStreamWriter,
+    "parquet": ParquetStreamWriter,
+}
+
+# Export scan results to a file in one of the EXPORT_WRITERS formats and return its path
+def export_results(results, fmt="csv"):
+    path = new_export_paths([fmt])[fmt]
+    with EXPORT_WRITERS[fmt](path) as writer:
+        writer.write_rows(results)
+    return path
+
+# Export scan results to a CSV file and return the file path
+def export_to_csv(results):
+    return export_results(results, "csv")
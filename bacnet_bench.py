@@ -0,0 +1,196 @@
+"""
+Benchmark bacnet_scan, bacnet_quick_scan and the result exports against the
+simulated BACnet network in bacnet_sim, so scan performance can be measured
+(and checked in CI) without hardware.
+
+    python bacnet_bench.py --devices 50 --objects 200 --latency 0.01
+    python bacnet_bench.py --json bench.json
+    python bacnet_bench.py --compare bench.json --tolerance 0.25
+    python bacnet_bench.py --only scan,export --export-formats csv.gz,sqlite,parquet
+
+Each benchmark reports wall time, BACnet requests sent and peak Python
+memory (tracemalloc). --compare exits non-zero if wall time or request count
+grew by more than --tolerance over a saved --json run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS = ["scan", "quick", "export"]
+
+# Wall time differences below this are noise, whatever the percentage
+WALL_NOISE_S = 0.05
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BACnet scanner against a simulated network.")
+    parser.add_argument("--devices", type=int, default=20, help="simulated devices (default 20)")
+    parser.add_argument("--objects", type=int, default=100, help="objects per device (default 100)")
+    parser.add_argument("--networks", type=int, default=1, help="BACnet networks to spread devices over")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per request (default 0.005)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="chance a request is dropped (0-1)")
+    parser.add_argument("--rpm", type=float, default=1.0, help="share of devices supporting ReadPropertyMultiple (0-1)")
+    parser.add_argument("--segmentation", type=float, default=1.0, help="share of devices supporting segmentation (0-1)")
+    parser.add_argument("--max-apdu", type=int, default=1476, help="max APDU length of the devices")
+    parser.add_argument("--max-concurrent", type=int, default=None, help="scanner's global read cap")
+    parser.add_argument("--per-device", type=int, default=None, help="scanner's per-device read cap")
+    parser.add_argument("--read-timeout", type=float, default=1.0,
+                        help="scanner's read timeout; dropped requests wait this long (default 1)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="deep scan twice with the device cache and time the warm run")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated subset of " + ", ".join(BENCHMARKS))
+    parser.add_argument("--export-formats", default="csv",
+                        help="formats for the export benchmark: csv, csv.gz, ndjson, sqlite, parquet (default csv)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results (from --json) to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression for --compare (default 0.25)")
+    return parser.parse_args(argv)
+
+# Run fn() under tracemalloc; returns (value, seconds, peak bytes)
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        value = fn()
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return value, elapsed, peak
+
+def new_network(args):
+    from bacnet_sim import SimulatedBacnet
+    return SimulatedBacnet(
+        devices=args.devices, objects=args.objects, latency=args.latency, jitter=args.jitter,
+        loss=args.loss, rpm=args.rpm, segmentation=args.segmentation, max_apdu=args.max_apdu,
+        networks=args.networks, seed=args.seed,
+    )
+
+def run_benchmarks(args):
+    # Imported here so the results dir override below applies
+    import bac0_scan
+    from scan_metrics import ScanMetrics
+
+    bac0_scan.READ_TIMEOUT_MAX = args.read_timeout
+    bac0_scan.READ_TIMEOUT_MIN = min(bac0_scan.READ_TIMEOUT_MIN, args.read_timeout)
+    only = [name.strip() for name in args.only.split(",") if name.strip()]
+    for fmt in args.export_formats.split(","):
+        bac0_scan.export_formats(fmt)  # ValueError for unknown formats or Parquet without pyarrow
+    scan_opts = dict(
+        max_concurrent=args.max_concurrent, per_device=args.per_device,
+        quiet_period=0.5, max_wait=10 + args.latency * 10,
+    )
+    results = []
+    rows = None
+
+    def record(name, sim, metrics, elapsed, peak, rows_out):
+        summary = metrics.finish() if metrics is not None else {}
+        result = {
+            "name": name,
+            "wall_s": round(elapsed, 3),
+            "requests": sim.stats["read"] + sim.stats["rpm"] if sim else 0,
+            "reads": sim.stats["read"] if sim else 0,
+            "rpm": sim.stats["rpm"] if sim else 0,
+            "lost": sim.stats["lost"] if sim else 0,
+            "timeouts": summary.get("timeouts", 0),
+            "max_in_flight": sim.stats["max_in_flight"] if sim else 0,
+            "rows": rows_out,
+            "peak_mb": round(peak / 1e6, 2),
+        }
+        results.append(result)
+        print(
+            f"{name:<14} {result['wall_s']:>8.3f} s  {result['requests']:>7} requests "
+            f"({result['rpm']} RPM, {result['lost']} lost)  {rows_out:>7} rows  {result['peak_mb']:>7.2f} MB",
+            flush=True,
+        )
+
+    if "scan" in only or "export" in only:
+        sim = new_network(args)
+        metrics = ScanMetrics()
+        rows, elapsed, peak = measure(lambda: asyncio.run(bac0_scan.bacnet_scan(
+            "127.0.0.1/8", bacnet=sim, metrics=metrics, incremental=args.incremental, **scan_opts
+        )))
+        if "scan" in only:
+            record("scan", sim, metrics, elapsed, peak, len(rows))
+        if args.incremental and "scan" in only:
+            sim.stats.update(read=0, rpm=0, lost=0, max_in_flight=0)
+            metrics = ScanMetrics()
+            warm, elapsed, peak = measure(lambda: asyncio.run(bac0_scan.bacnet_scan(
+                "127.0.0.1/8", bacnet=sim, metrics=metrics, incremental=True, **scan_opts
+            )))
+            record("scan (warm)", sim, metrics, elapsed, peak, len(warm))
+
+    if "quick" in only:
+        sim = new_network(args)
+        metrics = ScanMetrics()
+        devices, elapsed, peak = measure(lambda: asyncio.run(bac0_scan.bacnet_quick_scan(
+            "127.0.0.1/8", bacnet=sim, metrics=metrics, **scan_opts
+        )))
+        record("quick", sim, metrics, elapsed, peak, len(devices))
+
+    if "export" in only:
+        # The CSV export keeps the plain "export" name so older baselines still compare
+        for fmt in [f.strip() for f in args.export_formats.split(",") if f.strip()]:
+            path, elapsed, peak = measure(lambda: bac0_scan.export_results(rows, fmt))
+            size_mb = round(os.path.getsize(path) / 1e6, 2)
+            os.remove(path)
+            record("export" if fmt == "csv" else f"export {fmt}", None, None, elapsed, peak, len(rows))
+            results[-1]["size_mb"] = size_mb
+    return results
+
+# Regressions of a run against a baseline, as messages
+def compare(results, baseline, tolerance):
+    before = {r["name"]: r for r in baseline.get("results", [])}
+    problems = []
+    for result in results:
+        old = before.get(result["name"])
+        if not old:
+            continue
+        for key in ("wall_s", "requests"):
+            if key == "wall_s" and result[key] - old[key] < WALL_NOISE_S:
+                continue
+            if old[key] and result[key] > old[key] * (1 + tolerance):
+                problems.append(
+                    f"{result['name']}: {key} {result[key]} vs baseline {old[key]} "
+                    f"(+{(result[key] / old[key] - 1) * 100:.0f}%)"
+                )
+    return problems
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Keep the device cache and exports away from real scan results
+    results_dir = tempfile.mkdtemp(prefix="ttt_bench_")
+    os.environ["TTT_RESULTS_DIR"] = results_dir
+    os.environ.setdefault("BACNET_CACHE_PATH", os.path.join(results_dir, "bacnet_cache.sqlite3"))
+    print(
+        f"{args.devices} devices x {args.objects} objects, latency {args.latency}s "
+        f"(+{args.jitter}s), loss {args.loss}, RPM {args.rpm}, segmentation {args.segmentation}, "
+        f"max APDU {args.max_apdu}",
+        flush=True,
+    )
+    try:
+        results = run_benchmarks(args)
+    finally:
+        shutil.rmtree(results_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print("REGRESSION", problem)
+        if problems:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
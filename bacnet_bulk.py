@@ -0,0 +1,208 @@
+import asyncio
+import csv
+import io
+import os
+import time
+
+from BAC0.core.io.IOExceptions import UnrecognizedService
+from bac0_scan import ReadLimiter, _read_objects
+
+# Most items accepted in one bulk request
+BULK_MAX_ITEMS = int(os.environ.get("BACNET_BULK_MAX_ITEMS", "5000"))
+# Writes per WritePropertyMultiple request; a failed batch is retried item by item
+WPM_BATCH = 16
+
+# Column names accepted for each item field (a bac0_scan CSV works as is)
+ITEM_COLUMNS = {
+    "device_ip": ("device_ip", "address", "device"),
+    "device_instance": ("device_instance",),
+    "object_type": ("object_type",),
+    "object_instance": ("object_instance",),
+    "property": ("property",),
+    "value": ("value", "write_value"),
+    "priority": ("priority",),
+}
+
+# Device addresses that rejected WritePropertyMultiple
+_WPM_UNSUPPORTED = set()
+
+def _field(row, name):
+    for column in ITEM_COLUMNS[name]:
+        value = row.get(column)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+def parse_items(rows, need_value=False, default_priority=None):
+    """
+    Bulk items from dicts (JSON objects or CSV rows). Returns (items, errors).
+
+    Each item is {device_ip, device_instance, object_type, object_instance,
+    property, value, priority}; property defaults to presentValue. For
+    writes every item needs a value ("null" relinquishes the priority) and
+    priority must be 1-16. BAC0 splits requests on whitespace, so no text
+    field (value included) may contain any.
+    """
+    items, errors = [], []
+    for n, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append(f"Item {n}: expected an object")
+            continue
+        item = {name: _field(row, name) for name in ITEM_COLUMNS}
+        item["property"] = item["property"] or "presentValue"
+        item["priority"] = item["priority"] or default_priority
+        missing = [k for k in ("device_ip", "object_type", "object_instance") if not item[k]]
+        if need_value and item["value"] is None:
+            missing.append("value")
+        if missing:
+            errors.append(f"Item {n}: missing {', '.join(missing)}")
+            continue
+        spaced = [
+            k for k in ("device_ip", "object_type", "property", "value")
+            if item[k] is not None and len(item[k].split()) > 1
+        ]
+        if spaced:
+            errors.append(f"Item {n}: {', '.join(spaced)} can't contain spaces")
+            continue
+        try:
+            item["object_instance"] = int(item["object_instance"])
+            if item["device_instance"] is not None:
+                item["device_instance"] = int(item["device_instance"])
+            if item["priority"] is not None:
+                item["priority"] = int(item["priority"])
+        except ValueError:
+            errors.append(f"Item {n}: object_instance, device_instance and priority must be numbers")
+            continue
+        if item["priority"] is not None and not 1 <= item["priority"] <= 16:
+            errors.append(f"Item {n}: priority must be 1-16")
+            continue
+        items.append(item)
+        if len(items) > BULK_MAX_ITEMS:
+            errors.append(f"At most {BULK_MAX_ITEMS} items per request")
+            return items[:BULK_MAX_ITEMS], errors
+    return items, errors
+
+def items_from_csv(text, **options):
+    """parse_items() for CSV text with a header row."""
+    return parse_items(csv.DictReader(io.StringIO(text)), **options)
+
+def _summary(results, started):
+    ok = sum(1 for r in results if r["ok"])
+    return {
+        "items": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "devices": len({r["device_ip"] for r in results}),
+        "elapsed": round(time.monotonic() - started, 2),
+    }
+
+# Max APDU per device from the items' device instances (None: scanner default)
+async def _max_apdus(bacnet, limiter, items):
+    instances = {}
+    for item in items:
+        if item["device_instance"] is not None:
+            instances.setdefault(item["device_ip"], item["device_instance"])
+    values = await asyncio.gather(*[
+        limiter.read(bacnet, device_ip, f"{device_ip} device {instance} maxApduLengthAccepted")
+        for device_ip, instance in instances.items()
+    ])
+    return dict(zip(instances, values))
+
+async def bulk_read(bacnet, items, max_concurrent=None, per_device=None, metrics=None):
+    """
+    Read every item's property. Items are grouped by device and property and
+    sent as APDU-sized ReadPropertyMultiple batches (single reads for devices
+    without RPM), all devices in parallel under the read caps. Returns
+    {"results": [item + ok/value/error, ...] in input order, "summary": {...}}.
+    """
+    started = time.monotonic()
+    limiter = ReadLimiter(max_concurrent, per_device, metrics)
+    max_apdus = await _max_apdus(bacnet, limiter, items)
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault((item["device_ip"], item["property"]), []).append(i)
+
+    results = [None] * len(items)
+
+    async def read_group(device_ip, prop, indices):
+        objects = [(items[i]["object_type"], items[i]["object_instance"]) for i in indices]
+        try:
+            values = await _read_objects(bacnet, limiter, device_ip, objects, [prop], max_apdus.get(device_ip))
+        except Exception as e:
+            values = [{prop: None}] * len(indices)
+            error = str(e)
+        else:
+            error = "No value (unknown object or property, or no response)"
+        for i, value in zip(indices, values):
+            value = value.get(prop)
+            results[i] = dict(
+                items[i], ok=value is not None,
+                value=None if value is None else str(value),
+                error=None if value is not None else error,
+            )
+
+    await asyncio.gather(*[
+        read_group(device_ip, prop, indices) for (device_ip, prop), indices in groups.items()
+    ])
+    return {"results": results, "summary": _summary(results, started)}
+
+# BAC0 write request for an item: "<address> <type> <instance> <property> <value> - <priority>"
+def _write_args(item, with_address=True):
+    args = f"{item['object_type']} {item['object_instance']} {item['property']} {item['value']}"
+    if item["priority"] is not None:
+        args += f" - {item['priority']}"
+    return f"{item['device_ip']} {args}" if with_address else args
+
+async def bulk_write(bacnet, items, max_concurrent=None, per_device=None, metrics=None):
+    """
+    Write every item's value (at its priority, if given). Each device gets
+    WritePropertyMultiple batches of WPM_BATCH items; a batch that fails, or
+    a device without WPM, is written item by item so each item gets its own
+    result. Devices are written in parallel under the request caps. Returns
+    the same shape as bulk_read.
+    """
+    started = time.monotonic()
+    limiter = ReadLimiter(max_concurrent, per_device, metrics)
+    by_device = {}
+    for i, item in enumerate(items):
+        by_device.setdefault(item["device_ip"], []).append(i)
+
+    results = [None] * len(items)
+
+    async def write_one(i):
+        try:
+            await limiter.write(bacnet, items[i]["device_ip"], _write_args(items[i]))
+            results[i] = dict(items[i], ok=True, error=None)
+        except Exception as e:
+            results[i] = dict(items[i], ok=False, error=f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+
+    # The first batch goes alone so a device without WPM rejects it once,
+    # not once per batch, before the rest fan out
+    async def write_device(device_ip, indices):
+        batches = [indices[start:start + WPM_BATCH] for start in range(0, len(indices), WPM_BATCH)]
+        if len(batches) > 1 and device_ip not in _WPM_UNSUPPORTED:
+            await write_batch(device_ip, batches[0])
+            batches = batches[1:]
+        await asyncio.gather(*[write_batch(device_ip, batch) for batch in batches])
+
+    async def write_batch(device_ip, batch):
+        if len(batch) > 1 and device_ip not in _WPM_UNSUPPORTED:
+            try:
+                await limiter.write_multiple(
+                    bacnet, device_ip, [_write_args(items[i], with_address=False) for i in batch]
+                )
+                for i in batch:
+                    results[i] = dict(items[i], ok=True, error=None)
+                return
+            except UnrecognizedService:
+                if device_ip not in _WPM_UNSUPPORTED:
+                    print(f"WPM not supported by {device_ip}; using single writes")
+                    _WPM_UNSUPPORTED.add(device_ip)
+            except Exception:
+                pass  # find out which item failed
+        await asyncio.gather(*[write_one(i) for i in batch])
+
+    await asyncio.gather(*[
+        write_device(device_ip, indices) for device_ip, indices in by_device.items()
+    ])
+    return {"results": results, "summary": _summary(results, started)}
@@ -0,0 +1,135 @@
+import datetime
+import os
+import sqlite3
+
+from results_dir import OUTPUT_DIR
+
+# Default cache location, next to the scan CSVs
+CACHE_PATH = os.environ.get("BACNET_CACHE_PATH", os.path.join(OUTPUT_DIR, "bacnet_cache.sqlite3"))
+
+# Object properties that only change when the device database changes
+STATIC_OBJECT_PROPS = ["objectName", "description", "units"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device_instance INTEGER NOT NULL,
+    device_ip TEXT NOT NULL,
+    database_revision TEXT NOT NULL,
+    vendorName TEXT,
+    modelName TEXT,
+    location TEXT,
+    max_apdu INTEGER,
+    updated TEXT,
+    PRIMARY KEY (device_instance, device_ip)
+);
+CREATE TABLE IF NOT EXISTS objects (
+    device_instance INTEGER NOT NULL,
+    device_ip TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    object_type TEXT NOT NULL,
+    object_instance INTEGER NOT NULL,
+    objectName TEXT,
+    description TEXT,
+    units TEXT,
+    PRIMARY KEY (device_instance, device_ip, position)
+);
+"""
+
+# Store None as NULL and everything else as its display string
+def _text(value):
+    return None if value is None else str(value)
+
+class DeviceCache:
+    """
+    On-disk cache of device info and static object properties.
+
+    Entries are keyed by device instance and address, and are only valid
+    while the device reports the same databaseRevision it had when cached.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CACHE_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, device_instance, device_ip, database_revision):
+        """Return (device_info, max_apdu, objects) or None if missing/stale."""
+        if database_revision is None:
+            return None
+        row = self.conn.execute(
+            "SELECT database_revision, vendorName, modelName, location, max_apdu "
+            "FROM devices WHERE device_instance = ? AND device_ip = ?",
+            (int(device_instance), device_ip),
+        ).fetchone()
+        if row is None or row[0] != str(database_revision):
+            return None
+        device_info = {"vendorName": row[1], "modelName": row[2], "location": row[3]}
+        objects = [
+            {
+                "object_type": obj_type,
+                "object_instance": obj_instance,
+                "objectName": name,
+                "description": description,
+                "units": units,
+            }
+            for obj_type, obj_instance, name, description, units in self.conn.execute(
+                "SELECT object_type, object_instance, objectName, description, units "
+                "FROM objects WHERE device_instance = ? AND device_ip = ? ORDER BY position",
+                (int(device_instance), device_ip),
+            )
+        ]
+        return device_info, row[4], objects
+
+    def store(self, device_instance, device_ip, database_revision, device_info, max_apdu, rows):
+        """Replace the cached entry for a device with a freshly scanned one."""
+        if database_revision is None:
+            return
+        key = (int(device_instance), device_ip)
+        try:
+            max_apdu = int(max_apdu)
+        except (TypeError, ValueError):
+            max_apdu = None
+        with self.conn:
+            self.conn.execute("DELETE FROM objects WHERE device_instance = ? AND device_ip = ?", key)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (
+                    str(database_revision),
+                    _text(device_info.get("vendorName")),
+                    _text(device_info.get("modelName")),
+                    _text(device_info.get("location")),
+                    max_apdu,
+                    datetime.datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    key + (
+                        position,
+                        str(row["object_type"]),
+                        int(row["object_instance"]),
+                    ) + tuple(_text(row.get(prop)) for prop in STATIC_OBJECT_PROPS)
+                    for position, row in enumerate(rows)
+                ],
+            )
+
+    def forget(self, device_instance=None):
+        """Drop one device (or everything) so the next scan re-reads it."""
+        with self.conn:
+            if device_instance is None:
+                self.conn.execute("DELETE FROM objects")
+                self.conn.execute("DELETE FROM devices")
+            else:
+                self.conn.execute("DELETE FROM objects WHERE device_instance = ?", (int(device_instance),))
+                self.conn.execute("DELETE FROM devices WHERE device_instance = ?", (int(device_instance),))
@@ -0,0 +1,235 @@
+import asyncio
+import atexit
+import os
+import threading
+import time
+
+import BAC0
+
+from bac0_scan import set_stack_limit
+
+# Seconds to let a new BAC0 stack settle before it takes requests
+BACNET_STARTUP_DELAY = float(os.environ.get("BACNET_STARTUP_DELAY", "1"))
+# Foreign-device registration lifetime when a stack joins a remote BBMD (seconds)
+BACNET_BBMD_TTL = int(os.environ.get("BACNET_BBMD_TTL", "900"))
+# Requests in flight on one shared stack, across every scan, bulk job and poller using it
+BACNET_STACK_MAX_CONCURRENT = int(os.environ.get(
+    "BACNET_STACK_MAX_CONCURRENT", os.environ.get("BACNET_MAX_CONCURRENT_READS", "16")
+))
+
+def new_stack(ip_with_mask, udp_port, bbmd=None):
+    """Start a BAC0.lite stack, registered as a foreign device with bbmd ("ip:port") if given."""
+    if bbmd:
+        return BAC0.lite(ip=ip_with_mask, port=udp_port, bbmdAddress=bbmd, bbmdTTL=BACNET_BBMD_TTL)
+    return BAC0.lite(ip=ip_with_mask, port=udp_port)
+
+class BacnetService:
+    """
+    One long-lived BAC0 stack bound to (ip_with_mask, udp_port), optionally
+    registered as a foreign device with a BBMD.
+
+    The stack lives on its own thread and event loop. Callers hand it work as
+    coroutine functions taking the BAC0 instance; these are queued onto the
+    service loop, so any number of scans and reads share the one UDP socket.
+    Their ReadLimiters share max_concurrent request slots on top of their own caps.
+    """
+
+    def __init__(self, ip_with_mask, udp_port, bbmd=None, max_concurrent=None):
+        self.ip_with_mask = ip_with_mask
+        self.udp_port = udp_port
+        self.bbmd = bbmd
+        self.max_concurrent = max_concurrent or BACNET_STACK_MAX_CONCURRENT
+        self.bacnet = None
+        self.started = None
+        self.requests = 0
+        self.active = 0
+        self.errors = 0
+        self.last_error = None
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, timeout=30):
+        self._thread = threading.Thread(
+            target=self._run_loop, name=f"bacnet-{self.udp_port}", daemon=True
+        )
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise RuntimeError("BACnet stack did not start in time")
+        if self.bacnet is None:
+            raise RuntimeError(f"BACnet stack failed to start: {self.last_error}")
+        return self
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._start_stack())
+        except Exception as e:
+            self.last_error = str(e)
+            print("BACnet stack failed to start:", e)
+        self._ready.set()
+        if self.bacnet is not None:
+            self._loop.run_forever()
+        self._loop.close()
+
+    async def _start_stack(self):
+        # Start BAC0 with the given IP/mask and UDP port
+        self.bacnet = new_stack(self.ip_with_mask, self.udp_port, self.bbmd)
+        set_stack_limit(self.bacnet, self.max_concurrent)
+        await asyncio.sleep(BACNET_STARTUP_DELAY)  # Allow BAC0 to initialize
+        self.started = time.time()
+
+    async def _call(self, func):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+        try:
+            return await func(self.bacnet)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self.last_error = str(e)
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def submit(self, func):
+        """Queue func(bacnet) on the service loop; returns a concurrent Future."""
+        if not self.running:
+            raise RuntimeError("BACnet service is not running")
+        return asyncio.run_coroutine_threadsafe(self._call(func), self._loop)
+
+    def run(self, func, timeout=None):
+        """Run func(bacnet) on the service loop and wait for its result."""
+        return self.submit(func).result(timeout)
+
+    @property
+    def running(self):
+        return (
+            self.bacnet is not None
+            and self._loop is not None
+            and self._loop.is_running()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def health(self):
+        return {
+            "ip": self.ip_with_mask,
+            "udp_port": self.udp_port,
+            "bbmd": self.bbmd,
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "uptime": round(time.time() - self.started, 1) if self.started else 0,
+            "requests": self.requests,
+            "active": self.active,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "devices_known": len(getattr(self.bacnet, "discoveredDevices", None) or {}),
+        }
+
+    def shutdown(self, timeout=10):
+        if self._loop is None or not self._loop.is_running():
+            return
+
+        async def stop():
+            # Cancel in-flight work, then disconnect the stack
+            current = asyncio.current_task()
+            for task in asyncio.all_tasks():
+                if task is not current:
+                    task.cancel()
+            try:
+                self.bacnet.disconnect()  # Properly disconnect BAC0 instance
+            except Exception as e:
+                print("BACnet disconnect failed:", e)
+
+        try:
+            asyncio.run_coroutine_threadsafe(stop(), self._loop).result(timeout)
+        except Exception as e:
+            print("BACnet service shutdown:", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self.bacnet = None
+
+class BacnetServices:
+    """
+    Registry of running BacnetService instances, one per (interface, UDP port).
+
+    Long-running users of a service (e.g. the trend poller) can subscribe
+    with on_replace(callback); callback(old, new) is called after a service
+    is replaced, with new=None if the replacement failed to start.
+    """
+
+    def __init__(self):
+        self._services = {}
+        self._starting = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown_all)
+
+    def on_replace(self, callback):
+        self._listeners.append(callback)
+
+    def _replaced(self, old, new):
+        for callback in self._listeners:
+            try:
+                callback(old, new)
+            except Exception as e:
+                print("BACnet service replace callback failed:", e)
+
+    def get(self, iface, ip_with_mask, udp_port, bbmd=None):
+        """Return the running service for (iface, port), starting or restarting it as needed."""
+        key = (iface, udp_port)
+        # Stacks are started and stopped under a per-key lock, so a slow start
+        # doesn't block other interfaces or health()
+        with self._lock:
+            key_lock = self._starting.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                service = self._services.get(key)
+            if service is not None and (
+                service.ip_with_mask == ip_with_mask and service.bbmd == bbmd and service.running
+            ):
+                return service
+            # Interface address or BBMD changed, or stack died: replace it
+            old = service
+            if old is not None:
+                with self._lock:
+                    self._services.pop(key, None)
+                old.shutdown()
+            try:
+                service = BacnetService(ip_with_mask, udp_port, bbmd).start()
+            except Exception:
+                if old is not None:
+                    self._replaced(old, None)
+                raise
+            with self._lock:
+                self._services[key] = service
+        if old is not None:
+            self._replaced(old, service)
+        return service
+
+    def health(self):
+        with self._lock:
+            return [
+                dict(service.health(), interface=iface)
+                for (iface, _), service in self._services.items()
+            ]
+
+    def shutdown(self, iface, udp_port):
+        with self._lock:
+            service = self._services.pop((iface, udp_port), None)
+        if service is not None:
+            service.shutdown()
+
+    def shutdown_all(self):
+        with self._lock:
+            services = list(self._services.values())
+            self._services.clear()
+        for service in services:
+            service.shutdown()
@@ -0,0 +1,308 @@
+import asyncio
+import math
+import random
+
+from BAC0.core.io.IOExceptions import (
+    NoResponseFromController,
+    SegmentationNotSupported,
+    UnknownObjectError,
+    UnknownPropertyError,
+    UnrecognizedService,
+    WritePropertyException,
+)
+
+# Object types given to simulated devices, in round-robin order
+SIM_OBJECT_TYPES = ["analogInput", "analogValue", "binaryInput", "binaryValue", "multiStateValue"]
+# objectName prefix per type, so names are unique within a device
+SIM_NAME_PREFIXES = {
+    "analogInput": "AI", "analogValue": "AV", "binaryInput": "BI",
+    "binaryValue": "BV", "multiStateValue": "MSV",
+}
+SIM_VENDOR = "TTT Simulated Controls"
+
+# Properties clients may write; presentValue writes are commanded by priority
+SIM_WRITABLE = {"presentValue", "outOfService", "description"}
+
+# Rough encoded sizes (bytes) used to decide when an answer needs segmenting
+APDU_HEADER = 8
+OBJECT_HEADER = 8
+PROPERTY_OVERHEAD = 4
+OBJECT_ID_SIZE = 5
+
+class ErrorType:
+    """Inline per-property error in a ReadPropertyMultiple answer (as BAC0 returns it)."""
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __repr__(self):
+        return f"ErrorType({self.reason})"
+
+class SimDevice:
+    """One simulated BACnet device: identity, capabilities and its objects."""
+
+    def __init__(self, instance, address, network_number, objects, max_apdu=1476,
+                 segmentation=True, rpm=True, revision=1, rng=random):
+        self.rng = rng
+        self.instance = instance
+        self.address = address
+        self.network_number = network_number
+        self.max_apdu = max_apdu
+        self.segmentation = segmentation
+        self.rpm = rpm
+        self.properties = {
+            "objectName": f"SIM-DEV-{instance}",
+            "vendorName": SIM_VENDOR,
+            "modelName": f"SIM-{len(objects)}",
+            "location": f"Floor {instance % 10}",
+            "databaseRevision": revision,
+            "maxApduLengthAccepted": max_apdu,
+            "segmentationSupported": "segmentedBoth" if segmentation else "noSegmentation",
+        }
+        self.objects = objects
+        self.object_list = [("device", instance)] + list(objects)
+        # (type, instance) -> {priority: value} for commanded presentValues
+        self.commands = {}
+        self.relinquish_default = {key: props["presentValue"] for key, props in objects.items()}
+
+    def value(self, obj_type, obj_instance, prop, arr_index=None):
+        """Property value; raises UnknownObjectError / UnknownPropertyError."""
+        if obj_type == "device":
+            if obj_instance != self.instance:
+                raise UnknownObjectError(f"device {obj_instance}")
+            if prop == "objectList":
+                if arr_index is None:
+                    return list(self.object_list)
+                if arr_index == 0:
+                    return len(self.object_list)
+                if 1 <= arr_index <= len(self.object_list):
+                    return self.object_list[arr_index - 1]
+                raise UnknownPropertyError(f"objectList[{arr_index}]")
+            props = self.properties
+        else:
+            props = self.objects.get((obj_type, obj_instance))
+            if props is None:
+                raise UnknownObjectError(f"{obj_type} {obj_instance}")
+        if prop not in props:
+            raise UnknownPropertyError(f"{obj_type} {obj_instance} {prop}")
+        value = props[prop]
+        if prop == "presentValue" and isinstance(value, float) and not self.commands.get((obj_type, obj_instance)):
+            # A little drift so repeated scans see live values change
+            props[prop] = value = round(value + self.rng.uniform(-0.5, 0.5), 2)
+        return value
+
+    def write(self, obj_type, obj_instance, prop, value, priority=None):
+        """Write a property; raises UnknownObjectError or WritePropertyException."""
+        key = (obj_type, obj_instance)
+        props = self.objects.get(key)
+        if props is None:
+            raise UnknownObjectError(f"{obj_type} {obj_instance}")
+        if prop not in SIM_WRITABLE:
+            raise WritePropertyException(f"writeAccessDenied: {obj_type} {obj_instance} {prop}")
+        if prop != "presentValue":
+            props[prop] = value.lower() == "true" if prop == "outOfService" else value
+            return
+        commands = self.commands.setdefault(key, {})
+        if value.lower() == "null":
+            commands.pop(priority or 16, None)
+        else:
+            try:
+                if obj_type.startswith("analog"):
+                    value = float(value)
+                elif obj_type.startswith("multiState"):
+                    value = int(value)
+            except ValueError:
+                raise WritePropertyException(f"invalidDataType: {value}")
+            commands[priority or 16] = value
+        props["presentValue"] = commands[min(commands)] if commands else self.relinquish_default[key]
+
+# Objects for a simulated device: analog points carry units, binary and
+# multi-state ones don't (so reads of units fail as on real devices)
+def _make_objects(count, instance, rng):
+    objects = {}
+    for i in range(count):
+        obj_type = SIM_OBJECT_TYPES[i % len(SIM_OBJECT_TYPES)]
+        obj_instance = i // len(SIM_OBJECT_TYPES)
+        props = {
+            "objectName": f"{SIM_NAME_PREFIXES[obj_type]}-{instance}-{obj_instance}",
+            "description": f"Simulated {obj_type} {obj_instance} on device {instance}",
+            "outOfService": False,
+        }
+        if obj_type.startswith("analog"):
+            props["presentValue"] = round(rng.uniform(15, 30), 2)
+            props["units"] = "degreesCelsius"
+        elif obj_type.startswith("binary"):
+            props["presentValue"] = rng.choice(["active", "inactive"])
+        else:
+            props["presentValue"] = rng.randint(1, 4)
+        objects[(obj_type, obj_instance)] = props
+    return objects
+
+def _encoded_size(value):
+    if isinstance(value, list):
+        return OBJECT_ID_SIZE * len(value)
+    if isinstance(value, tuple):
+        return OBJECT_ID_SIZE
+    return len(str(value)) + 2
+
+class SimulatedBacnet:
+    """
+    In-process stand-in for a BAC0 stack with devices simulated behind it.
+
+    Pass it as bacnet= to the bac0_scan functions. It answers Who-Is with
+    I-Ams, ReadProperty (with arr_index), ReadPropertyMultiple, WriteProperty
+    and WritePropertyMultiple the way BAC0 does, from `devices` devices with `objects` objects each:
+
+    - latency (+ up to jitter) seconds per request, multiplied by the number
+      of segments for answers larger than the device's max_apdu
+    - loss: chance a request (or I-Am) is dropped; the read then times out
+    - rpm: share of devices that support Read/WritePropertyMultiple
+    - segmentation: share of devices that can segment; the others reject
+      oversized answers with SegmentationNotSupported
+    - networks: devices beyond the first network sit behind a router and
+      get "<net>:<mac>" addresses and a network number
+
+    Request counts are kept in stats.
+    """
+
+    def __init__(self, devices=10, objects=100, latency=0.005, jitter=0.0, loss=0.0,
+                 rpm=1.0, segmentation=1.0, max_apdu=1476, networks=1, first_instance=1000,
+                 seed=0):
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.devices = {}
+        for n in range(devices):
+            instance = first_instance + n
+            network = n % max(1, networks)
+            if network == 0:
+                address, network_number = f"127.0.{1 + n // 250}.{1 + n % 250}", None
+            else:
+                address, network_number = f"{network + 1}:{n // networks + 1}", network + 1
+            self.devices[address] = SimDevice(
+                instance, address, network_number, _make_objects(objects, instance, self.random),
+                max_apdu=max_apdu,
+                segmentation=self.random.random() < segmentation,
+                rpm=self.random.random() < rpm,
+                rng=self.random,
+            )
+        self.discoveredDevices = {}
+        self.stats = {
+            "whois": 0, "read": 0, "rpm": 0, "write": 0, "wpm": 0,
+            "lost": 0, "segments": 0, "max_in_flight": 0,
+        }
+        self._in_flight = 0
+
+    def _device(self, address):
+        device = self.devices.get(address)
+        if device is None:
+            raise NoResponseFromController(f"No device at {address}")
+        return device
+
+    # Wait out one request: lost requests sleep until the caller's timeout
+    async def _exchange(self, device, size, timeout):
+        self._in_flight += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+        try:
+            if self.loss and self.random.random() < self.loss:
+                self.stats["lost"] += 1
+                await asyncio.sleep(timeout)
+                raise NoResponseFromController(f"Timeout reading {device.address}")
+            segments = max(1, math.ceil(size / device.max_apdu))
+            if segments > 1:
+                if not device.segmentation:
+                    raise SegmentationNotSupported(f"{device.address} can't segment {size} bytes")
+                self.stats["segments"] += segments
+            await asyncio.sleep(segments * (self.latency + self.random.uniform(0, self.jitter)))
+        finally:
+            self._in_flight -= 1
+
+    async def _answer_who_is(self, devices):
+        async def i_am(device):
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+            if self.loss and self.random.random() < self.loss:
+                self.stats["lost"] += 1
+                return
+            self.discoveredDevices[(device.address, device.instance)] = {
+                "object_instance": ("device", device.instance),
+                "address": device.address,
+                "network_number": device.network_number,
+            }
+
+        await asyncio.gather(*[i_am(device) for device in devices])
+
+    def discover(self, limits=None, global_broadcast=False, **kwargs):
+        """Who-Is; I-Ams fill discoveredDevices from a background task."""
+        self.stats["whois"] += 1
+        low, high = limits or (0, 4194303)
+        devices = [d for d in self.devices.values() if low <= d.instance <= high]
+        return asyncio.ensure_future(self._answer_who_is(devices))
+
+    async def read(self, request, arr_index=None, timeout=10, **kwargs):
+        """ReadProperty: "<address> <type> <instance> <property>"."""
+        self.stats["read"] += 1
+        address, obj_type, obj_instance, prop = request.split()[:4]
+        device = self._device(address)
+        try:
+            value = device.value(obj_type, int(obj_instance), prop, arr_index)
+        except (UnknownObjectError, UnknownPropertyError):
+            await self._exchange(device, APDU_HEADER, timeout)
+            raise
+        await self._exchange(device, APDU_HEADER + _encoded_size(value), timeout)
+        return value
+
+    async def readMultiple(self, request, timeout=10, **kwargs):
+        """ReadPropertyMultiple: "<address> <type> <instance> <prop> ... <type> <instance> ..."."""
+        self.stats["rpm"] += 1
+        tokens = request.split()
+        device = self._device(tokens[0])
+        if not device.rpm:
+            await self._exchange(device, APDU_HEADER, timeout)
+            raise UnrecognizedService(f"{device.address} does not support ReadPropertyMultiple")
+
+        values = []
+        size = APDU_HEADER
+        i = 1
+        while i < len(tokens):
+            obj_type, obj_instance = tokens[i], int(tokens[i + 1])
+            i += 2
+            size += OBJECT_HEADER
+            while i < len(tokens) and not (i + 1 < len(tokens) and tokens[i + 1].isdigit()):
+                try:
+                    value = device.value(obj_type, obj_instance, tokens[i])
+                except (UnknownObjectError, UnknownPropertyError) as e:
+                    value = ErrorType(str(e))
+                values.append(value)
+                size += PROPERTY_OVERHEAD + _encoded_size(value)
+                i += 1
+        await self._exchange(device, size, timeout)
+        return values
+
+    # "<type> <instance> <property> <value> [- <priority>]" -> write() args
+    def _apply_write(self, device, tokens):
+        obj_type, obj_instance, prop, value = tokens[:4]
+        priority = int(tokens[5]) if len(tokens) > 5 and tokens[4] == "-" else None
+        device.write(obj_type, int(obj_instance), prop, value, priority)
+
+    async def write(self, request, timeout=10, **kwargs):
+        """WriteProperty: "<address> <type> <instance> <property> <value> [- <priority>]"."""
+        self.stats["write"] += 1
+        tokens = request.split()
+        device = self._device(tokens[0])
+        await self._exchange(device, APDU_HEADER + len(request), timeout)
+        self._apply_write(device, tokens[1:])
+
+    async def writeMultiple(self, addr=None, args=None, timeout=10, **kwargs):
+        """WritePropertyMultiple; like a device, stops at the first failing write."""
+        self.stats["wpm"] += 1
+        device = self._device(addr)
+        if not device.rpm:
+            await self._exchange(device, APDU_HEADER, timeout)
+            raise UnrecognizedService(f"{device.address} does not support WritePropertyMultiple")
+        await self._exchange(device, APDU_HEADER + sum(len(a) for a in args), timeout)
+        for arg in args:
+            self._apply_write(device, arg.split())
+
+    def disconnect(self):
+        pass
@@ -0,0 +1,371 @@
+import asyncio
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from bac0_scan import ReadLimiter, _read_objects
+from results_dir import OUTPUT_DIR
+
+# Trend samples live next to the scan results
+TREND_PATH = os.environ.get("BACNET_TREND_PATH", os.path.join(OUTPUT_DIR, "bacnet_trend.sqlite3"))
+
+# Default poll interval for a point (seconds)
+TREND_DEFAULT_INTERVAL = float(os.environ.get("BACNET_TREND_INTERVAL", "60"))
+# An unchanged value is only written again after this many seconds
+TREND_HEARTBEAT = int(os.environ.get("BACNET_TREND_HEARTBEAT", "900"))
+# Raw samples are kept this long, then folded into TREND_ROLLUP_SECONDS
+# min/max/avg buckets, which are kept for TREND_ROLLUP_DAYS
+TREND_RAW_DAYS = float(os.environ.get("BACNET_TREND_RAW_DAYS", "2"))
+TREND_ROLLUP_SECONDS = int(os.environ.get("BACNET_TREND_ROLLUP_SECONDS", "300"))
+TREND_ROLLUP_DAYS = float(os.environ.get("BACNET_TREND_ROLLUP_DAYS", "90"))
+# How often the poller compacts the store (seconds)
+TREND_COMPACT_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    id INTEGER PRIMARY KEY,
+    device_instance INTEGER,
+    device_ip TEXT NOT NULL,
+    object_type TEXT NOT NULL,
+    object_instance INTEGER NOT NULL,
+    property TEXT NOT NULL DEFAULT 'presentValue',
+    interval REAL NOT NULL,
+    name TEXT,
+    created TEXT,
+    UNIQUE (device_ip, object_type, object_instance, property)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    point_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (point_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    point_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    min REAL,
+    max REAL,
+    avg REAL,
+    PRIMARY KEY (point_id, bucket)
+) WITHOUT ROWID;
+"""
+
+POINT_FIELDS = [
+    "id", "device_instance", "device_ip", "object_type", "object_instance",
+    "property", "interval", "name", "created",
+]
+
+# Binary/enumerated text values that trend as numbers
+_STATE_VALUES = {"active": 1.0, "inactive": 0.0, "true": 1.0, "false": 0.0}
+
+# Turn a BACnet value into a float, or None if it isn't trendable
+def _numeric(value):
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower() if value is not None else ""
+    if text in _STATE_VALUES:
+        return _STATE_VALUES[text]
+    try:
+        return float(text.split()[0])
+    except (IndexError, ValueError):
+        return None
+
+class TrendStore:
+    """
+    SQLite store for trended points.
+
+    Samples are (point, second, value) rows in a WITHOUT ROWID table keyed
+    by point and time, so a time-range query is one index range scan.
+    Unchanged values are only re-written every TREND_HEARTBEAT seconds, and
+    compact() folds old samples into min/max/avg rollups and drops data past
+    retention, keeping the file size bounded.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or TREND_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL with relaxed syncs: far fewer SD card writes per poll cycle
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def points(self):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(POINT_FIELDS)} FROM points ORDER BY id"
+            ).fetchall()
+        return [dict(zip(POINT_FIELDS, row)) for row in rows]
+
+    def get_point(self, point_id):
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(POINT_FIELDS)} FROM points WHERE id = ?", (int(point_id),)
+            ).fetchone()
+        return dict(zip(POINT_FIELDS, row)) if row else None
+
+    def add_point(self, device_ip, object_type, object_instance, prop="presentValue",
+                  interval=None, device_instance=None, name=None):
+        """Add (or update the interval/name of) a point; returns its id."""
+        interval = max(1.0, float(interval or TREND_DEFAULT_INTERVAL))
+        key = (device_ip, object_type, int(object_instance), prop)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO points (device_instance, device_ip, object_type, object_instance, "
+                "property, interval, name, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (device_ip, object_type, object_instance, property) "
+                "DO UPDATE SET interval = excluded.interval, "
+                "name = COALESCE(excluded.name, points.name), "
+                "device_instance = COALESCE(excluded.device_instance, points.device_instance)",
+                (
+                    None if device_instance in (None, "") else int(device_instance),
+                    *key, interval, name,
+                    datetime.datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+            return self.conn.execute(
+                "SELECT id FROM points WHERE device_ip = ? AND object_type = ? "
+                "AND object_instance = ? AND property = ?", key,
+            ).fetchone()[0]
+
+    def remove_point(self, point_id):
+        """Delete a point and all of its samples."""
+        with self._lock, self.conn:
+            for table in ("samples", "rollups"):
+                self.conn.execute(f"DELETE FROM {table} WHERE point_id = ?", (int(point_id),))
+            removed = self.conn.execute("DELETE FROM points WHERE id = ?", (int(point_id),)).rowcount
+        self._last.pop(int(point_id), None)
+        return bool(removed)
+
+    def append(self, samples):
+        """
+        Write [(point_id, ts, value), ...] in one transaction. Values equal to
+        the point's last stored value are skipped until the heartbeat is due.
+        Returns the number of rows written.
+        """
+        rows = []
+        for point_id, ts, value in samples:
+            ts = int(ts)
+            last = self._last.get(point_id)
+            if last is not None and last[1] == value and ts - last[0] < TREND_HEARTBEAT:
+                continue
+            self._last[point_id] = (ts, value)
+            rows.append((point_id, ts, value))
+        if rows:
+            with self._lock, self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def query(self, point_id, start, end, step=None):
+        """
+        Samples for a point in [start, end] (epoch seconds) as [[ts, value], ...].
+
+        With step, raw samples are averaged into step-second buckets. Older
+        ranges that have already been compacted come from the rollups (their
+        bucket averages), so a query can span the whole retention period.
+        """
+        point_id, start, end = int(point_id), int(start), int(end)
+        step = max(1, int(step)) if step else None
+        with self._lock:
+            oldest_raw = self.conn.execute(
+                "SELECT MIN(ts) FROM samples WHERE point_id = ?", (point_id,)
+            ).fetchone()[0]
+            raw_start = start if oldest_raw is None else max(start, oldest_raw)
+            older = []
+            if start < raw_start or oldest_raw is None:
+                rollup_step = max(step or 0, TREND_ROLLUP_SECONDS)
+                older = self.conn.execute(
+                    "SELECT bucket / ? * ?, SUM(avg * count) / SUM(count) FROM rollups "
+                    "WHERE point_id = ? AND bucket > ? AND bucket <= ? AND bucket < ? "
+                    "GROUP BY 1 ORDER BY 1",
+                    (rollup_step, rollup_step, point_id, start - TREND_ROLLUP_SECONDS, end,
+                     raw_start if oldest_raw is not None else end + 1),
+                ).fetchall()
+            if step:
+                recent = self.conn.execute(
+                    "SELECT ts / ? * ?, AVG(value) FROM samples "
+                    "WHERE point_id = ? AND ts >= ? AND ts <= ? GROUP BY 1 ORDER BY 1",
+                    (step, step, point_id, raw_start, end),
+                ).fetchall()
+            else:
+                recent = self.conn.execute(
+                    "SELECT ts, value FROM samples WHERE point_id = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+                    (point_id, raw_start, end),
+                ).fetchall()
+        return [list(row) for row in older + recent]
+
+    def compact(self, now=None):
+        """Roll raw samples past TREND_RAW_DAYS into buckets; drop expired rollups."""
+        now = time.time() if now is None else now
+        # Align to a bucket boundary so no bucket is split between tables
+        raw_cutoff = int(now - TREND_RAW_DAYS * 86400) // TREND_ROLLUP_SECONDS * TREND_ROLLUP_SECONDS
+        rollup_cutoff = int(now - TREND_ROLLUP_DAYS * 86400)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rollups "
+                "SELECT point_id, ts / ? * ?, COUNT(value), MIN(value), MAX(value), AVG(value) "
+                "FROM samples WHERE ts < ? GROUP BY point_id, ts / ?",
+                (TREND_ROLLUP_SECONDS, TREND_ROLLUP_SECONDS, raw_cutoff, TREND_ROLLUP_SECONDS),
+            )
+            moved = self.conn.execute("DELETE FROM samples WHERE ts < ?", (raw_cutoff,)).rowcount
+            expired = self.conn.execute("DELETE FROM rollups WHERE bucket < ?", (rollup_cutoff,)).rowcount
+        return moved, expired
+
+    def stats(self):
+        with self._lock:
+            samples = self.conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+            rollups = self.conn.execute("SELECT COUNT(*) FROM rollups").fetchone()[0]
+        size = sum(
+            os.path.getsize(path) for path in (self.path, self.path + "-wal")
+            if os.path.exists(path)
+        )
+        return {"samples": samples, "rollups": rollups, "bytes": size}
+
+class TrendPoller:
+    """
+    Polls the store's points on a BAC0 stack and appends the samples.
+
+    Each cycle reads the points that are due, grouped by device and property
+    so each device gets APDU-sized ReadPropertyMultiple batches (with the
+    scanner's single-read fallback). The point list is re-read every cycle,
+    so points added or removed through the API apply without a restart.
+    If its BacnetService is replaced (see BacnetServices.on_replace), polling
+    moves to the new service.
+    """
+
+    def __init__(self, store, max_concurrent=None, per_device=None):
+        self.store = store
+        self.max_concurrent = max_concurrent
+        self.per_device = per_device
+        self.service = None
+        self.future = None
+        self.started = None
+        self.cycles = 0
+        self.reads = 0
+        self.samples_written = 0
+        self.errors = 0
+        self.last_cycle = None
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+    def start(self, service):
+        """Run the poll loop on a BacnetService (see bacnet_service)."""
+        if self.running:
+            return
+        self.started = time.time()
+        self.last_error = None
+        self.service = service
+        self.future = service.submit(self._run)
+
+    def stop(self):
+        self.service = None
+        if self.future is not None:
+            self.future.cancel()
+
+    def service_replaced(self, old, new):
+        """Follow our service onto its replacement, or report why polling stopped."""
+        if self.service is not old:
+            return
+        if self.future is not None:
+            self.future.cancel()
+        if new is None:
+            self.service = None
+            self.last_error = "BACnet stack was replaced and the new one failed to start"
+            return
+        print("BACnet stack replaced; restarting trend polling")
+        self.start(new)
+
+    async def _poll(self, bacnet, limiter, points):
+        by_device = {}
+        for point in points:
+            key = (point["device_ip"], point["property"])
+            by_device.setdefault(key, []).append(point)
+
+        async def poll_device(device_ip, prop, device_points):
+            objects = [(p["object_type"], p["object_instance"]) for p in device_points]
+            values = await _read_objects(bacnet, limiter, device_ip, objects, [prop])
+            ts = time.time()
+            samples = []
+            for point, value in zip(device_points, values):
+                value = _numeric(value.get(prop))
+                if value is None:
+                    self.errors += 1
+                else:
+                    samples.append((point["id"], ts, value))
+            return samples
+
+        results = await asyncio.gather(*[
+            poll_device(device_ip, prop, device_points)
+            for (device_ip, prop), device_points in by_device.items()
+        ], return_exceptions=True)
+        samples = []
+        for result in results:
+            if isinstance(result, Exception):
+                self.errors += 1
+                self.last_error = str(result)
+            else:
+                samples.extend(result)
+        self.reads += len(points)
+        return samples
+
+    async def _run(self, bacnet):
+        loop = asyncio.get_running_loop()
+        limiter = ReadLimiter(self.max_concurrent, self.per_device)
+        next_due = {}
+        next_compact = time.monotonic()
+        while True:
+            now = time.monotonic()
+            points = await loop.run_in_executor(None, self.store.points)
+            due = [p for p in points if next_due.get(p["id"], 0) <= now]
+            if due:
+                started = time.monotonic()
+                samples = await self._poll(bacnet, limiter, due)
+                self.samples_written += await loop.run_in_executor(None, self.store.append, samples)
+                for point in due:
+                    next_due[point["id"]] = now + point["interval"]
+                self.cycles += 1
+                self.last_cycle = {
+                    "at": time.time(),
+                    "points": len(due),
+                    "samples": len(samples),
+                    "seconds": round(time.monotonic() - started, 3),
+                }
+            if time.monotonic() >= next_compact:
+                await loop.run_in_executor(None, self.store.compact)
+                next_compact = time.monotonic() + TREND_COMPACT_INTERVAL
+
+            # Sleep until the next point is due, waking at least every second
+            # to pick up newly added points
+            ids = {p["id"] for p in points}
+            upcoming = [t for point_id, t in next_due.items() if point_id in ids]
+            wait = min(upcoming) - time.monotonic() if upcoming else 1.0
+            await asyncio.sleep(min(1.0, max(0.05, wait)))
+
+    def status(self):
+        error = self.last_error
+        if self.future is not None and self.future.done() and not self.future.cancelled():
+            error = str(self.future.exception() or error)
+        return {
+            "running": self.running,
+            "started": self.started,
+            "cycles": self.cycles,
+            "reads": self.reads,
+            "samples_written": self.samples_written,
+            "errors": self.errors,
+            "last_cycle": self.last_cycle,
+            "last_error": error,
+        }
@@ -0,0 +1,115 @@
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from ttl_cache import TTLCache
+
+# Reverse DNS: answers are cached for HOSTNAME_TTL seconds, failures for
+# HOSTNAME_NEGATIVE_TTL; one lookup run never waits longer than
+# HOSTNAME_TIMEOUT seconds in total
+HOSTNAME_TTL = float(os.environ.get("TTT_HOSTNAME_TTL", "600"))
+HOSTNAME_NEGATIVE_TTL = float(os.environ.get("TTT_HOSTNAME_NEGATIVE_TTL", "60"))
+HOSTNAME_TIMEOUT = float(os.environ.get("TTT_HOSTNAME_TIMEOUT", "2"))
+RESOLVER_WORKERS = int(os.environ.get("TTT_RESOLVER_WORKERS", "16"))
+
+# After a failed OUI table load (e.g. the first-run download while offline),
+# lookups retry it at most this often (seconds)
+OUI_RETRY_INTERVAL = float(os.environ.get("TTT_OUI_RETRY_INTERVAL", "300"))
+
+hostname_cache = TTLCache(HOSTNAME_TTL)
+
+# Shared resolver pool; lookups that outlive a run keep going and still land
+# in the cache for the next scan
+_resolver = ThreadPoolExecutor(max_workers=RESOLVER_WORKERS, thread_name_prefix="resolver")
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _reverse_lookup(ip):
+    try:
+        hostname = socket.gethostbyaddr(ip)[0]
+        hostname_cache.set(ip, hostname)
+    except Exception:
+        hostname = ""
+        hostname_cache.set(ip, hostname, HOSTNAME_NEGATIVE_TTL)
+    with _inflight_lock:
+        _inflight.pop(ip, None)
+    return hostname
+
+def resolve_hostnames(ips, timeout=None):
+    """Reverse-resolve IPs concurrently. Returns {ip: hostname or ""}."""
+    timeout = HOSTNAME_TIMEOUT if timeout is None else timeout
+    results = {}
+    futures = {}
+    for ip in set(ips):
+        cached = hostname_cache.get(ip)
+        if cached is not None:
+            results[ip] = cached
+            continue
+        with _inflight_lock:
+            future = _inflight.get(ip)
+            if future is None:
+                future = _inflight[ip] = _resolver.submit(_reverse_lookup, ip)
+        futures[ip] = future
+
+    if futures:
+        wait(futures.values(), timeout=timeout)
+    for ip, future in futures.items():
+        results[ip] = future.result() if future.done() else ""
+    return results
+
+class OuiTable:
+    """
+    MAC prefix -> vendor table, loaded once from mac_vendor_lookup's list.
+    A failed load is retried by a later lookup after OUI_RETRY_INTERVAL.
+    """
+
+    def __init__(self):
+        self.prefixes = None
+        self._retry_after = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.prefixes is not None or time.monotonic() < self._retry_after:
+                return
+            prefixes = {}
+            try:
+                from mac_vendor_lookup import BaseMacLookup, MacLookup
+                path = BaseMacLookup().find_vendors_list()
+                if not path:
+                    # First run: let mac_vendor_lookup download the list
+                    MacLookup().load_vendors()
+                    path = BaseMacLookup().find_vendors_list()
+                if path:
+                    with open(path, "rb") as f:
+                        for line in f.read().splitlines():
+                            prefix, _, vendor = line.partition(b":")
+                            prefixes[prefix.decode("ascii", "ignore").upper()] = vendor.decode("utf8", "replace")
+            except Exception as e:
+                logging.warning("OUI table load failed: %s", e)
+            if not prefixes:
+                logging.warning("No OUI vendor list; retrying in %.0f s", OUI_RETRY_INTERVAL)
+                self._retry_after = time.monotonic() + OUI_RETRY_INTERVAL
+                return
+            self.prefixes = prefixes
+
+    def lookup(self, mac):
+        if self.prefixes is None:
+            self.load()
+            if self.prefixes is None:
+                return ""
+        prefix = mac.replace(":", "").replace("-", "").replace(".", "").upper()[:6]
+        return self.prefixes.get(prefix, "")
+
+oui_table = OuiTable()
+
+def preload_oui_table():
+    """Load the OUI table in the background so the first scan doesn't wait."""
+    threading.Thread(target=oui_table.load, daemon=True).start()
+
+def lookup_vendors(macs):
+    """Returns {mac: vendor or ""}."""
+    return {mac: oui_table.lookup(mac) for mac in set(macs)}
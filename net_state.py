@@ -0,0 +1,130 @@
+import fcntl
+import ipaddress
+import os
+import socket
+import struct
+
+from ttl_cache import TTLCache
+
+# Interface and route state is cached this long (seconds); /network clears
+# the cache whenever it changes the config
+NET_STATE_TTL = float(os.environ.get("TTT_NET_STATE_TTL", "2"))
+
+SYS_CLASS_NET = "/sys/class/net"
+PROC_NET_ROUTE = "/proc/net/route"
+
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891B
+RTF_UP = 0x1
+RTF_GATEWAY = 0x2
+
+_cache = TTLCache(NET_STATE_TTL)
+
+# Run func(*args) through the TTL cache
+def _cached(func, *args):
+    key = (func.__name__,) + args
+    value = _cache.get(key, _cache)
+    if value is _cache:
+        value = func(*args)
+        _cache.set(key, value)
+    return value
+
+def invalidate():
+    """Forget cached interface/route state (call after changing the network)."""
+    _cache.clear()
+
+def _list_interfaces():
+    try:
+        return sorted(name for name in os.listdir(SYS_CLASS_NET) if name != "lo")
+    except OSError:
+        return []
+
+def interfaces():
+    """Names of the network interfaces (loopback excluded)."""
+    return _cached(_list_interfaces)
+
+def _read_operstate(iface):
+    try:
+        with open(os.path.join(SYS_CLASS_NET, iface, "operstate")) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def operstate(iface):
+    """Link state from /sys/class/net ("up", "down", ...), or "" if no such iface."""
+    return _cached(_read_operstate, iface)
+
+def is_up(iface):
+    return operstate(iface) == "up"
+
+# IPv4 address and netmask of iface via ioctl, or None if it has none
+def _read_ipv4(iface):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        req = struct.pack('256s', iface[:15].encode('utf-8'))
+        ip = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, req)[20:24])
+        mask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFNETMASK, req)[20:24])
+    except OSError:
+        return None
+    finally:
+        s.close()
+    return ip, mask
+
+def ipv4(iface):
+    """(ip, netmask) of iface, or None."""
+    return _cached(_read_ipv4, iface)
+
+def iface_ip(iface):
+    """First IPv4 address on iface, or ''."""
+    addr = ipv4(iface)
+    return addr[0] if addr else ""
+
+def iface_cidr(iface):
+    """IPv4 address with prefix length on iface, e.g. 192.168.50.1/24, or ''."""
+    addr = ipv4(iface)
+    if not addr:
+        return ""
+    return str(ipaddress.ip_interface(f"{addr[0]}/{addr[1]}"))
+
+# Default routes from /proc/net/route as [(metric, iface, gateway)], best first
+def _read_default_routes():
+    routes = []
+    try:
+        with open(PROC_NET_ROUTE) as f:
+            next(f, None)  # header
+            for line in f:
+                fields = line.split()
+                if len(fields) < 8 or fields[1] != "00000000":
+                    continue
+                flags = int(fields[3], 16)
+                if not flags & RTF_UP or not flags & RTF_GATEWAY:
+                    continue
+                gateway = socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
+                routes.append((int(fields[6]), fields[0], gateway))
+    except OSError:
+        pass
+    return sorted(routes)
+
+def default_gateway(iface=None):
+    """Gateway of the best default route (optionally only via iface), or ''."""
+    for _, route_iface, gateway in _cached(_read_default_routes):
+        if iface is None or route_iface == iface:
+            return gateway
+    return ""
+
+def default_interface():
+    """Interface of the best default route, or ''."""
+    routes = _cached(_read_default_routes)
+    return routes[0][1] if routes else ""
+
+def interface_for_address(address):
+    """Interface whose IPv4 network contains address, else the default route's, or ''."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return default_interface()
+    for iface in interfaces():
+        cidr = iface_cidr(iface)
+        if cidr and ip in ipaddress.ip_interface(cidr).network:
+            return iface
+    return default_interface()
@@ -0,0 +1,7 @@
+import os
+
+# Scan results, caches and indexes all live here (project-relative, or
+# override via TTT_RESULTS_DIR)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.environ.get("TTT_RESULTS_DIR", os.path.join(BASE_DIR, "results"))
+os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -0,0 +1,285 @@
+import fnmatch
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from results_dir import OUTPUT_DIR
+from scan_checkpoint import CHECKPOINT_SUFFIX
+
+# The index lives next to the result files it describes
+RESULTS_INDEX_PATH = os.environ.get(
+    "TTT_RESULTS_INDEX_PATH", os.path.join(OUTPUT_DIR, "results_index.sqlite3")
+)
+
+# Retention: results are gzipped after RESULTS_COMPRESS_AFTER_DAYS and
+# deleted after RESULTS_KEEP_DAYS; with RESULTS_MAX_MB set, the oldest are
+# also deleted until the results fit. 0 disables a rule.
+RESULTS_COMPRESS_AFTER_DAYS = float(os.environ.get("RESULTS_COMPRESS_AFTER_DAYS", "7"))
+RESULTS_KEEP_DAYS = float(os.environ.get("RESULTS_KEEP_DAYS", "90"))
+RESULTS_MAX_MB = float(os.environ.get("RESULTS_MAX_MB", "0"))
+
+# Result files by name pattern: (kind, format). Files written gzipped keep
+# their .gz name; any other .gz file was compressed by retention.
+RESULT_PATTERNS = [
+    ("bac0_scan_*.csv.gz", "bacnet", "csv"),
+    ("arp_scan_*.csv", "arp", "csv"),
+    ("bac0_scan_*.metrics.json", "bacnet", "metrics"),
+    ("bac0_scan_*.csv", "bacnet", "csv"),
+    ("bac0_scan_*.ndjson", "bacnet", "ndjson"),
+    ("bac0_scan_*.sqlite3", "bacnet", "sqlite"),
+    ("bac0_scan_*.parquet", "bacnet", "parquet"),
+]
+
+# Formats that are already compressed, so retention leaves them as they are
+COMPRESSED_FORMATS = {"parquet"}
+
+# Formats that can be read while a scan is still appending to them
+LIVE_FORMATS = {"csv", "ndjson"}
+
+MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "metrics": "application/json",
+    "sqlite": "application/vnd.sqlite3",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    name TEXT PRIMARY KEY,
+    stored TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    format TEXT NOT NULL,
+    subnet TEXT,
+    created REAL NOT NULL,
+    duration REAL,
+    rows INTEGER,
+    size INTEGER,
+    job_id TEXT,
+    schedule_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_created ON results (created);
+"""
+
+RESULT_FIELDS = [
+    "name", "stored", "kind", "format", "subnet", "created", "duration",
+    "rows", "size", "job_id", "schedule_id",
+]
+
+def _match(name):
+    for pattern, kind, fmt in RESULT_PATTERNS:
+        if fnmatch.fnmatch(name, pattern):
+            return kind, fmt
+    return None
+
+def original_name(name):
+    """Name a result file was written under: stored name less a retention .gz."""
+    name = os.path.basename(name)
+    if name.endswith(".gz") and _match(name) is None:
+        return name[:-3]
+    return name
+
+def result_type(name):
+    """(kind, format) for a result file name, or None if it isn't one."""
+    return _match(original_name(name))
+
+def _gzip_file(path):
+    """Compress path to path.gz (atomically) and remove the original."""
+    tmp = path + ".gz.tmp"
+    with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    shutil.copystat(path, tmp)
+    os.replace(tmp, path + ".gz")
+    os.remove(path)
+    return path + ".gz"
+
+class ResultsIndex:
+    """
+    SQLite index of the scan result files in OUTPUT_DIR.
+
+    Each entry is keyed by the file's original name and records where it is
+    stored now (the name gains .gz once compressed), its kind and format,
+    the subnet or targets scanned, duration and row count. Scans add their
+    files with add(); sync() picks up files written before the index
+    existed. Downloads are looked up here, so only indexed result files can
+    be served.
+    """
+
+    def __init__(self, path=None, output_dir=None):
+        self.path = path or RESULTS_INDEX_PATH
+        self.output_dir = output_dir or OUTPUT_DIR
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _file(self, stored):
+        return os.path.join(self.output_dir, stored)
+
+    def add(self, path, subnet=None, duration=None, rows=None, job_id=None, schedule_id=None):
+        """Index (or re-index) a result file; returns its entry."""
+        name = os.path.basename(path)
+        kind, fmt = result_type(name) or ("other", "")
+        stat = os.stat(path)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (name, stored, kind, format, subnet, created,"
+                " duration, rows, size, job_id, schedule_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, name, kind, fmt, subnet, stat.st_mtime,
+                 None if duration is None else round(duration, 2), rows, stat.st_size,
+                 job_id, schedule_id),
+            )
+        return self.get(name)
+
+    def get(self, name):
+        """Entry for a result by its original (or stored) file name, or None."""
+        name = os.path.basename(name or "")
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(RESULT_FIELDS)} FROM results WHERE name = ? OR stored = ?",
+                (name, name),
+            ).fetchone()
+        return dict(zip(RESULT_FIELDS, row)) if row else None
+
+    def list(self, kind=None, limit=200):
+        """Entries newest first, optionally of one kind."""
+        query = f"SELECT {', '.join(RESULT_FIELDS)} FROM results"
+        args = []
+        if kind:
+            query += " WHERE kind = ?"
+            args.append(kind)
+        query += " ORDER BY created DESC LIMIT ?"
+        args.append(int(limit))
+        with self._lock:
+            rows = self.conn.execute(query, args).fetchall()
+        return [dict(zip(RESULT_FIELDS, row)) for row in rows]
+
+    def sync(self):
+        """Index result files not in the index yet and forget entries whose file is gone."""
+        try:
+            names = os.listdir(self.output_dir)
+        except OSError:
+            return
+        with self._lock:
+            known = dict(self.conn.execute("SELECT stored, name FROM results").fetchall())
+        for name in names:
+            if name in known or name.endswith(".tmp") or result_type(name) is None:
+                continue
+            try:
+                stat = os.stat(self._file(name))
+            except OSError:
+                continue
+            kind, fmt = result_type(name)
+            original = original_name(name)
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO results (name, stored, kind, format, created, size)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (original, name, kind, fmt, stat.st_mtime, stat.st_size),
+                )
+        gone = [stored for stored in known if stored not in names]
+        if gone:
+            with self._lock, self.conn:
+                self.conn.executemany("DELETE FROM results WHERE stored = ?", [(s,) for s in gone])
+
+    def open(self, name):
+        """(entry, binary file object of the original content) for a result; raises KeyError."""
+        entry = self.get(name)
+        if entry is None:
+            raise KeyError(name)
+        path = self._file(entry["stored"])
+        f = gzip.open(path, "rb") if entry["stored"].endswith(".gz") else open(path, "rb")
+        return entry, f
+
+    def file_path(self, name):
+        """Path of the stored file for a result, or None if it isn't indexed."""
+        entry = self.get(name)
+        return self._file(entry["stored"]) if entry else None
+
+    def _in_use(self, entry, active):
+        path = self._file(entry["stored"])
+        if os.path.abspath(path) in active:
+            return True
+        # bac0_scan_X.csv(.gz), .ndjson, .metrics.json, ... -> bac0_scan_X
+        base = entry["name"][:-3] if entry["name"].endswith(".gz") else entry["name"]
+        base = os.path.splitext(base)[0]
+        if entry["format"] == "metrics":
+            base = os.path.splitext(base)[0]
+        return os.path.exists(self._file(base + CHECKPOINT_SUFFIX))
+
+    def _drop(self, entry):
+        try:
+            os.remove(self._file(entry["stored"]))
+        except FileNotFoundError:
+            pass
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM results WHERE name = ?", (entry["name"],))
+
+    def apply_retention(self, active=(), now=None, compress_after_days=None,
+                        keep_days=None, max_mb=None):
+        """
+        Compress and delete results per the retention settings. Files still
+        being written (paths in active) and files of a resumable scan are
+        left alone. Returns {"compressed": n, "deleted": n, "bytes_freed": n}.
+        """
+        now = now or time.time()
+        compress_after = RESULTS_COMPRESS_AFTER_DAYS if compress_after_days is None else compress_after_days
+        keep = RESULTS_KEEP_DAYS if keep_days is None else keep_days
+        max_bytes = (RESULTS_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+        summary = {"compressed": 0, "deleted": 0, "bytes_freed": 0}
+
+        self.sync()
+        entries = []
+        for entry in self.list(limit=-1):
+            if self._in_use(entry, active):
+                continue
+            try:
+                entry["size"] = os.path.getsize(self._file(entry["stored"]))
+            except OSError:
+                continue
+            entries.append(entry)
+        for entry in entries:
+            age_days = (now - entry["created"]) / 86400
+            if keep and age_days > keep:
+                self._drop(entry)
+                summary["deleted"] += 1
+                summary["bytes_freed"] += entry["size"] or 0
+                entry["dropped"] = True
+            elif (compress_after and age_days > compress_after and not entry["stored"].endswith(".gz")
+                  and entry["format"] not in COMPRESSED_FORMATS):
+                stored = _gzip_file(self._file(entry["stored"]))
+                size = os.path.getsize(stored)
+                with self._lock, self.conn:
+                    self.conn.execute(
+                        "UPDATE results SET stored = ?, size = ? WHERE name = ?",
+                        (os.path.basename(stored), size, entry["name"]),
+                    )
+                summary["compressed"] += 1
+                summary["bytes_freed"] += (entry["size"] or 0) - size
+                entry["size"] = size
+
+        if max_bytes:
+            entries = [e for e in entries if not e.get("dropped")]
+            total = sum(e["size"] or 0 for e in self.list(limit=-1))
+            # Oldest first until the results fit
+            for entry in sorted(entries, key=lambda e: e["created"]):
+                if total <= max_bytes:
+                    break
+                self._drop(entry)
+                total -= entry["size"] or 0
+                summary["deleted"] += 1
+                summary["bytes_freed"] += entry["size"] or 0
+        return summary
+
+    def stats(self):
+        with self._lock:
+            count, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"results": count, "bytes": size}
@@ -0,0 +1,143 @@
+import datetime
+import glob
+import json
+import os
+
+from results_dir import OUTPUT_DIR
+
+# Checkpoints live next to the result files they describe
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+
+# The scan CSV among a checkpoint's files (plain or gzipped)
+def checkpoint_csv(files):
+    return files.get("csv") or files.get("csv.gz")
+
+class ScanCheckpoint:
+    """
+    Progress record for a deep scan, saved after every finished device.
+
+    Stores the scan options, the result files being appended to, and for
+    each finished device how many rows it wrote plus the size of each result
+    file at that point. On resume the files are truncated back to the last
+    recorded sizes, so rows from a device that was cut off mid-write are not
+    duplicated. Exports that can't be cut back by size (SQLite, Parquet) are
+    kept separately and left for their writers to handle.
+    """
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self.data = data or {
+            "started": datetime.datetime.now().isoformat(timespec="seconds"),
+            "updated": None,
+            "options": {},
+            "files": {},
+            "exports": {},
+            "sizes": {},
+            "done": {},
+        }
+
+    @classmethod
+    def create(cls, files, options, exports=None):
+        """
+        New checkpoint for appendable result files {"csv": path, "ndjson": path}
+        ("csv.gz" in place of "csv" for a gzipped CSV) and other exports
+        {"sqlite": path, ...}.
+        """
+        base = checkpoint_csv(files)
+        if base.endswith(".gz"):
+            base = base[:-3]
+        checkpoint = cls(os.path.splitext(base)[0] + CHECKPOINT_SUFFIX)
+        checkpoint.data["files"] = dict(files)
+        checkpoint.data["exports"] = dict(exports or {})
+        checkpoint.data["options"] = dict(options)
+        checkpoint.save()
+        return checkpoint
+
+    @classmethod
+    def load(cls, name):
+        """Load a checkpoint by file name (looked up in OUTPUT_DIR)."""
+        path = os.path.join(OUTPUT_DIR, os.path.basename(name))
+        if not path.endswith(CHECKPOINT_SUFFIX):
+            path = os.path.splitext(path)[0] + CHECKPOINT_SUFFIX
+        with open(path) as f:
+            return cls(path, json.load(f))
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def files(self):
+        return self.data["files"]
+
+    @property
+    def exports(self):
+        return self.data.get("exports", {})
+
+    @property
+    def csv_path(self):
+        return checkpoint_csv(self.files)
+
+    @property
+    def options(self):
+        return self.data["options"]
+
+    @property
+    def done_devices(self):
+        return {int(inst) for inst in self.data["done"]}
+
+    @property
+    def row_count(self):
+        return sum(self.data["done"].values())
+
+    def record_sizes(self):
+        """Save the current result file sizes as the point to rewind to."""
+        self.data["sizes"] = {
+            kind: os.path.getsize(path) for kind, path in self.files.items() if os.path.exists(path)
+        }
+        self.save()
+
+    def mark_done(self, device_instance, rows):
+        """Record a finished device after its rows have been flushed."""
+        self.data["done"][str(device_instance)] = rows
+        self.record_sizes()
+
+    def rewind_files(self):
+        """Cut result files back to the last checkpointed sizes."""
+        for kind, path in self.files.items():
+            size = self.data["sizes"].get(kind)
+            if size is not None and os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def save(self):
+        self.data["updated"] = datetime.datetime.now().isoformat(timespec="seconds")
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "started": self.data["started"],
+            "updated": self.data["updated"],
+            "devices_done": len(self.data["done"]),
+            "rows": self.row_count,
+            "csv": os.path.basename(self.csv_path or ""),
+        }
+
+def list_checkpoints():
+    """Summaries of interrupted scans that can be resumed, newest first."""
+    found = []
+    for path in glob.glob(os.path.join(OUTPUT_DIR, "*" + CHECKPOINT_SUFFIX)):
+        try:
+            found.append(ScanCheckpoint.load(path).summary())
+        except (OSError, ValueError) as e:
+            print("Skipping unreadable checkpoint", path, e)
+    found.sort(key=lambda c: c["updated"] or "", reverse=True)
+    return found
@@ -0,0 +1,306 @@
+import csv
+import fnmatch
+import glob
+import gzip
+import hashlib
+import heapq
+import os
+
+from results_dir import OUTPUT_DIR
+
+# Snapshots are the scan CSVs in the results dir
+
+SNAPSHOT_PATTERNS = {"arp": "arp_scan_*.csv", "bacnet": "bac0_scan_*.csv"}
+
+# Most items listed per category; counts always cover everything
+DIFF_MAX_ITEMS = 500
+
+DEVICE_FIELDS = ["device_ip", "network_number", "vendorName", "modelName", "location"]
+POINT_CONFIG_FIELDS = ["objectName", "description", "units"]
+
+def _digest(*values):
+    """8-byte hash of a tuple of CSV values; index keys and row fingerprints."""
+    return hashlib.blake2b("\x1f".join(values).encode("utf-8", "replace"), digest_size=8).digest()
+
+def snapshot_kind(name):
+    name = os.path.basename(name)
+    if name.endswith(".gz"):
+        name = name[:-3]  # compressed by results retention
+    for kind, pattern in SNAPSHOT_PATTERNS.items():
+        if fnmatch.fnmatch(name, pattern):
+            return kind
+    return None
+
+def list_snapshots(kind=None):
+    """Scan CSVs in OUTPUT_DIR, newest first: [{name, kind, size, mtime}]."""
+    found = []
+    for snap_kind, pattern in SNAPSHOT_PATTERNS.items():
+        if kind and snap_kind != kind:
+            continue
+        paths = glob.glob(os.path.join(OUTPUT_DIR, pattern)) + glob.glob(os.path.join(OUTPUT_DIR, pattern + ".gz"))
+        for path in paths:
+            stat = os.stat(path)
+            found.append({
+                "name": os.path.basename(path),
+                "kind": snap_kind,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            })
+    found.sort(key=lambda s: s["mtime"], reverse=True)
+    return found
+
+def snapshot_path(name):
+    """Path of a snapshot by file name; raises ValueError for anything else."""
+    name = os.path.basename(name or "")
+    if snapshot_kind(name) is None:
+        raise ValueError(f"{name or 'snapshot'} is not a scan CSV")
+    path = os.path.join(OUTPUT_DIR, name)
+    if not os.path.exists(path):
+        raise ValueError(f"{name} not found")
+    return path
+
+def _rows(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="", encoding="utf-8", errors="replace") as f:
+        for row in csv.DictReader(f):
+            yield {k: (v or "") for k, v in row.items() if k is not None}
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class _Bucket:
+    """Count of a diff category plus the first (or largest) DIFF_MAX_ITEMS items."""
+
+    def __init__(self, limit, ranked=False):
+        self.limit = limit
+        self.ranked = ranked
+        self.count = 0
+        self.items = []
+        self._seq = 0
+
+    def add(self, item, rank=0.0):
+        self.count += 1
+        if not self.ranked:
+            if len(self.items) < self.limit:
+                self.items.append(item)
+            return
+        # Keep the largest changes: min-heap on rank
+        self._seq += 1
+        entry = (rank, self._seq, item)
+        if len(self.items) < self.limit:
+            heapq.heappush(self.items, entry)
+        elif rank > self.items[0][0]:
+            heapq.heapreplace(self.items, entry)
+
+    def to_dict(self):
+        items = self.items
+        if self.ranked:
+            items = [item for _, _, item in sorted(items, key=lambda e: (-e[0], e[1]))]
+        return {"count": self.count, "items": items, "truncated": self.count > len(items)}
+
+def diff_arp(old_path, new_path, limit=DIFF_MAX_ITEMS):
+    """Hosts added/removed by MAC, MACs that moved IP, IPs now on another MAC."""
+    old_by_mac = {}
+    old_by_ip = {}
+    for row in _rows(old_path):
+        mac = row.get("MAC Address", "").lower()
+        if mac:
+            old_by_mac[mac] = (row.get("IP Address", ""), row.get("Hostname", ""), row.get("Vendor", ""))
+            old_by_ip[row.get("IP Address", "")] = mac
+
+    added, removed = _Bucket(limit), _Bucket(limit)
+    ip_changed, mac_changed, renamed = _Bucket(limit), _Bucket(limit), _Bucket(limit)
+    seen = set()
+    for row in _rows(new_path):
+        mac = row.get("MAC Address", "").lower()
+        ip = row.get("IP Address", "")
+        if not mac:
+            continue
+        seen.add(mac)
+        old = old_by_mac.get(mac)
+        if old is None:
+            added.add({"mac": mac, "ip": ip, "hostname": row.get("Hostname", ""), "vendor": row.get("Vendor", "")})
+        else:
+            if old[0] != ip:
+                ip_changed.add({"mac": mac, "old_ip": old[0], "new_ip": ip})
+            if old[1] != row.get("Hostname", ""):
+                renamed.add({"mac": mac, "ip": ip, "old_hostname": old[1], "new_hostname": row.get("Hostname", "")})
+        old_mac = old_by_ip.get(ip)
+        if old_mac and old_mac != mac:
+            mac_changed.add({"ip": ip, "old_mac": old_mac, "new_mac": mac})
+    for mac, (ip, hostname, vendor) in old_by_mac.items():
+        if mac not in seen:
+            removed.add({"mac": mac, "ip": ip, "hostname": hostname, "vendor": vendor})
+
+    return {
+        "kind": "arp",
+        "hosts": {
+            "added": added.to_dict(),
+            "removed": removed.to_dict(),
+            "ip_changed": ip_changed.to_dict(),
+            "mac_changed": mac_changed.to_dict(),
+            "hostname_changed": renamed.to_dict(),
+        },
+    }
+
+def _point_key(row):
+    return (row.get("device_instance", ""), row.get("object_type", ""), row.get("object_instance", ""))
+
+def diff_bacnet(old_path, new_path, tolerance=0.0, limit=DIFF_MAX_ITEMS):
+    """
+    Devices and points added/removed/changed between two BACnet scan CSVs.
+
+    Points are keyed by (device_instance, object_type, object_instance). The
+    old snapshot is held only as 8-byte key and fingerprint hashes plus the
+    live values, and both files are streamed, so 100k+ row snapshots fit in a
+    few tens of MB. Numeric presentValue changes larger than tolerance are
+    reported as drift, largest first; outOfService changes as flips.
+    """
+    # Pass 1: index the old snapshot
+    old_devices = {}
+    old_points = {}
+    for row in _rows(old_path):
+        inst = row.get("device_instance", "")
+        if inst not in old_devices:
+            old_devices[inst] = _digest(*(row.get(f, "") for f in DEVICE_FIELDS))
+        if row.get("object_type"):
+            old_points[_digest(*_point_key(row))] = (
+                _digest(*(row.get(f, "") for f in POINT_CONFIG_FIELDS)),
+                row.get("presentValue", ""),
+                row.get("outOfService", ""),
+            )
+
+    devices_added, devices_changed = _Bucket(limit), _Bucket(limit)
+    points_added, points_changed = _Bucket(limit), _Bucket(limit)
+    drift, value_changes, oos_flips = _Bucket(limit, ranked=True), _Bucket(limit), _Bucket(limit)
+    changed_devices = set()
+    changed_points = set()
+    new_devices = set()
+    seen_points = set()
+
+    # Pass 2: stream the new snapshot against the index
+    for row in _rows(new_path):
+        inst = row.get("device_instance", "")
+        if inst not in new_devices:
+            new_devices.add(inst)
+            old = old_devices.get(inst)
+            if old is None:
+                devices_added.add({f: row.get(f, "") for f in ["device_instance"] + DEVICE_FIELDS})
+            elif old != _digest(*(row.get(f, "") for f in DEVICE_FIELDS)):
+                changed_devices.add(inst)
+        if not row.get("object_type"):
+            continue
+
+        key = _point_key(row)
+        key_hash = _digest(*key)
+        seen_points.add(key_hash)
+        old = old_points.get(key_hash)
+        point = dict(zip(("device_instance", "object_type", "object_instance"), key))
+        point["objectName"] = row.get("objectName", "")
+        if old is None:
+            points_added.add(dict(point, presentValue=row.get("presentValue", "")))
+            continue
+        config_hash, old_value, old_oos = old
+        if config_hash != _digest(*(row.get(f, "") for f in POINT_CONFIG_FIELDS)):
+            changed_points.add(key_hash)
+        new_value = row.get("presentValue", "")
+        if new_value != old_value:
+            old_num, new_num = _number(old_value), _number(new_value)
+            if old_num is not None and new_num is not None:
+                delta = new_num - old_num
+                if abs(delta) > tolerance:
+                    drift.add(dict(point, old=old_num, new=new_num, delta=round(delta, 6)), abs(delta))
+            else:
+                value_changes.add(dict(point, old=old_value, new=new_value))
+        if row.get("outOfService", "") != old_oos:
+            oos_flips.add(dict(point, old=old_oos, new=row.get("outOfService", "")))
+
+    # Pass 3: re-read the old snapshot for removed items and old field values
+    devices_removed, points_removed = _Bucket(limit), _Bucket(limit)
+    old_device_rows = {}
+    old_point_rows = {}
+    reported = set()
+    for row in _rows(old_path):
+        inst = row.get("device_instance", "")
+        if inst not in reported:
+            reported.add(inst)
+            if inst not in new_devices:
+                devices_removed.add({f: row.get(f, "") for f in ["device_instance"] + DEVICE_FIELDS})
+            elif inst in changed_devices:
+                old_device_rows[inst] = {f: row.get(f, "") for f in DEVICE_FIELDS}
+        if not row.get("object_type"):
+            continue
+        key = _point_key(row)
+        key_hash = _digest(*key)
+        if key_hash not in seen_points:
+            point = dict(zip(("device_instance", "object_type", "object_instance"), key))
+            points_removed.add(dict(point, objectName=row.get("objectName", "")))
+        elif key_hash in changed_points and len(old_point_rows) < limit:
+            old_point_rows[key_hash] = {f: row.get(f, "") for f in POINT_CONFIG_FIELDS}
+
+    # Pass 4 (only when something changed): field-level detail from the new file
+    if old_device_rows or old_point_rows:
+        done = set()
+        for row in _rows(new_path):
+            inst = row.get("device_instance", "")
+            if inst in old_device_rows and inst not in done:
+                done.add(inst)
+                before = old_device_rows[inst]
+                devices_changed.add({
+                    "device_instance": inst,
+                    "changes": {
+                        f: {"old": before[f], "new": row.get(f, "")}
+                        for f in DEVICE_FIELDS if before[f] != row.get(f, "")
+                    },
+                })
+            if not row.get("object_type"):
+                continue
+            key = _point_key(row)
+            before = old_point_rows.pop(_digest(*key), None)
+            if before is not None:
+                point = dict(zip(("device_instance", "object_type", "object_instance"), key))
+                points_changed.add(dict(point, changes={
+                    f: {"old": before[f], "new": row.get(f, "")}
+                    for f in POINT_CONFIG_FIELDS if before[f] != row.get(f, "")
+                }))
+    # Changes past the listing limit still count
+    devices_changed.count = len(changed_devices)
+    points_changed.count = len(changed_points)
+
+    return {
+        "kind": "bacnet",
+        "devices": {
+            "added": devices_added.to_dict(),
+            "removed": devices_removed.to_dict(),
+            "changed": devices_changed.to_dict(),
+        },
+        "points": {
+            "added": points_added.to_dict(),
+            "removed": points_removed.to_dict(),
+            "changed": points_changed.to_dict(),
+            "drift": drift.to_dict(),
+            "value_changes": value_changes.to_dict(),
+            "out_of_service_flips": oos_flips.to_dict(),
+        },
+    }
+
+def diff_snapshots(old_name, new_name, tolerance=0.0, limit=DIFF_MAX_ITEMS):
+    """Compare two snapshots of the same kind by file name. Raises ValueError."""
+    old_path, new_path = snapshot_path(old_name), snapshot_path(new_name)
+    kind = snapshot_kind(old_path)
+    if kind != snapshot_kind(new_path):
+        raise ValueError("Both snapshots must be the same kind of scan")
+    if kind == "arp":
+        result = diff_arp(old_path, new_path, limit)
+    else:
+        result = diff_bacnet(old_path, new_path, tolerance, limit)
+    result.update(old=os.path.basename(old_path), new=os.path.basename(new_path))
+    result["summary"] = {
+        f"{group}_{name}": category["count"]
+        for group in ("hosts", "devices", "points") if group in result
+        for name, category in result[group].items()
+    }
+    return result
@@ -0,0 +1,276 @@
+import asyncio
+import collections
+import concurrent.futures
+import threading
+import time
+import uuid
+
+# Finished jobs kept around for status/result lookups
+MAX_FINISHED_JOBS = 50
+# Recent events kept per job for live listeners, capped by weight: one per
+# event plus one per point row it carries. Older events are dropped.
+MAX_JOB_EVENT_ROWS = 20000
+# Seconds a finished job keeps its events for listeners still catching up
+FINISHED_EVENTS_TTL = 60
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+class ScanJob:
+    """
+    One background scan: status, progress counters and the final result.
+
+    Jobs also keep their recent events (discovery, devices, rows), up to
+    MAX_JOB_EVENT_ROWS rows' worth, for live listeners; see emit() and
+    events_after(). They're dropped FINISHED_EVENTS_TTL seconds after the
+    job finishes.
+    """
+
+    def __init__(self, kind, interface, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        # One interface name, or a list for scans spanning several
+        self.interfaces = sorted(set([interface] if isinstance(interface, str) else interface))
+        self.interface = ", ".join(self.interfaces)
+        self.params = params or {}
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._cancel_callbacks = []
+        self._lock = threading.Lock()
+        # Listeners wait on this for new events, progress or the job ending
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+        self.events = collections.deque()
+        self._event_rows = 0
+        self._last_event_id = 0
+
+    def _touch(self):
+        # Caller holds self._lock
+        self._version += 1
+        self._changed.notify_all()
+
+    def update(self, **counters):
+        """Set progress counters (devices_total, devices_done, objects_done, ...)."""
+        with self._lock:
+            self.progress.update(counters)
+            self._touch()
+
+    def add(self, **counters):
+        """Increment progress counters."""
+        with self._lock:
+            for key, n in counters.items():
+                self.progress[key] = self.progress.get(key, 0) + n
+            self._touch()
+
+    def emit(self, event, data):
+        """Record an event for live listeners; data must be JSON-serializable."""
+        with self._lock:
+            self._last_event_id += 1
+            weight = 1 + len(data.get("points") or ()) if isinstance(data, dict) else 1
+            self.events.append({"id": self._last_event_id, "event": event, "data": data, "weight": weight})
+            self._event_rows += weight
+            while len(self.events) > 1 and self._event_rows > MAX_JOB_EVENT_ROWS:
+                self._event_rows -= self.events.popleft()["weight"]
+            self._touch()
+
+    def drop_events(self):
+        """Free the event log; later listeners are told it was truncated."""
+        with self._lock:
+            self.events.clear()
+            self._event_rows = 0
+            self._touch()
+
+    def set_status(self, status):
+        with self._lock:
+            self.status = status
+            if status == "running":
+                self.started = time.time()
+            elif status not in ("queued", "running") and self.finished is None:
+                self.finished = time.time()
+                timer = threading.Timer(FINISHED_EVENTS_TTL, self.drop_events)
+                timer.daemon = True
+                timer.start()
+            self._touch()
+
+    def events_after(self, last_id, version=None, timeout=None):
+        """
+        Events with ids above last_id. If nothing has changed since version
+        (as returned by an earlier call), first waits up to timeout seconds
+        for a new event, a progress update or the job ending. Returns
+        (events, version, truncated); truncated is True when events after
+        last_id were already dropped.
+        """
+        with self._changed:
+            if version == self._version and self.active:
+                self._changed.wait(timeout)
+            events = [e for e in self.events if e["id"] > last_id]
+            first_kept = self.events[0]["id"] if self.events else self._last_event_id + 1
+            truncated = first_kept > last_id + 1
+            return events, self._version, truncated
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def on_cancel(self, callback):
+        """Call callback() when the job is cancelled (now, if it already is)."""
+        with self._lock:
+            self._cancel_callbacks.append(callback)
+        if self.cancel_event.is_set():
+            callback()
+
+    def cancel(self):
+        self.cancel_event.set()
+        # Async scans are cancelled at their next await
+        with self._lock:
+            callbacks = list(self._cancel_callbacks)
+        for callback in callbacks:
+            callback()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def eta(self):
+        """Seconds left, estimated from the fraction of work done so far."""
+        if self.status != "running" or not self.started:
+            return None
+        done, total = self.fraction()
+        if not done or not total:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed * (total - done) / done, 1)
+
+    def fraction(self):
+        p = self.progress
+        if p.get("devices_total"):
+            return p.get("devices_done", 0), p["devices_total"]
+        if p.get("steps_total"):
+            return p.get("steps_done", 0), p["steps_total"]
+        return 0, 0
+
+    def to_dict(self, include_result=False):
+        with self._lock:
+            progress = dict(self.progress)
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "interface": self.interface,
+            "params": self.params,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "elapsed": round((self.finished or time.time()) - self.started, 1) if self.started else 0,
+            "progress": progress,
+            "eta": self.eta(),
+            "error": self.error,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+class JobManager:
+    """
+    Runs scans in background threads, one running scan per interface.
+
+    A job submitted for a busy interface waits (status "queued") until the
+    running one finishes; a job on several interfaces waits for all of them.
+    The job function receives the ScanJob and may return a coroutine, which
+    is run on the job thread's own event loop.
+    Job functions that hand work to another thread can register a way to
+    stop it with job.on_cancel().
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._iface_locks = {}
+
+    def _iface_lock(self, interface):
+        with self._lock:
+            return self._iface_locks.setdefault(interface, threading.Lock())
+
+    def submit(self, kind, interface, func, params=None):
+        job = ScanJob(kind, interface, params)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        threading.Thread(target=self._run, args=(job, func), daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        """Snapshot of all known jobs, safe to iterate while jobs are submitted."""
+        with self._lock:
+            return list(self.jobs.values())
+
+    def running(self, interface=None):
+        return [
+            job for job in self.list_jobs()
+            if job.active and (interface is None or interface in job.interfaces)
+        ]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job.cancel()
+        return job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if not job.active]
+        finished.sort(key=lambda job: job.created)
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del self.jobs[job.id]
+
+    def _run(self, job, func):
+        # Wait our turn on each interface (in a fixed order, so jobs sharing
+        # interfaces can't deadlock), but stay cancellable
+        held = []
+        for interface in job.interfaces:
+            lock = self._iface_lock(interface)
+            while not lock.acquire(timeout=0.5):
+                if job.cancel_event.is_set():
+                    for lock in held:
+                        lock.release()
+                    job.set_status("cancelled")
+                    return
+            held.append(lock)
+        try:
+            job.check_cancelled()
+            job.set_status("running")
+            result = func(job)
+            if asyncio.iscoroutine(result):
+                result = self._run_coroutine(job, result)
+            job.result = result
+            job.set_status("cancelled" if job.cancel_event.is_set() else "done")
+        except (JobCancelled, asyncio.CancelledError, concurrent.futures.CancelledError):
+            job.set_status("cancelled")
+        except Exception as e:
+            import traceback
+            print(f"Scan job {job.id} ({job.kind}) failed:", e)
+            print(traceback.format_exc())
+            job.error = str(e)
+            job.set_status("failed")
+        finally:
+            for lock in held:
+                lock.release()
+
+    def _run_coroutine(self, job, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            task = loop.create_task(coro)
+            job.on_cancel(lambda: loop.is_closed() or loop.call_soon_threadsafe(task.cancel))
+            return loop.run_until_complete(task)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import threading
+import time
+
+# Latency histogram buckets for the Prometheus endpoint (seconds)
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10]
+
+def _is_timeout(error):
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # BAC0 reports timeouts as NoResponseFromController
+    name = type(error).__name__.lower()
+    return "timeout" in name or "noresponse" in name or "timed out" in str(error).lower()
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list, or None if empty."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def _latency_stats(latencies):
+    latencies = sorted(latencies)
+    p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+    return {
+        "p50": None if p50 is None else round(p50, 4),
+        "p95": None if p95 is None else round(p95, 4),
+    }
+
+class MetricsRegistry:
+    """Process-wide BACnet request counters and latency histogram for /metrics."""
+
+    def __init__(self):
+        self.requests = {}
+        self.errors = {}
+        self.timeouts = 0
+        self.packets = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.last_scan = None
+        self._lock = threading.Lock()
+
+    def record(self, kind, seconds, error=None, timeout=False):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.packets += 1
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            if timeout:
+                self.timeouts += 1
+            elif error is None:
+                i = next((i for i, b in enumerate(LATENCY_BUCKETS) if seconds <= b), len(LATENCY_BUCKETS))
+                self.buckets[i] += 1
+                self.latency_sum += seconds
+                self.latency_count += 1
+
+    def broadcast(self, count=1):
+        with self._lock:
+            self.packets += count
+
+    def render(self):
+        """Prometheus text exposition of the counters and the last scan's figures."""
+        with self._lock:
+            lines = [
+                "# HELP ttt_bacnet_requests_total BACnet confirmed requests sent.",
+                "# TYPE ttt_bacnet_requests_total counter",
+            ]
+            lines += [f'ttt_bacnet_requests_total{{kind="{k}"}} {v}' for k, v in sorted(self.requests.items())]
+            lines += [
+                "# HELP ttt_bacnet_request_errors_total Failed BACnet requests by error class.",
+                "# TYPE ttt_bacnet_request_errors_total counter",
+            ]
+            lines += [f'ttt_bacnet_request_errors_total{{error="{k}"}} {v}' for k, v in sorted(self.errors.items())]
+            lines += [
+                "# HELP ttt_bacnet_request_timeouts_total BACnet requests that timed out.",
+                "# TYPE ttt_bacnet_request_timeouts_total counter",
+                f"ttt_bacnet_request_timeouts_total {self.timeouts}",
+                "# HELP ttt_bacnet_packets_sent_total BACnet requests and Who-Is broadcasts sent.",
+                "# TYPE ttt_bacnet_packets_sent_total counter",
+                f"ttt_bacnet_packets_sent_total {self.packets}",
+                "# HELP ttt_bacnet_request_latency_seconds Response time of answered BACnet requests.",
+                "# TYPE ttt_bacnet_request_latency_seconds histogram",
+            ]
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], self.buckets):
+                cumulative += count
+                lines.append(f'ttt_bacnet_request_latency_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines += [
+                f"ttt_bacnet_request_latency_seconds_sum {self.latency_sum:.6f}",
+                f"ttt_bacnet_request_latency_seconds_count {self.latency_count}",
+            ]
+            last = self.last_scan
+        if last:
+            lines += [
+                "# HELP ttt_bacnet_last_scan_seconds Duration of the last finished BACnet scan.",
+                "# TYPE ttt_bacnet_last_scan_seconds gauge",
+                f"ttt_bacnet_last_scan_seconds {last['elapsed']}",
+                "# HELP ttt_bacnet_last_scan_latency_seconds Response time percentiles per network in the last scan.",
+                "# TYPE ttt_bacnet_last_scan_latency_seconds gauge",
+            ]
+            for net in last["networks"]:
+                for key, quantile in (("p50", "0.5"), ("p95", "0.95")):
+                    if net[key] is not None:
+                        lines.append(
+                            f'ttt_bacnet_last_scan_latency_seconds{{network="{net["network_number"]}",quantile="{quantile}"}} {net[key]}'
+                        )
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class ScanMetrics:
+    """
+    Request counts, timeouts, error classes and response times for one scan,
+    per device and per BACnet network number. ReadLimiter records into it;
+    requests are also counted in the process-wide registry.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.devices = {}
+        self.broadcasts = 0
+        self._lock = threading.Lock()
+
+    def _device(self, device_ip):
+        stats = self.devices.get(device_ip)
+        if stats is None:
+            stats = self.devices[device_ip] = {
+                "device_ip": device_ip,
+                "device_instance": None,
+                "network_number": "",
+                "requests": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "error_classes": {},
+                "latencies": [],
+            }
+        return stats
+
+    def describe(self, device_ip, device_instance, network_number):
+        """Attach instance and network number to a device's stats."""
+        with self._lock:
+            stats = self._device(device_ip)
+            stats["device_instance"] = device_instance
+            stats["network_number"] = str(network_number or "")
+
+    def record(self, device_ip, kind, seconds, error=None):
+        timeout = error is not None and _is_timeout(error)
+        error_class = None if error is None else type(error).__name__
+        with self._lock:
+            stats = self._device(device_ip)
+            stats["requests"] += 1
+            if error_class is not None:
+                stats["errors"] += 1
+                stats["error_classes"][error_class] = stats["error_classes"].get(error_class, 0) + 1
+            if timeout:
+                stats["timeouts"] += 1
+            elif error is None:
+                stats["latencies"].append(seconds)
+        registry.record(kind, seconds, error_class, timeout)
+
+    def broadcast(self, count=1):
+        """Count Who-Is broadcasts sent for this scan."""
+        with self._lock:
+            self.broadcasts += count
+        registry.broadcast(count)
+
+    def finish(self):
+        self.finished = time.time()
+        summary = self.summary()
+        registry.last_scan = summary
+        return summary
+
+    def summary(self):
+        with self._lock:
+            devices = [dict(d, latencies=list(d["latencies"])) for d in self.devices.values()]
+        elapsed = (self.finished or time.time()) - self.started
+        requests = sum(d["requests"] for d in devices)
+        packets = requests + self.broadcasts
+
+        def totals(group):
+            error_classes = {}
+            for d in group:
+                for name, n in d["error_classes"].items():
+                    error_classes[name] = error_classes.get(name, 0) + n
+            return dict(
+                requests=sum(d["requests"] for d in group),
+                errors=sum(d["errors"] for d in group),
+                timeouts=sum(d["timeouts"] for d in group),
+                error_classes=error_classes,
+                **_latency_stats([x for d in group for x in d["latencies"]]),
+            )
+
+        networks = {}
+        for d in devices:
+            networks.setdefault(d["network_number"], []).append(d)
+
+        return dict(
+            started=self.started,
+            elapsed=round(elapsed, 2),
+            packets_sent=packets,
+            packets_per_second=round(packets / elapsed, 1) if elapsed > 0 else 0,
+            **totals(devices),
+            networks=[
+                dict(network_number=net, devices=len(group), **totals(group))
+                for net, group in sorted(networks.items())
+            ],
+            devices=[
+                dict(
+                    {k: v for k, v in d.items() if k != "latencies"},
+                    **_latency_stats(d["latencies"]),
+                )
+                for d in sorted(devices, key=lambda d: d["device_ip"])
+            ],
+        )
+
+    def write_json(self, path):
+        """Write the summary to path (call after finish())."""
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+        return path
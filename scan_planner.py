@@ -0,0 +1,177 @@
+import asyncio
+import ipaddress
+import re
+import threading
+
+from bac0_scan import bacnet_scan_devices, bacnet_quick_scan_devices
+from bacnet_service import BACNET_STARTUP_DELAY, new_stack
+import net_state
+
+DEFAULT_TARGETS = ["eth0"]
+
+def parse_targets(text):
+    """Split a comma/space separated target list ("eth0, 10.2.0.0/16, bbmd:10.9.0.1")."""
+    if isinstance(text, (list, tuple)):
+        return [str(t).strip() for t in text if str(t).strip()]
+    return [t for t in re.split(r"[,\s]+", text or "") if t]
+
+def _parse_bbmd(address, default_port):
+    host, _, port = address.partition(":")
+    ipaddress.ip_address(host)
+    return host, int(port) if port else default_port
+
+def plan_targets(targets, udp_port=47808):
+    """
+    Turn scan targets into one entry per BAC0 stack. Returns (entries, errors).
+
+    A target is an interface name, a CIDR on one of the local interfaces, or
+    "bbmd:<ip>[:<port>]" to register as a foreign device with a remote BBMD
+    and discover the networks behind it. Local targets use the interface's
+    own address and netmask; several CIDRs on one interface share its stack.
+    BBMD stacks bind the next UDP ports above udp_port on the interface that
+    routes to the BBMD, so they can run alongside the local stack.
+    """
+    entries = {}
+    errors = []
+    bbmd_ports = {}
+    for target in parse_targets(targets) or DEFAULT_TARGETS:
+        bbmd = None
+        if target.lower().startswith("bbmd:"):
+            try:
+                host, port = _parse_bbmd(target[5:], udp_port)
+            except ValueError:
+                errors.append(f"{target}: expected bbmd:<ip>[:<port>]")
+                continue
+            bbmd = f"{host}:{port}"
+            iface = net_state.interface_for_address(host)
+        elif target in net_state.interfaces():
+            iface = target
+        else:
+            try:
+                network = ipaddress.ip_network(target, strict=False)
+            except ValueError:
+                errors.append(f"{target}: not an interface, CIDR or bbmd:<ip> target")
+                continue
+            iface = next((
+                name for name in net_state.interfaces()
+                if net_state.iface_cidr(name)
+                and ipaddress.ip_interface(net_state.iface_cidr(name)).network.overlaps(network)
+            ), None)
+            if iface is None:
+                errors.append(f"{target}: not on a local interface; reach routed networks with a bbmd:<ip> target")
+                continue
+
+        cidr = net_state.iface_cidr(iface) if iface else ""
+        if not cidr:
+            errors.append(f"{target}: no IPv4 address on {iface or 'any interface'}")
+            continue
+
+        key = (iface, bbmd)
+        if key in entries:
+            entries[key]["targets"].append(target)
+            continue
+        port = udp_port
+        if bbmd:
+            bbmd_ports[iface] = bbmd_ports.get(iface, 0) + 1
+            port = udp_port + bbmd_ports[iface]
+        entries[key] = {
+            "name": bbmd and f"bbmd {bbmd}" or iface,
+            "targets": [target],
+            "iface": iface,
+            "ip_with_mask": cidr,
+            "udp_port": port,
+            "bbmd": bbmd,
+        }
+    return list(entries.values()), errors
+
+async def _run_entry(entry, scan, bacnet, options, put):
+    owns_stack = bacnet is None
+    if owns_stack:
+        bacnet = new_stack(entry["ip_with_mask"], entry["udp_port"], entry["bbmd"])
+        await asyncio.sleep(BACNET_STARTUP_DELAY)  # Allow BAC0 to initialize
+    try:
+        async for inst, rows in scan(
+            entry["ip_with_mask"], udp_port=entry["udp_port"], bacnet=bacnet,
+            global_broadcast=bool(entry["bbmd"]), **options
+        ):
+            put(entry, inst, rows)
+    finally:
+        if owns_stack:
+            bacnet.disconnect()
+
+async def scan_plan_devices(entries, quick=False, services=None, **options):
+    """
+    Scan every plan entry in parallel and yield (entry, device_instance, rows)
+    as devices finish, merged across networks.
+
+    With a BacnetServices registry each entry runs on its shared stack's own
+    loop; without one, a stack per entry is started on this loop and torn
+    down afterwards. A device seen through more than one network is read
+    only once. Each entry gets "devices", "rows" and "error" filled in.
+    Options are passed to bacnet_scan_devices (or the quick scan).
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    scan = bacnet_quick_scan_devices if quick else bacnet_scan_devices
+    done = object()
+
+    claimed = set(options.pop("skip_devices", None) or ())
+    claimed_lock = threading.Lock()
+
+    def claim(instance):
+        with claimed_lock:
+            if instance in claimed:
+                return False
+            claimed.add(instance)
+            return True
+
+    # Workers may be on other threads' loops; hand results over thread-safely
+    def put(entry, inst, rows):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (entry, inst, rows))
+        except RuntimeError:
+            pass  # consumer already finished and closed its loop
+
+    async def worker(entry, bacnet=None):
+        try:
+            await _run_entry(entry, scan, bacnet, dict(options, claim=claim), put)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"BACnet scan of {entry['name']} failed:", e)
+            entry["error"] = str(e)
+        finally:
+            put(entry, done, None)
+
+    futures = []
+    try:
+        for entry in entries:
+            entry.update(devices=0, rows=0, error=None)
+            if services is None:
+                futures.append(asyncio.ensure_future(worker(entry)))
+                continue
+            try:
+                service = await loop.run_in_executor(
+                    None, services.get, entry["iface"], entry["ip_with_mask"],
+                    entry["udp_port"], entry["bbmd"],
+                )
+                futures.append(service.submit(lambda bacnet, entry=entry: worker(entry, bacnet)))
+            except Exception as e:
+                entry["error"] = str(e)
+                put(entry, done, None)
+
+        remaining = len(entries)
+        while remaining:
+            entry, inst, rows = await queue.get()
+            if inst is done:
+                remaining -= 1
+                continue
+            entry["devices"] += 1
+            entry["rows"] += len(rows)
+            yield entry, inst, rows
+    finally:
+        # Stop the other networks if the consumer gave up early
+        for future in futures:
+            future.cancel()
+        # Workers on this loop must finish unwinding before it closes
+        await asyncio.gather(*[f for f in futures if isinstance(f, asyncio.Future)], return_exceptions=True)
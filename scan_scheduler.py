@@ -0,0 +1,277 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from results_dir import OUTPUT_DIR
+
+# Schedules are stored next to the scan results
+SCHEDULE_PATH = os.environ.get("TTT_SCHEDULE_PATH", os.path.join(OUTPUT_DIR, "scan_schedules.sqlite3"))
+
+# How often the scheduler checks for due scans, and runs maintenance
+# (results retention) at most this often (seconds)
+SCHEDULER_TICK = float(os.environ.get("TTT_SCHEDULER_TICK", "30"))
+MAINTENANCE_INTERVAL = float(os.environ.get("TTT_MAINTENANCE_INTERVAL", "3600"))
+
+SCHEDULE_KINDS = ("arp", "bacnet", "bacnet_quick")
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+# (low, high) for minute, hour, day of month, month, day of week (0/7 = Sunday)
+CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    kind TEXT NOT NULL,
+    cron TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    enabled INTEGER NOT NULL DEFAULT 1,
+    next_run REAL,
+    last_run REAL,
+    last_job TEXT,
+    last_error TEXT,
+    created REAL
+);
+"""
+
+SCHEDULE_FIELDS = [
+    "id", "name", "kind", "cron", "params", "enabled", "next_run",
+    "last_run", "last_job", "last_error", "created",
+]
+
+# Set of allowed values for one cron field ("*", "*/15", "1-5", "0,30", ...)
+def _parse_cron_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"{text} is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSpec:
+    """
+    Five-field cron expression (minute hour day-of-month month day-of-week)
+    or one of @hourly, @daily, @weekly, @monthly, in local time. As in cron,
+    when both day fields are restricted a day matching either one runs.
+    """
+
+    def __init__(self, expr):
+        self.expr = expr.strip()
+        fields = CRON_ALIASES.get(self.expr, self.expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr!r}")
+        try:
+            parsed = [_parse_cron_field(f, lo, hi) for f, (lo, hi) in zip(fields, CRON_RANGES)]
+        except ValueError as e:
+            raise ValueError(f"Bad cron expression {expr!r}: {e}")
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, ts):
+        """Epoch seconds of the first matching minute after ts."""
+        dt = datetime.datetime.fromtimestamp(ts).replace(second=0, microsecond=0)
+        dt += datetime.timedelta(minutes=1)
+        limit = dt + datetime.timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months or not self._day_matches(dt):
+                dt = (dt + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif dt.hour not in self.hours:
+                dt = (dt + datetime.timedelta(hours=1)).replace(minute=0)
+            elif dt.minute not in self.minutes:
+                dt += datetime.timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError(f"Cron expression {self.expr!r} never matches")
+
+class ScanScheduler:
+    """
+    Recurring ARP/BACnet scans from cron-style schedules kept in SQLite.
+
+    submit(kind, params, schedule) starts a scan and returns its job id (or
+    raises ValueError). A background thread checks every SCHEDULER_TICK
+    seconds; each due schedule is claimed by moving its next_run forward in
+    one UPDATE, so the app and a sidecar worker sharing the file never both
+    start the same run. A run missed while nothing was running happens once
+    at the next check. maintenance(), if given, is called every
+    MAINTENANCE_INTERVAL seconds from the same thread.
+    """
+
+    def __init__(self, submit, path=None, maintenance=None):
+        self.submit = submit
+        self.maintenance = maintenance
+        self.path = path or SCHEDULE_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_maintenance = 0
+
+    def _row(self, row):
+        schedule = dict(zip(SCHEDULE_FIELDS, row))
+        schedule["params"] = json.loads(schedule["params"] or "{}")
+        schedule["enabled"] = bool(schedule["enabled"])
+        return schedule
+
+    def schedules(self):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(SCHEDULE_FIELDS)} FROM schedules ORDER BY id"
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def get(self, schedule_id):
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(SCHEDULE_FIELDS)} FROM schedules WHERE id = ?", (int(schedule_id),)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def add(self, kind, cron, params=None, name=None, enabled=True):
+        """New schedule; raises ValueError for an unknown kind or bad cron expression."""
+        if kind not in SCHEDULE_KINDS:
+            raise ValueError(f"Unknown scan type {kind}; expected one of {', '.join(SCHEDULE_KINDS)}")
+        spec = CronSpec(cron)
+        now = time.time()
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO schedules (name, kind, cron, params, enabled, next_run, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name or f"{kind} {spec.expr}", kind, spec.expr, json.dumps(params or {}),
+                 int(bool(enabled)), spec.next_after(now), now),
+            )
+        return self.get(cur.lastrowid)
+
+    def set_enabled(self, schedule_id, enabled):
+        schedule = self.get(schedule_id)
+        if schedule is None:
+            return None
+        next_run = CronSpec(schedule["cron"]).next_after(time.time())
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE schedules SET enabled = ?, next_run = ? WHERE id = ?",
+                (int(bool(enabled)), next_run, int(schedule_id)),
+            )
+        return self.get(schedule_id)
+
+    def remove(self, schedule_id):
+        with self._lock, self.conn:
+            cur = self.conn.execute("DELETE FROM schedules WHERE id = ?", (int(schedule_id),))
+        return cur.rowcount > 0
+
+    def _claim(self, schedule, now):
+        next_run = CronSpec(schedule["cron"]).next_after(now)
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "UPDATE schedules SET next_run = ?, last_run = ? WHERE id = ? AND next_run = ?",
+                (next_run, now, schedule["id"], schedule["next_run"]),
+            )
+        return cur.rowcount == 1
+
+    def run_schedule(self, schedule):
+        """Start one schedule's scan now; records the job id or the error."""
+        job_id, error = None, None
+        try:
+            job_id = self.submit(schedule["kind"], schedule["params"], schedule)
+            print(f"Scheduled {schedule['kind']} scan {schedule['name']!r} started as job {job_id}")
+        except Exception as e:
+            error = str(e)
+            print(f"Scheduled scan {schedule['name']!r} not started:", error)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE schedules SET last_job = ?, last_error = ? WHERE id = ?",
+                (job_id, error, schedule["id"]),
+            )
+        return job_id
+
+    def run_due(self, now=None):
+        """Start every enabled schedule whose time has come; returns the job ids."""
+        now = now or time.time()
+        started = []
+        for schedule in self.schedules():
+            if not schedule["enabled"] or schedule["next_run"] is None or schedule["next_run"] > now:
+                continue
+            if self._claim(schedule, now):
+                job_id = self.run_schedule(schedule)
+                if job_id:
+                    started.append(job_id)
+        return started
+
+    def tick(self):
+        self.run_due()
+        if self.maintenance is not None and time.time() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+            self._last_maintenance = time.time()
+            try:
+                self.maintenance()
+            except Exception as e:
+                print("Scheduled maintenance failed:", e)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print("Scheduler check failed:", e)
+            self._stop.wait(SCHEDULER_TICK)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def run_forever(self):
+        """Run the scheduler in the calling thread (sidecar worker mode)."""
+        try:
+            self._loop()
+        except KeyboardInterrupt:
+            pass
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "tick": SCHEDULER_TICK,
+            "last_maintenance": self._last_maintenance or None,
+            "schedules": self.schedules(),
+        }
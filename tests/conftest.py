@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Keep results, caches and indexes out of the real results dir; modules read
+# TTT_RESULTS_DIR when they're imported
+os.environ.setdefault("TTT_RESULTS_DIR", tempfile.mkdtemp(prefix="ttt-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,119 @@
+import asyncio
+import collections
+
+import pytest
+
+import bac0_scan
+import bacnet_bulk
+import bacnet_cache
+from BAC0.core.io.IOExceptions import NoResponseFromController
+from bacnet_cache import DeviceCache
+from bacnet_sim import SimulatedBacnet
+
+DISCOVER = {"quiet_period": 0.2, "max_wait": 3}
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+    # Each test gets its own device cache and forgets which devices lacked RPM
+    monkeypatch.setattr(bacnet_cache, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(bac0_scan, "_RPM_UNSUPPORTED", set())
+    monkeypatch.setattr(bacnet_bulk, "_WPM_UNSUPPORTED", set())
+
+def scan(sim, **options):
+    return asyncio.run(bac0_scan.bacnet_scan("127.0.0.1/8", bacnet=sim, **DISCOVER, **options))
+
+def rows_per_device(rows):
+    return collections.Counter(row["device_instance"] for row in rows)
+
+def cached_objects():
+    with DeviceCache() as cache:
+        return dict(cache.conn.execute(
+            "SELECT device_instance, COUNT(*) FROM objects GROUP BY device_instance"
+        ))
+
+def test_scan_reads_every_object():
+    sim = SimulatedBacnet(devices=4, objects=40, rpm=0.5, seed=1)
+    rows = scan(sim)
+    # objectList includes the device object itself
+    assert rows_per_device(rows) == {1000 + n: 41 for n in range(4)}
+    names = [(row["device_instance"], row["objectName"]) for row in rows]
+    assert len(set(names)) == len(names)
+
+def test_index_fallback_without_segmentation():
+    # objectList too big for one APDU, read index by index
+    sim = SimulatedBacnet(devices=3, objects=120, segmentation=0.0, seed=2)
+    rows = scan(sim)
+    assert rows_per_device(rows) == {1000 + n: 121 for n in range(3)}
+    assert cached_objects() == {1000 + n: 121 for n in range(3)}
+
+def test_lossy_scan_never_caches_incomplete_devices(monkeypatch):
+    monkeypatch.setattr(bac0_scan, "READ_TIMEOUT_MAX", 0.05)
+    # Long objectLists read index by index, so some entries stay lost
+    sim = SimulatedBacnet(devices=6, objects=300, loss=0.05, segmentation=0.0, seed=3)
+    counts = rows_per_device(scan(sim, incremental=False))
+    assert counts and all(n <= 301 for n in counts.values())
+    cached = cached_objects()
+    assert all(n == 301 for n in cached.values())
+    assert all(counts[instance] == 301 for instance in cached)
+
+class DroppingBacnet(SimulatedBacnet):
+    """Simulator whose objectList index reads (too long to read whole) fail for the given indices, `times` times each."""
+
+    def __init__(self, drop, times, **options):
+        super().__init__(**options)
+        self.drops = {idx: times for idx in drop}
+
+    async def read(self, request, arr_index=None, timeout=10, **kwargs):
+        if request.endswith("objectList") and self.drops.get(arr_index):
+            self.drops[arr_index] -= 1
+            raise NoResponseFromController(f"objectList[{arr_index}] timed out")
+        return await super().read(request, arr_index=arr_index, timeout=timeout, **kwargs)
+
+def test_object_list_index_retried_once():
+    sim = DroppingBacnet(drop=[5, 200], times=1, devices=1, objects=300, segmentation=0.0)
+    assert rows_per_device(scan(sim)) == {1000: 301}
+    assert cached_objects() == {1000: 301}
+
+def test_incomplete_object_list_not_cached():
+    sim = DroppingBacnet(drop=[5, 200], times=2, devices=1, objects=300, segmentation=0.0)
+    assert rows_per_device(scan(sim)) == {1000: 299}
+    assert cached_objects() == {}
+
+def test_incremental_rescan_uses_cache():
+    sim = SimulatedBacnet(devices=3, objects=30, seed=4)
+    first = scan(sim)
+    sim.stats.update(read=0, rpm=0)
+    second = scan(sim)
+    assert rows_per_device(second) == rows_per_device(first)
+    assert sorted(r["objectName"] for r in second) == sorted(r["objectName"] for r in first)
+    # Only databaseRevision plus live values: one RPM per device
+    assert sim.stats["rpm"] == 3
+
+def test_full_rescan_refreshes_cache():
+    sim = SimulatedBacnet(devices=2, objects=20, seed=5)
+    scan(sim, incremental=False)
+    assert cached_objects() == {1000: 21, 1001: 21}
+
+def test_bulk_write_then_read():
+    sim = SimulatedBacnet(devices=2, objects=100, rpm=0.0, seed=6)
+    items, errors = bacnet_bulk.parse_items([
+        {"device_ip": address, "object_type": obj_type, "object_instance": obj_instance,
+         "value": "21.5", "priority": 8}
+        for address, device in sim.devices.items()
+        for obj_type, obj_instance in device.object_list if obj_type == "analogValue"
+    ], need_value=True)
+    assert not errors
+    written = asyncio.run(bacnet_bulk.bulk_write(sim, items))
+    assert written["summary"]["failed"] == 0
+    # Devices without WPM reject one batch each, then write item by item
+    assert sim.stats["wpm"] == 2
+    read = asyncio.run(bacnet_bulk.bulk_read(sim, items))
+    assert {float(r["value"]) for r in read["results"]} == {21.5}
+
+def test_parse_items_rejects_bad_values():
+    items, errors = bacnet_bulk.parse_items([
+        {"device_ip": "10.0.0.1", "object_type": "analogValue", "object_instance": 1, "value": "a b"},
+        {"device_ip": "10.0.0.1", "object_type": "analogValue", "object_instance": 1, "value": "1", "priority": 17},
+    ], need_value=True)
+    assert items == []
+    assert errors == ["Item 1: value can't contain spaces", "Item 2: priority must be 1-16"]